@@ -0,0 +1 @@
+"""Benchmarks de rendimiento de DistriSulpi (se ejecutan con python -m benchmarks.<nombre>)"""
@@ -0,0 +1,53 @@
+"""Compara la búsqueda de productos por recorrido lineal contra el índice de búsqueda.
+
+No usa la base de datos: arma un catálogo sintético en memoria.
+Uso: python -m benchmarks.bench_busqueda [productos]
+"""
+
+import random
+import sys
+import time
+
+from benchmarks.comun import medir, resumen
+from utils.busqueda import IndiceBusqueda
+
+MARCAS = ["ORO", "LA VIRGINIA", "TERRABUSI", "ARCOR", "BAGLEY", "MAROLIO", "CAÑUELAS", "NOEL"]
+TIPOS = ["AGRIDULCE", "CLÁSICO", "CHOCOLATE", "VAINILLA", "LIMÓN", "DULCE DE LECHE", "SALADO", "INTEGRAL"]
+CONSULTAS = ["o", "oro", "ORO AGRI", "x200", "limon", "cañuelas van", "producto 4242", "inexistente"]
+
+
+def generar_catalogo(cantidad):
+    """Catálogo sintético con nombres del estilo del CSV real"""
+    azar = random.Random(42)
+    return [
+        {"id": i, "nombre": f"{azar.randint(1, 99)} {azar.choice(MARCAS)} {azar.choice(TIPOS)} "
+                            f"X{azar.choice([100, 200, 250, 500])}GS. PRODUCTO {i}"}
+        for i in range(1, cantidad + 1)
+    ]
+
+
+def busqueda_lineal(productos, consulta):
+    """Búsqueda anterior de filtrar_productos"""
+    consulta = consulta.lower()
+    return [p for p in productos if consulta in p["nombre"].lower()]
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    productos = generar_catalogo(cantidad)
+
+    inicio = time.perf_counter()
+    indice = IndiceBusqueda(productos)
+    print(f"Índice de {cantidad} productos armado en {time.perf_counter() - inicio:.2f} s")
+
+    for consulta in CONSULTAS:
+        cantidad_lineal = len(busqueda_lineal(productos, consulta))
+        cantidad_indice = len(indice.buscar(consulta))
+        print(f"\n'{consulta}': {cantidad_lineal} resultados lineal, {cantidad_indice} con índice")
+        resumen("  lineal", medir(lambda: busqueda_lineal(productos, consulta), 5))
+        resumen("  índice", medir(lambda: indice.buscar(consulta), 20))
+        resumen("  índice (primeros 50)", medir(lambda: indice.buscar(consulta, limite=50), 20))
+
+
+if __name__ == "__main__":
+    main()
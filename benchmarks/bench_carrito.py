@@ -0,0 +1,70 @@
+"""Compara el pedido en curso como lista contra el Carrito con líneas por producto.
+
+Con la lista, sumar un producto que ya está recorre el pedido, el total se
+vuelve a sumar y la tabla se redibuja entera; con el Carrito se busca por
+producto_id, el total se lleva al día y se modifica una sola fila.
+No usa la base ni abre una página: arma los controles de Flet en memoria.
+Uso: python -m benchmarks.bench_carrito [líneas]
+"""
+
+import random
+import sys
+
+import flet as ft
+
+from benchmarks.comun import medir, resumen
+from utils.carrito import Carrito
+
+
+def fila(item):
+    """Fila de escritorio como la de la tabla del pedido"""
+    return ft.DataRow(cells=[
+        ft.DataCell(ft.Text(item["producto_nombre"])),
+        ft.DataCell(ft.TextField(value=str(item["cantidad"]), width=60)),
+        ft.DataCell(ft.Text(f"${item['precio_unitario']:.2f}")),
+        ft.DataCell(ft.Text(f"${item['subtotal']:.2f}")),
+        ft.DataCell(ft.IconButton(icon=ft.Icons.DELETE))
+    ])
+
+
+def main():
+    lineas = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    azar = random.Random(42)
+    productos = [(i, f"PRODUCTO {i}", azar.randint(500, 9000) / 100) for i in range(1, lineas + 1)]
+    repetidos = [azar.randint(1, lineas) for _ in range(200)]
+
+    lista = [{"producto_id": i, "producto_nombre": nombre, "cantidad": 1,
+              "precio_unitario": precio, "subtotal": precio} for i, nombre, precio in productos]
+    carrito = Carrito()
+    for i, nombre, precio in productos:
+        carrito.agregar(i, nombre, 1, precio)
+    filas = {item["producto_id"]: fila(item) for item in carrito}
+
+    def sumar_en_lista():
+        for producto_id in repetidos:
+            for item in lista:
+                if item["producto_id"] == producto_id:
+                    item["cantidad"] += 1
+                    item["subtotal"] = item["cantidad"] * item["precio_unitario"]
+                    break
+            sum(item["subtotal"] for item in lista)
+
+    def sumar_en_carrito():
+        for producto_id in repetidos:
+            carrito.agregar(producto_id, "", 1, 0)
+            carrito.total
+
+    print(f"Sumar cantidad a 200 productos ya cargados, pedido de {lineas} líneas:")
+    resumen("  lista (recorrer + sumar)", medir(sumar_en_lista, 20))
+    resumen("  Carrito", medir(sumar_en_carrito, 20))
+
+    producto_id = repetidos[0]
+    print(f"\nActualizar la tabla después de un cambio, pedido de {lineas} líneas:")
+    resumen("  redibujar todas las filas", medir(lambda: [fila(item) for item in lista], 10))
+    resumen("  modificar una fila", medir(
+        lambda: setattr(filas[producto_id].cells[3].content, "value",
+                        f"${carrito.obtener(producto_id)['subtotal']:.2f}"), 10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compara el catálogo como lista de dicts con Decimal contra los registros Producto.
+
+No usa la base de datos: arma filas sintéticas como las que devuelve
+cursor(dictionary=True) y mide memoria y tiempos de los usos habituales.
+Uso: python -m benchmarks.bench_catalogo [productos]
+"""
+
+import random
+import sys
+import tracemalloc
+from decimal import Decimal
+
+from benchmarks.comun import medir, resumen
+from utils.catalogo import CatalogoCache, Producto
+
+MARCAS = ["ORO", "LA VIRGINIA", "TERRABUSI", "ARCOR", "BAGLEY", "MAROLIO", "CAÑUELAS", "NOEL"]
+
+
+def generar_filas(cantidad):
+    """Filas como las de SELECT id, nombre, precio_venta, costo, stock, codigo FROM productos"""
+    azar = random.Random(42)
+    return [
+        {
+            "id": i,
+            "nombre": f"{azar.choice(MARCAS)} X{azar.choice([100, 200, 500])}GS. PRODUCTO {i}",
+            "precio_venta": Decimal(azar.randint(5000, 90000)) / 100,
+            "costo": Decimal(azar.randint(4000, 80000)) / 100,
+            "stock": azar.randint(0, 500),
+            "codigo": None
+        }
+        for i in range(1, cantidad + 1)
+    ]
+
+
+def memoria(armar):
+    """Memoria (MB) que queda ocupada por lo que devuelve armar()"""
+    tracemalloc.start()
+    resultado = armar()
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, actual / 1024 / 1024
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    # Cada forma se mide desde filas nuevas, así la memoria no incluye la de la otra
+    filas, mb_dicts = memoria(lambda: generar_filas(cantidad))
+    por_id_dicts = {fila["id"]: fila for fila in filas}
+
+    productos, mb_registros = memoria(lambda: [Producto.desde_fila(fila) for fila in generar_filas(cantidad)])
+    catalogo = CatalogoCache(lambda: filas)
+    catalogo.refrescar()
+
+    print(f"Memoria de {cantidad} productos: dicts con Decimal {mb_dicts:.1f} MB, registros Producto {mb_registros:.1f} MB")
+
+    ids = random.Random(7).sample(range(1, cantidad + 1), min(cantidad, 1000))
+
+    print("\nPrecio de 1000 productos por id (como al agregar al carrito):")
+    resumen("  dicts", medir(lambda: [float(por_id_dicts[i]["precio_venta"]) for i in ids], 50))
+    resumen("  registros", medir(lambda: [catalogo.obtener(i).precio_venta for i in ids], 50))
+
+    print("\nValor del stock de todo el catálogo:")
+    resumen("  dicts", medir(lambda: sum(float(f["precio_venta"]) * f["stock"] for f in filas), 5))
+    resumen("  registros", medir(lambda: sum(p.precio_centavos * p.stock for p in productos) / 100, 5))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compara la latencia de confirmar un pedido línea por línea contra la versión en bloque.
+
+Cada medición se hace dentro de una transacción que luego se revierte, así que
+la base no cambia. Uso: python -m benchmarks.bench_guardar_pedido [repeticiones]
+"""
+
+import datetime
+import sys
+
+from benchmarks.comun import backend_desde_entorno, medir, resumen
+from database.migrations import esquema_actualizado, migrar
+from database.pedidos import agrupar_cantidades, insertar_detalles, reservar_stock
+
+
+def armar_detalles(ids, lineas):
+    """Arma un pedido de N líneas repitiendo productos si no alcanzan"""
+    detalles = []
+    for i in range(lineas):
+        detalles.append({
+            "producto_id": ids[i % len(ids)],
+            "cantidad": 1,
+            "precio_unitario": 100.0,
+            "subtotal": 100.0
+        })
+    return detalles
+
+
+def insertar_pedido(cursor, detalles):
+    cursor.execute(
+        "INSERT INTO pedidos (cliente, zona, fecha, total) VALUES (%s, %s, %s, %s)",
+        ("benchmark", "Bernal", datetime.datetime.now(), sum(d["subtotal"] for d in detalles))
+    )
+    return cursor.lastrowid
+
+
+def guardar_linea_por_linea(conn, detalles):
+    cursor = conn.cursor()
+    pedido_id = insertar_pedido(cursor, detalles)
+    for item in detalles:
+        cursor.execute(
+            """INSERT INTO detalle_pedido 
+            (pedido_id, producto_id, cantidad, precio_unitario, subtotal) 
+            VALUES (%s, %s, %s, %s, %s)""",
+            (pedido_id, item["producto_id"], item["cantidad"], item["precio_unitario"], item["subtotal"])
+        )
+        cursor.execute(
+            "UPDATE productos SET stock = stock - %s WHERE id = %s",
+            (item["cantidad"], item["producto_id"])
+        )
+    cursor.close()
+    conn.rollback()
+
+
+def guardar_en_bloque(conn, detalles):
+    cursor = conn.cursor()
+    pedido_id = insertar_pedido(cursor, detalles)
+    reservar_stock(cursor, agrupar_cantidades(detalles))
+    insertar_detalles(cursor, pedido_id, detalles)
+    cursor.close()
+    conn.rollback()
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    backend = backend_desde_entorno()
+    conn = backend.conectar()
+    # En una base nueva las tablas todavía no existen
+    if not esquema_actualizado(conn):
+        migrar(conn, backend.base)
+    cursor = conn.cursor()
+    cursor.execute("SELECT id FROM productos ORDER BY id LIMIT 500")
+    ids = [fila[0] for fila in cursor.fetchall()]
+    cursor.close()
+    if not ids:
+        print("La tabla productos está vacía; cargue un CSV antes de medir")
+        return
+
+    for lineas in (5, 50, 500):
+        detalles = armar_detalles(ids, lineas)
+        resumen(f"{lineas} líneas, línea por línea", medir(lambda: guardar_linea_por_linea(conn, detalles), repeticiones))
+        resumen(f"{lineas} líneas, en bloque", medir(lambda: guardar_en_bloque(conn, detalles), repeticiones))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compara la importación de productos fila por fila contra la importación masiva.
+
+Trabaja sobre una tabla de prueba (bench_productos) que se crea y se borra al
+final, así que no toca el catálogo real.
+Uso: python -m benchmarks.bench_importacion [filas]
+"""
+
+import sys
+import time
+
+import pandas as pd
+
+from benchmarks.comun import backend_desde_entorno
+from database.backends import dialecto, tipo_id
+from database.importacion import importar_productos
+
+TABLA = "bench_productos"
+
+
+def generar_catalogo(filas, desplazamiento=0):
+    """Arma un catálogo sintético con nombres del estilo del CSV real"""
+    return pd.DataFrame({
+        "nombre": [f"PRODUCTO {i} X{200 + i % 50}GS." for i in range(filas)],
+        "precio_venta": [650.0 + (i + desplazamiento) % 100 for i in range(filas)],
+        "costo": [585.0 + i % 80 for i in range(filas)],
+        "stock": [100 + i % 30 for i in range(filas)],
+    })
+
+
+def importar_fila_por_fila(conn, df):
+    if dialecto(conn) == "sqlite":
+        conflicto = """ON CONFLICT(nombre) DO UPDATE SET
+            precio_venta = excluded.precio_venta,
+            costo = excluded.costo,
+            stock = excluded.stock"""
+    else:
+        conflicto = """ON DUPLICATE KEY UPDATE
+            precio_venta = VALUES(precio_venta),
+            costo = VALUES(costo),
+            stock = VALUES(stock)"""
+    cursor = conn.cursor()
+    for _, row in df.iterrows():
+        cursor.execute(
+            f"""INSERT INTO {TABLA} (nombre, precio_venta, costo, stock) 
+            VALUES (%s, %s, %s, %s) 
+            {conflicto}""",
+            (row["nombre"], float(row["precio_venta"]), float(row["costo"]), int(row["stock"]))
+        )
+    conn.commit()
+    cursor.close()
+
+
+def recrear_tabla(conn):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+    cursor.execute(f"""
+    CREATE TABLE {TABLA} (
+        id {tipo_id(conn)},
+        nombre VARCHAR(255) NOT NULL UNIQUE,
+        precio_venta DECIMAL(10, 2) NOT NULL,
+        costo DECIMAL(10, 2) NOT NULL,
+        stock INT NOT NULL,
+        codigo VARCHAR(50) NULL UNIQUE
+    )
+    """)
+    conn.commit()
+    cursor.close()
+
+
+def cronometrar(nombre, funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    print(f"{nombre:<45} {time.perf_counter() - inicio:8.2f} s")
+    return resultado
+
+
+def main():
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    conn = backend_desde_entorno().conectar()
+    df = generar_catalogo(filas)
+
+    recrear_tabla(conn)
+    cronometrar(f"fila por fila ({filas} filas nuevas)", lambda: importar_fila_por_fila(conn, df))
+
+    recrear_tabla(conn)
+    print(cronometrar(f"masiva ({filas} filas nuevas)", lambda: importar_productos(conn, df, tabla=TABLA)))
+
+    # Segunda pasada con precios modificados: mezcla de actualizados y sin cambios
+    print(cronometrar(f"masiva ({filas} filas existentes)",
+                      lambda: importar_productos(conn, generar_catalogo(filas, 7), tabla=TABLA)))
+
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {TABLA}")
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compara la latencia de abrir una conexión por llamada contra tomarla del pool.
+
+Uso: python -m benchmarks.bench_pool [repeticiones]
+"""
+
+import sys
+
+from benchmarks.comun import backend_desde_entorno, medir, resumen
+from database.config import DB_POOL_CONFIG
+from database.db_connection import PoolConexiones
+
+
+def consulta_con_conexion_nueva(backend):
+    conn = backend.conectar()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def consulta_con_pool(pool):
+    conn = pool.obtener()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    cursor.fetchall()
+    cursor.close()
+    conn.close()
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    backend = backend_desde_entorno()
+    # El pool configurado igual que en la aplicación
+    pool = PoolConexiones(backend.conectar, **DB_POOL_CONFIG)
+
+    # Calentar el pool para medir solo el préstamo
+    consulta_con_pool(pool)
+
+    resumen("conectar() por llamada", medir(lambda: consulta_con_conexion_nueva(backend), repeticiones))
+    resumen("pool.obtener()", medir(lambda: consulta_con_pool(pool), repeticiones))
+    print(f"Estadísticas del pool: {pool.estadisticas}")
+    pool.cerrar()
+
+
+if __name__ == "__main__":
+    main()
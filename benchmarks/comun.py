@@ -0,0 +1,32 @@
+"""Utilidades compartidas por los benchmarks"""
+
+import statistics
+import time
+
+from database.backends import crear_backend
+from database.config import DB_CONFIG, DB_BACKEND, DB_SQLITE_PATH
+
+
+def backend_desde_entorno():
+    """El mismo motor y la misma base que usa la aplicación (ver database/config.py)"""
+    backend = crear_backend(DB_BACKEND, DB_CONFIG, DB_SQLITE_PATH)
+    backend.crear_base()
+    return backend
+
+
+def medir(funcion, repeticiones):
+    """Ejecuta la función varias veces y devuelve las duraciones en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return tiempos
+
+
+def resumen(nombre, tiempos):
+    """Imprime media, mediana y p95 de una serie de tiempos"""
+    ordenados = sorted(tiempos)
+    p95 = ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))]
+    print(f"{nombre:<40} media={statistics.mean(tiempos):8.3f} ms  "
+          f"mediana={statistics.median(tiempos):8.3f} ms  p95={p95:8.3f} ms")
@@ -0,0 +1,126 @@
+"""Verifica sobre SQLite que las consultas por fecha recorran idx_pedidos_fecha por rango.
+
+Crea una base temporal, aplica las migraciones y carga pedidos repartidos en
+varios años; con las estadísticas de ANALYZE el plan elegido de cada consulta
+por fecha tiene que ser SEARCH ... USING INDEX idx_pedidos_fecha. Después
+arma casos en los que el plan elegido no usa el índice (un join que parte de
+detalle_pedido, una tabla de dos filas) y comprueba que la verificación lo siga
+viendo como utilizable; y sin el índice, que lo informe como no utilizable.
+
+Termina con código 1 si algún plan falla. No usa el servidor MySQL ni la base
+de la aplicación. Uso: python -m benchmarks.planes_fecha [pedidos]
+"""
+
+import datetime
+import os
+import random
+import sys
+import tempfile
+
+from database.backends import BackendSQLite
+from database.indices import explicar_filtros_fecha
+from database.migrations import migrar
+
+
+def cargar_pedidos(conn, cantidad):
+    """Inserta pedidos con fechas al azar entre hace tres años y hoy"""
+    hoy = datetime.datetime.now()
+    filas = [
+        (f"cliente {i % 500}", "Bernal", hoy - datetime.timedelta(minutes=random.randrange(3 * 365 * 24 * 60)), 100)
+        for i in range(cantidad)
+    ]
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO pedidos (cliente, zona, fecha, total) VALUES (%s, %s, %s, %s)", filas)
+    cursor.execute("ANALYZE")
+    cursor.close()
+    conn.commit()
+
+
+def una_linea(conn):
+    """Mil pedidos del mismo día y una sola línea de detalle: el join parte de detalle_pedido.
+
+    El plan elegido llega a pedidos por su clave primaria, sin idx_pedidos_fecha,
+    y aun así la consulta tiene que verse como capaz de usar el índice.
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM pedidos")
+    cursor.executemany("INSERT INTO pedidos (cliente, zona, fecha, total) VALUES (%s, %s, %s, %s)",
+                       [("cliente", "Bernal", datetime.datetime.now(), 100)] * 1000)
+    cursor.execute("INSERT INTO productos (nombre, precio_venta, costo, stock) VALUES ('producto', 100, 50, 10)")
+    producto_id = cursor.lastrowid
+    cursor.execute("SELECT MIN(id) FROM pedidos")
+    cursor.execute(
+        "INSERT INTO detalle_pedido (pedido_id, producto_id, cantidad, precio_unitario, subtotal) "
+        "VALUES (%s, %s, 1, 100, 100)",
+        (cursor.fetchone()[0], producto_id)
+    )
+    cursor.execute("ANALYZE")
+    cursor.close()
+    conn.commit()
+
+
+def achicar_pedidos(conn):
+    """Deja dos pedidos del mismo día; con esas estadísticas SQLite prefiere recorrer la tabla"""
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM detalle_pedido")
+    cursor.execute("DELETE FROM pedidos WHERE id NOT IN (SELECT id FROM pedidos ORDER BY id LIMIT 2)")
+    cursor.execute("UPDATE pedidos SET fecha = %s", (datetime.datetime(2020, 1, 1),))
+    cursor.execute("ANALYZE")
+    cursor.close()
+    conn.commit()
+
+
+def borrar_indice(conn):
+    cursor = conn.cursor()
+    cursor.execute("DROP INDEX idx_pedidos_fecha")
+    cursor.close()
+    conn.commit()
+
+
+def explicar(backend, preparar, titulo):
+    """Prepara la base y muestra los planes con una conexión nueva.
+
+    SQLite guarda los EXPLAIN ya preparados de cada conexión y no siempre los
+    vuelve a planificar después de un ANALYZE o un DROP INDEX.
+    """
+    conn = backend.conectar()
+    try:
+        preparar(conn)
+    finally:
+        conn.close()
+    conn = backend.conectar()
+    try:
+        planes = explicar_filtros_fecha(conn)
+    finally:
+        conn.close()
+    print(titulo)
+    for nombre, acceso, indice, usa_indice, utilizable in planes:
+        print(f"  {nombre:<22} acceso={acceso:<6} índice={indice} usa={usa_indice} utilizable={utilizable}")
+    return planes
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as directorio:
+        backend = BackendSQLite(os.path.join(directorio, "planes.db"))
+
+        def migrar_y_cargar(conn):
+            migrar(conn, backend.base)
+            cargar_pedidos(conn, cantidad)
+
+        con_datos = explicar(backend, migrar_y_cargar, f"Con {cantidad} pedidos:")
+        join_sin_indice = explicar(backend, una_linea, "Con mil pedidos y una línea:")
+        tabla_chica = explicar(backend, achicar_pedidos, "Con dos pedidos:")
+        sin_indice = explicar(backend, borrar_indice, "Sin idx_pedidos_fecha:")
+
+    ganancia = next(plan for plan in join_sin_indice if plan[0] == "ganancia del año")
+    correcto = (all(usa_indice for *_, usa_indice, _ in con_datos)
+                and not ganancia[3] and ganancia[4]
+                and all(utilizable for *_, utilizable in tabla_chica)
+                and not any(utilizable for *_, utilizable in sin_indice))
+    print("OK" if correcto else "FALLA: alguna consulta por fecha no usa idx_pedidos_fecha")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Prueba de carga: varias sesiones guardan y editan pedidos a la vez sobre los mismos productos.
+
+Cada sesión arma pedidos con los productos en orden al azar (el caso que
+provocaba interbloqueos) y cada tanto edita uno de sus pedidos. Al final el
+stock de cada producto tiene que ser exactamente el inicial menos lo que suman
+sus líneas en detalle_pedido, nunca negativo, y el total de cada pedido la suma
+de sus líneas. Informa los reintentos por bloqueos y termina con código 1 si
+algo no cierra.
+
+Sin DB_BACKEND en el entorno usa un archivo SQLite temporal. Con DB_BACKEND
+usa esa base (mejor una de prueba): crea sus propios productos y los borra al
+terminar, junto con los pedidos de esta corrida (por id, no por cliente).
+Uso: python -m benchmarks.stress_pedidos [sesiones] [pedidos por sesión]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+PRODUCTOS = 10
+CLIENTE = "stress"
+
+
+def main():
+    sesiones = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    pedidos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    directorio = tempfile.mkdtemp(prefix="stress_pedidos_")
+    base_propia = "DB_BACKEND" not in os.environ
+    if base_propia:
+        os.environ["DB_BACKEND"] = "sqlite"
+        os.environ["DB_SQLITE_PATH"] = os.path.join(directorio, "stress.db")
+    os.environ.setdefault("ORDER_OUTBOX_PATH", os.path.join(directorio, "bandeja.db"))
+    os.environ["CATALOG_SNAPSHOT_PATH"] = ""
+
+    # main lee la configuración del entorno al importarse
+    from main import DistriSulpiApp
+    from database.pedidos import StockInsuficienteError
+
+    app = DistriSulpiApp.instancia()
+    if not app.initialize_database():
+        sys.exit(1)
+
+    # Stock para cubrir más o menos la mitad de la demanda: los últimos pedidos se rechazan
+    stock_inicial = sesiones * pedidos // 2
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    ids = []
+    for i in range(PRODUCTOS):
+        cursor.execute(
+            "INSERT INTO productos (nombre, precio_venta, costo, stock) VALUES (%s, %s, %s, %s)",
+            (f"STRESS {uuid.uuid4().hex[:8]} {i}", 10 + i, 5, stock_inicial)
+        )
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    resultados = {"guardados": 0, "sin_stock": 0, "editados": 0, "edicion_sin_stock": 0, "errores": 0}
+    # Ids de los pedidos de esta corrida: la verificación y la limpieza no tocan otros pedidos
+    pedidos_corrida = []
+    lock = threading.Lock()
+    largada = threading.Barrier(sesiones)
+
+    def contar(clave):
+        with lock:
+            resultados[clave] += 1
+
+    def editar(azar, pedido_id):
+        conn = app.get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(
+            "SELECT id, producto_id, cantidad, precio_unitario, subtotal FROM detalle_pedido WHERE pedido_id = %s",
+            (pedido_id,)
+        )
+        lineas = [dict(fila) for fila in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+        if len(lineas) > 1 and azar.random() < 0.3:
+            lineas.pop(azar.randrange(len(lineas)))
+        for linea in lineas:
+            linea["cantidad"] = max(1, linea["cantidad"] + azar.choice((-1, 1, 2)))
+            linea["subtotal"] = linea["cantidad"] * float(linea["precio_unitario"])
+        app.guardar_cambios_pedido(pedido_id, lineas)
+
+    def sesion(numero):
+        azar = random.Random(numero)
+        propios = []
+        largada.wait()
+        for k in range(pedidos):
+            try:
+                if propios and k % 5 == 4:
+                    try:
+                        editar(azar, azar.choice(propios))
+                        contar("editados")
+                    except StockInsuficienteError:
+                        contar("edicion_sin_stock")
+                    continue
+                # Productos en orden al azar: dos sesiones suelen pedirlos en orden opuesto
+                detalles = []
+                for producto_id in azar.sample(ids, azar.randint(2, 5)):
+                    cantidad = azar.randint(1, 3)
+                    detalles.append({"producto_id": producto_id, "cantidad": cantidad,
+                                     "precio_unitario": 10.0, "subtotal": 10.0 * cantidad})
+                try:
+                    pedido_id = app.guardar_pedido(CLIENTE, "Bernal", detalles, clave=str(uuid.uuid4()))
+                except StockInsuficienteError:
+                    contar("sin_stock")
+                    continue
+                if pedido_id:
+                    propios.append(pedido_id)
+                    with lock:
+                        pedidos_corrida.append(pedido_id)
+                    contar("guardados")
+                else:
+                    contar("errores")
+            except Exception as e:
+                print(f"Sesión {numero}: {e}")
+                contar("errores")
+
+    hilos = [threading.Thread(target=sesion, args=(n,)) for n in range(sesiones)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    marcadores = ", ".join(["%s"] * len(ids))
+    cursor.execute(f"SELECT id, stock FROM productos WHERE id IN ({marcadores})", ids)
+    stock = dict(cursor.fetchall())
+    cursor.execute(
+        f"SELECT producto_id, SUM(cantidad) FROM detalle_pedido WHERE producto_id IN ({marcadores}) GROUP BY producto_id",
+        ids
+    )
+    vendido = dict(cursor.fetchall())
+    totales_distintos = []
+    marcadores_pedidos = ", ".join(["%s"] * len(pedidos_corrida))
+    if pedidos_corrida:
+        cursor.execute(
+            f"""SELECT p.id, p.total, COALESCE(SUM(d.subtotal), 0)
+            FROM pedidos p LEFT JOIN detalle_pedido d ON d.pedido_id = p.id
+            WHERE p.id IN ({marcadores_pedidos}) GROUP BY p.id, p.total""",
+            pedidos_corrida
+        )
+        totales_distintos = [fila[0] for fila in cursor.fetchall()
+                             if round(float(fila[1]), 2) != round(float(fila[2]), 2)]
+
+    errores = []
+    for producto_id in ids:
+        esperado = stock_inicial - int(vendido.get(producto_id, 0))
+        if stock[producto_id] != esperado:
+            errores.append(f"producto {producto_id}: stock {stock[producto_id]}, esperado {esperado}")
+        if stock[producto_id] < 0:
+            errores.append(f"producto {producto_id}: stock negativo ({stock[producto_id]})")
+    if totales_distintos:
+        errores.append(f"pedidos con total distinto de sus líneas: {totales_distintos[:10]}")
+    if resultados["errores"]:
+        errores.append(f"{resultados['errores']} operaciones fallaron")
+
+    operaciones = sum(resultados.values())
+    print(f"{sesiones} sesiones x {pedidos} operaciones en {duracion:.2f} s ({operaciones / duracion:.0f} op/s)")
+    print("  " + ", ".join(f"{clave}={valor}" for clave, valor in resultados.items()))
+    print(f"  reintentos por bloqueos: {app.reintentos.estadisticas}")
+    print(f"  stock final: {[stock[i] for i in ids]} (inicial {stock_inicial})")
+
+    if not base_propia:
+        if pedidos_corrida:
+            cursor.execute(f"DELETE FROM detalle_pedido WHERE pedido_id IN ({marcadores_pedidos})", pedidos_corrida)
+            cursor.execute(f"DELETE FROM pedidos WHERE id IN ({marcadores_pedidos})", pedidos_corrida)
+        cursor.execute(f"DELETE FROM productos WHERE id IN ({marcadores})", ids)
+        conn.commit()
+    cursor.close()
+    conn.close()
+
+    if errores:
+        print("FALLÓ:\n  " + "\n  ".join(errores))
+        sys.exit(1)
+    print("Stock exacto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""Módulos de acceso a la base de datos de DistriSulpi"""
+
+from database.db_connection import PoolConexiones, ConexionPool, PoolAgotadoError
@@ -0,0 +1,209 @@
+"""Motores de almacenamiento: MySQL (servidor) y SQLite (archivo local).
+
+Ambos entregan conexiones con la misma interfaz que mysql.connector
+(cursor(dictionary=True), parámetros %s, lastrowid, commit/rollback), así que
+las consultas de la aplicación no cambian según el motor. Las pocas diferencias
+de dialecto (DDL, metadatos, upserts) se resuelven consultando dialecto().
+"""
+
+import datetime
+import decimal
+import functools
+import os
+import re
+import sqlite3
+import zlib
+
+
+def dialecto(conn_o_cursor):
+    """Devuelve 'mysql' o 'sqlite' para una conexión o cursor"""
+    return getattr(conn_o_cursor, "dialecto", "mysql")
+
+
+def tipo_id(conn_o_cursor):
+    """Definición de una clave primaria autoincremental para CREATE TABLE"""
+    if dialecto(conn_o_cursor) == "sqlite":
+        return "INTEGER PRIMARY KEY AUTOINCREMENT"
+    return "INT AUTO_INCREMENT PRIMARY KEY"
+
+
+def a_decimal(valor, decimales=2):
+    """Resultado de SUM() o AVG() como Decimal, igual en los dos motores.
+
+    MySQL ya devuelve Decimal y se deja como está; SQLite devuelve int o float
+    porque la expresión no tiene tipo declarado, y se redondea a 'decimales'.
+    None sigue siendo None.
+    """
+    if valor is None or isinstance(valor, decimal.Decimal):
+        return valor
+    return decimal.Decimal(str(valor)).quantize(decimal.Decimal(1).scaleb(-decimales),
+                                                rounding=decimal.ROUND_HALF_UP)
+
+
+class BackendMySQL:
+    """Servidor MySQL/MariaDB configurado con DB_CONFIG"""
+
+    nombre = "mysql"
+
+    def __init__(self, config):
+        self.config = config
+        self.base = config['database']
+
+    def crear_base(self):
+        """Crea la base de datos en el servidor si no existe"""
+        import mysql.connector
+        conn = mysql.connector.connect(
+            host=self.config['host'],
+            user=self.config['user'],
+            password=self.config['password'],
+            **({'port': self.config['port']} if 'port' in self.config else {})
+        )
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.base}")
+        cursor.close()
+        conn.close()
+
+    def conectar(self):
+        import mysql.connector
+        return mysql.connector.connect(**self.config)
+
+
+# Literales entre comillas (se copian tal cual) o un parámetro %s
+_LITERAL_O_PARAMETRO = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`)|%s""")
+
+
+@functools.lru_cache(maxsize=512)
+def parametros_sqlite(consulta):
+    """Cambia los parámetros %s por ? sin tocar los que aparecen dentro de un literal"""
+    return _LITERAL_O_PARAMETRO.sub(lambda m: m.group(1) or "?", consulta)
+
+
+class CursorSQLite:
+    """Cursor de SQLite que acepta parámetros %s y puede devolver diccionarios"""
+
+    dialecto = "sqlite"
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            self._cursor.row_factory = lambda c, fila: {
+                columna[0]: valor for columna, valor in zip(c.description, fila)
+            }
+
+    def execute(self, consulta, parametros=()):
+        self._cursor.execute(parametros_sqlite(consulta), tuple(parametros or ()))
+        return self
+
+    def executemany(self, consulta, filas):
+        self._cursor.executemany(parametros_sqlite(consulta), [tuple(f) for f in filas])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionSQLite:
+    """Conexión de SQLite con la interfaz de mysql.connector que usa la aplicación"""
+
+    dialecto = "sqlite"
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, dictionary=False):
+        return CursorSQLite(self._conn.cursor(), dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def _convertir_fecha(valor):
+    texto = valor.decode()
+    for formato in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+    return texto
+
+
+def _crc32(texto):
+    return None if texto is None else zlib.crc32(str(texto).encode("utf-8"))
+
+
+# Tipos declarados en el esquema -> tipos de Python, igual que con mysql.connector
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_adapter(datetime.datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda valor: valor.isoformat())
+sqlite3.register_converter("DATETIME", _convertir_fecha)
+sqlite3.register_converter("DECIMAL", lambda valor: decimal.Decimal(valor.decode()))
+
+
+class BackendSQLite:
+    """Archivo SQLite local en modo WAL, para una sola terminal o para pruebas"""
+
+    nombre = "sqlite"
+
+    def __init__(self, ruta, timeout=10):
+        self.ruta = ruta
+        self.base = os.path.splitext(os.path.basename(ruta))[0]
+        self.timeout = timeout
+
+    def crear_base(self):
+        """Crea el directorio del archivo; SQLite crea el archivo al conectar"""
+        directorio = os.path.dirname(os.path.abspath(self.ruta))
+        os.makedirs(directorio, exist_ok=True)
+
+    def conectar(self):
+        conn = sqlite3.connect(
+            self.ruta,
+            timeout=self.timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        # CRC32() como en MySQL, para la firma del catálogo
+        conn.create_function("CRC32", 1, _crc32, deterministic=True)
+        return ConexionSQLite(conn)
+
+
+def crear_backend(nombre, config, ruta_sqlite):
+    """Crea el motor indicado ('mysql' o 'sqlite')"""
+    if nombre == "sqlite":
+        return BackendSQLite(ruta_sqlite)
+    if nombre == "mysql":
+        return BackendMySQL(config)
+    raise ValueError(f"Motor de base de datos desconocido: {nombre}")
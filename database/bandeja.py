@@ -0,0 +1,282 @@
+"""Bandeja de salida local de pedidos.
+
+Un pedido finalizado se escribe primero en un archivo SQLite local (modo WAL con
+synchronous=FULL: cada pedido queda en disco al confirmar) y recién después un
+hilo en segundo plano lo guarda en la base principal. Así la confirmación al
+operador no depende de la latencia ni de la disponibilidad de la base, y el
+pedido no se pierde si la base está caída o la aplicación se cierra.
+
+Cada entrada lleva una clave única que se guarda en pedidos.clave: si el hilo
+reintenta un pedido que ya había llegado a la base (por ejemplo, se cortó la
+conexión justo después del commit), guardar_pedido devuelve el pedido existente
+en lugar de duplicarlo.
+"""
+
+import datetime
+import json
+import random
+import sqlite3
+import threading
+import uuid
+
+# Temas de CanalEventos con el resultado de cada entrada: {"clave", "pedido_id"} o {"clave", "error"}
+EVENTO_GUARDADO = "pedidos.guardado"
+EVENTO_RECHAZADO = "pedidos.rechazado"
+
+PENDIENTE = "pendiente"
+GUARDADO = "guardado"
+RECHAZADO = "rechazado"
+
+
+class BandejaPedidos:
+    """Diario local de pedidos pendientes de guardar en la base"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+        CREATE TABLE IF NOT EXISTS bandeja (
+            clave TEXT PRIMARY KEY,
+            datos TEXT NOT NULL,
+            creado TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            ultimo_error TEXT,
+            pedido_id INTEGER
+        )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bandeja_estado ON bandeja(estado, creado)")
+        self._lock = threading.Lock()
+
+    def encolar(self, cliente, zona, detalles, fecha=None, clave=None):
+        """Registra el pedido y devuelve su clave; al volver, el pedido ya está en disco.
+
+        Si la clave ya estaba en la bandeja (el mismo carrito enviado otra vez)
+        no se agrega nada.
+        """
+        clave = clave or str(uuid.uuid4())
+        ahora = datetime.datetime.now()
+        datos = json.dumps({
+            "cliente": cliente,
+            "zona": zona,
+            "detalles": detalles,
+            # La fecha del pedido es la de la terminal, no la del momento en que llega a la base
+            "fecha": (fecha or ahora).isoformat()
+        })
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO bandeja (clave, datos, creado, estado) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(clave) DO NOTHING",
+                (clave, datos, ahora.isoformat(), PENDIENTE)
+            )
+        return clave
+
+    def pendientes(self, limite):
+        """Entradas pendientes más antiguas: [(clave, cliente, zona, detalles, fecha)]"""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT clave, datos FROM bandeja WHERE estado = ? ORDER BY creado LIMIT ?",
+                (PENDIENTE, limite)
+            ).fetchall()
+        entradas = []
+        for clave, datos in filas:
+            pedido = json.loads(datos)
+            entradas.append((clave, pedido["cliente"], pedido["zona"], pedido["detalles"],
+                             datetime.datetime.fromisoformat(pedido["fecha"])))
+        return entradas
+
+    def cantidad_pendientes(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM bandeja WHERE estado = ?", (PENDIENTE,)
+            ).fetchone()[0]
+
+    def marcar_guardado(self, clave, pedido_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE bandeja SET estado = ?, pedido_id = ?, ultimo_error = NULL WHERE clave = ?",
+                (GUARDADO, pedido_id, clave)
+            )
+
+    def marcar_guardados(self, guardados):
+        """Marca varias entradas {clave: pedido_id} como guardadas con una sola escritura a disco"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE bandeja SET estado = ?, pedido_id = ?, ultimo_error = NULL WHERE clave = ?",
+                    [(GUARDADO, pedido_id, clave) for clave, pedido_id in guardados.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def marcar_rechazado(self, clave, error):
+        """El pedido no puede guardarse (por ejemplo, sin stock); queda para revisión y no se reintenta"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE bandeja SET estado = ?, ultimo_error = ? WHERE clave = ?",
+                (RECHAZADO, str(error), clave)
+            )
+
+    def registrar_fallo(self, clave, error):
+        """Error del pedido: la entrada sigue pendiente con un intento más; devuelve los intentos fallidos"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE bandeja SET intentos = intentos + 1, ultimo_error = ? WHERE clave = ?",
+                (str(error), clave)
+            )
+            fila = self._conn.execute("SELECT intentos FROM bandeja WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else 0
+
+    def registrar_espera(self, clave, error):
+        """La base no está disponible: la entrada sigue pendiente sin contar el intento"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE bandeja SET ultimo_error = ? WHERE clave = ?",
+                (str(error), clave)
+            )
+
+    def estado(self, clave):
+        """{"estado", "pedido_id", "error"} de la entrada, o None si no existe"""
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT estado, pedido_id, ultimo_error FROM bandeja WHERE clave = ?", (clave,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {"estado": fila[0], "pedido_id": fila[1], "error": fila[2]}
+
+    def pedido(self, clave):
+        """{"cliente", "zona", "detalles", "fecha"} de la entrada, o None si no existe"""
+        with self._lock:
+            fila = self._conn.execute("SELECT datos FROM bandeja WHERE clave = ?", (clave,)).fetchone()
+        if fila is None:
+            return None
+        pedido = json.loads(fila[0])
+        pedido["fecha"] = datetime.datetime.fromisoformat(pedido["fecha"])
+        return pedido
+
+    def cerrar(self):
+        with self._lock:
+            self._conn.close()
+
+
+class VaciadorBandeja:
+    """Hilo que guarda en la base los pedidos pendientes de la bandeja, por lotes.
+
+    guardar_lote(entradas), si se indica, guarda un lote de entradas
+    [(clave, cliente, zona, detalles, fecha)] en una sola transacción y devuelve
+    {clave: pedido_id}: un commit por lote en lugar de uno por pedido. Si el
+    lote falla por cualquier error que no sea de la base (por ejemplo, el stock
+    no alcanza para todos), no se guardó ninguno y las entradas se guardan de a
+    una con guardar, para rechazar solo las que corresponda.
+
+    guardar(clave, cliente, zona, detalles, fecha) devuelve el id del pedido, o
+    None si la base no está disponible: el lote se corta y se reintenta más
+    tarde, con espera creciente, sin alterar el orden de los pedidos y sin
+    límite de intentos. Los errores de 'rechazos' (por ejemplo,
+    StockInsuficienteError) descartan la entrada. Cualquier otro error es del
+    pedido: también corta el lote, pero al fallar 'intentos_maximos' veces la
+    entrada se rechaza y el lote sigue, para que un pedido que nunca va a
+    guardarse no frene a los demás.
+    on_guardado(clave, pedido_id) y on_rechazado(clave, error) avisan el resultado.
+    """
+
+    def __init__(self, bandeja, guardar, rechazos=(), lote=20, espera_minima=0.5,
+                 espera_maxima=30.0, intentos_maximos=3, on_guardado=None, on_rechazado=None,
+                 guardar_lote=None):
+        self.bandeja = bandeja
+        self._guardar = guardar
+        self._guardar_lote = guardar_lote
+        self._rechazos = tuple(rechazos)
+        self.intentos_maximos = intentos_maximos
+        self.lote = lote
+        self._espera_minima = espera_minima
+        self._espera_maxima = espera_maxima
+        self._on_guardado = on_guardado
+        self._on_rechazado = on_rechazado
+        self._aviso = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._ciclo, name="distri-bandeja", daemon=True)
+            self._hilo.start()
+
+    def avisar(self):
+        """Despierta al hilo (se llama después de encolar un pedido)"""
+        self._aviso.set()
+
+    def detener(self):
+        self._detener.set()
+        self._aviso.set()
+
+    def vaciar(self):
+        """Guarda un lote de pendientes; devuelve False si la base falló y hay que reintentar"""
+        entradas = self.bandeja.pendientes(self.lote)
+        if self._guardar_lote is not None and len(entradas) > 1:
+            try:
+                ids = self._guardar_lote(entradas)
+            except Exception as e:
+                # Algún pedido del lote no puede guardarse: seguir de a uno
+                print(f"El lote de la bandeja no se pudo guardar junto, se guarda de a un pedido: {e}")
+            else:
+                if not ids:
+                    self.bandeja.registrar_espera(entradas[0][0], "la base no está disponible")
+                    return False
+                self.bandeja.marcar_guardados(ids)
+                for clave, pedido_id in ids.items():
+                    self._avisar(self._on_guardado, clave, pedido_id)
+                return True
+        for clave, cliente, zona, detalles, fecha in entradas:
+            try:
+                pedido_id = self._guardar(clave, cliente, zona, detalles, fecha)
+            except self._rechazos as e:
+                self.bandeja.marcar_rechazado(clave, e)
+                self._avisar(self._on_rechazado, clave, e)
+                continue
+            except Exception as e:
+                if self.bandeja.registrar_fallo(clave, e) < self.intentos_maximos:
+                    return False
+                self.bandeja.marcar_rechazado(clave, e)
+                self._avisar(self._on_rechazado, clave, e)
+                continue
+            if not pedido_id:
+                self.bandeja.registrar_espera(clave, "la base no está disponible")
+                return False
+            self.bandeja.marcar_guardado(clave, pedido_id)
+            self._avisar(self._on_guardado, clave, pedido_id)
+        return True
+
+    def _avisar(self, callback, *args):
+        if callback is not None:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error al avisar el resultado de un pedido de la bandeja: {e}")
+
+    def _ciclo(self):
+        espera = self._espera_minima
+        while not self._detener.is_set():
+            try:
+                correcto = self.vaciar()
+            except Exception as e:
+                print(f"Error al vaciar la bandeja de pedidos: {e}")
+                correcto = False
+            if correcto and self.bandeja.cantidad_pendientes():
+                # Quedan pendientes de un lote lleno: seguir sin esperar
+                espera = self._espera_minima
+                continue
+            if correcto:
+                espera = self._espera_minima
+                self._aviso.wait()
+            else:
+                # Base caída o lenta: espera creciente con algo de azar para no reintentar todos juntos
+                self._aviso.wait(espera * random.uniform(0.8, 1.2))
+                espera = min(espera * 2, self._espera_maxima)
+            self._aviso.clear()
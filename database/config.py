@@ -0,0 +1,28 @@
+"""Configuración de la base de datos, compartida por la aplicación y los benchmarks.
+
+Se lee de las variables de entorno (las mismas del archivo .env) al importar el
+módulo; sin ellas quedan los valores de la instalación original.
+"""
+
+import os
+
+# Configuración de la conexión a la base de datos
+DB_CONFIG = {
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASSWORD', 'joacoelmascapo'),
+    'database': os.environ.get('DB_NAME', 'distrisulpi'),
+    'port': int(os.environ.get('DB_PORT', 3306))
+}
+
+# Motor de almacenamiento: "mysql" (servidor) o "sqlite" (archivo local, una sola terminal)
+DB_BACKEND = os.environ.get('DB_BACKEND', 'mysql')
+DB_SQLITE_PATH = os.environ.get('DB_SQLITE_PATH', 'distrisulpi.db')
+
+# Configuración del pool de conexiones compartido por todas las sesiones
+DB_POOL_CONFIG = {
+    'tamano': int(os.environ.get('DB_POOL_SIZE', 8)),
+    'timeout': float(os.environ.get('DB_TIMEOUT', 10)),
+    'max_edad': float(os.environ.get('DB_POOL_MAX_AGE', 1800)),
+    'validar_tras': float(os.environ.get('DB_POOL_PING_AFTER', 30))
+}
@@ -0,0 +1,163 @@
+"""Pool de conexiones compartido para la base de datos"""
+
+import queue
+import threading
+import time
+
+
+class PoolAgotadoError(Exception):
+    """No se pudo obtener una conexión del pool dentro del tiempo de espera"""
+
+
+class SinConexionError(Exception):
+    """No hay conexión a la base para una operación que no puede seguir sin ella"""
+
+    def __init__(self, mensaje="No se pudo conectar a la base de datos"):
+        super().__init__(mensaje)
+
+
+class ConexionPool:
+    """Conexión prestada por el pool.
+
+    Se comporta como la conexión original, pero close() la devuelve al pool
+    en lugar de cerrarla. Si se pierde la referencia sin cerrarla, también
+    vuelve al pool para no agotar los cupos.
+    """
+
+    def __init__(self, pool, conn, creada):
+        self._pool = pool
+        self._conn = conn
+        self._creada = creada
+
+    def close(self):
+        """Devuelve la conexión al pool"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._devolver(conn, self._creada)
+
+    def descartar(self):
+        """Cierra la conexión real sin devolverla (por ejemplo, tras un error de red)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._descartar(conn)
+
+    def __getattr__(self, nombre):
+        conn = self.__dict__.get("_conn")
+        if conn is None:
+            raise AttributeError(f"La conexión ya fue devuelta al pool ({nombre})")
+        return getattr(conn, nombre)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class PoolConexiones:
+    """Pool acotado de conexiones reutilizables.
+
+    - tamano: cantidad máxima de conexiones prestadas a la vez
+    - timeout: segundos de espera para obtener una conexión cuando el pool está lleno
+    - max_edad: segundos tras los cuales una conexión se recicla
+    - validar_tras: segundos de inactividad a partir de los cuales se hace ping antes de prestarla
+    """
+
+    def __init__(self, fabrica, tamano=8, timeout=10, max_edad=1800, validar_tras=30):
+        self._fabrica = fabrica
+        self.tamano = tamano
+        self.timeout = timeout
+        self.max_edad = max_edad
+        self.validar_tras = validar_tras
+        self._libres = queue.LifoQueue()
+        self._cupos = threading.BoundedSemaphore(tamano)
+        self._lock = threading.Lock()
+        self.estadisticas = {"creadas": 0, "recicladas": 0, "descartadas": 0, "prestamos": 0}
+
+    def obtener(self):
+        """Presta una conexión sana del pool, creando una nueva si hace falta"""
+        if not self._cupos.acquire(timeout=self.timeout):
+            raise PoolAgotadoError(
+                f"No hay conexiones libres tras {self.timeout}s (tamaño del pool: {self.tamano})"
+            )
+        try:
+            conn, creada = self._tomar_libre()
+            if conn is None:
+                conn = self._fabrica()
+                creada = time.monotonic()
+                self._contar("creadas")
+            self._contar("prestamos")
+            return ConexionPool(self, conn, creada)
+        except Exception:
+            self._cupos.release()
+            raise
+
+    def _tomar_libre(self):
+        """Saca una conexión libre que siga siendo válida, o (None, None)"""
+        while True:
+            try:
+                conn, creada, ultimo_uso = self._libres.get_nowait()
+            except queue.Empty:
+                return None, None
+            ahora = time.monotonic()
+            if ahora - creada > self.max_edad:
+                self._cerrar(conn)
+                self._contar("recicladas")
+                continue
+            if ahora - ultimo_uso > self.validar_tras and not self._es_saludable(conn):
+                self._cerrar(conn)
+                self._contar("descartadas")
+                continue
+            return conn, creada
+
+    def _es_saludable(self, conn):
+        """Verifica que la conexión siga viva (hace ping al servidor)"""
+        try:
+            if hasattr(conn, "is_connected"):
+                return conn.is_connected()
+            conn.cursor().execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _devolver(self, conn, creada):
+        """Recibe una conexión prestada, terminando cualquier transacción abierta"""
+        try:
+            if getattr(conn, "in_transaction", True):
+                conn.rollback()
+            self._libres.put((conn, creada, time.monotonic()))
+        except Exception:
+            self._cerrar(conn)
+            self._contar("descartadas")
+        finally:
+            self._cupos.release()
+
+    def _descartar(self, conn):
+        self._cerrar(conn)
+        self._contar("descartadas")
+        self._cupos.release()
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _contar(self, clave):
+        with self._lock:
+            self.estadisticas[clave] += 1
+
+    def cerrar(self):
+        """Cierra todas las conexiones libres del pool"""
+        while True:
+            try:
+                conn, _, _ = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            self._cerrar(conn)
@@ -0,0 +1,63 @@
+"""Ventanas de fechas para filtrar consultas sin funciones sobre la columna.
+
+Las consultas usan 'fecha >= inicio AND fecha < fin' en lugar de DATE(fecha) = x
+o YEAR(fecha) = x, de modo que el índice sobre la columna puede resolverse con
+un recorrido por rango.
+"""
+
+import datetime
+
+FORMATOS_FECHA = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def a_fecha(valor):
+    """Convierte date, datetime o texto (AAAA-MM-DD o DD/MM/AAAA) a date"""
+    if valor is None:
+        return datetime.date.today()
+    if isinstance(valor, datetime.datetime):
+        return valor.date()
+    if isinstance(valor, datetime.date):
+        return valor
+    texto = str(valor).strip()
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {valor!r}")
+
+
+def _inicio_del_dia(dia):
+    return datetime.datetime.combine(dia, datetime.time.min)
+
+
+def rango_dia(fecha=None):
+    """Devuelve (inicio, fin) del día indicado, o de hoy si no se indica"""
+    dia = a_fecha(fecha)
+    return _inicio_del_dia(dia), _inicio_del_dia(dia + datetime.timedelta(days=1))
+
+
+def rango_mes(anio, mes):
+    """Devuelve (inicio, fin) del mes indicado"""
+    inicio = datetime.date(anio, mes, 1)
+    siguiente = datetime.date(anio + 1, 1, 1) if mes == 12 else datetime.date(anio, mes + 1, 1)
+    return _inicio_del_dia(inicio), _inicio_del_dia(siguiente)
+
+
+def rango_anio(anio=None):
+    """Devuelve (inicio, fin) del año indicado, o del año actual si no se indica"""
+    anio = anio or datetime.date.today().year
+    return _inicio_del_dia(datetime.date(anio, 1, 1)), _inicio_del_dia(datetime.date(anio + 1, 1, 1))
+
+
+def rango_fechas(desde, hasta):
+    """Devuelve (inicio, fin) que incluye los días desde y hasta completos"""
+    inicio, _ = rango_dia(desde)
+    _, fin = rango_dia(hasta)
+    return inicio, fin
+
+
+def filtro_fecha(columna, rango):
+    """Arma el predicado semiabierto para la columna y sus parámetros"""
+    inicio, fin = rango
+    return f"{columna} >= %s AND {columna} < %s", (inicio, fin)
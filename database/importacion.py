@@ -0,0 +1,188 @@
+"""Importación masiva del catálogo de productos.
+
+Las filas del CSV se cargan en una tabla temporal con INSERT de varias filas por
+lote y después se combinan con productos mediante un UPDATE y un INSERT ... SELECT
+sobre el conjunto completo, en lugar de una sentencia por fila. Con SQLite la
+tabla temporal vive en el esquema temp y la carga usa ON CONFLICT.
+
+La columna codigo (código de barras o SKU) es opcional: si el CSV no la trae,
+los códigos ya cargados en productos no se modifican.
+"""
+
+import math
+
+from database.backends import dialecto
+
+COLUMNAS_PRODUCTO = ["nombre", "precio_venta", "costo", "stock"]
+
+TABLA_STAGING = "productos_staging"
+
+
+def normalizar_codigo(codigo):
+    """Código sin espacios alrededor; None si está vacío o falta"""
+    if codigo is None or (isinstance(codigo, float) and math.isnan(codigo)):
+        return None
+    codigo = str(codigo).strip()
+    return codigo or None
+
+
+def _filas_desde_dataframe(df):
+    """Convierte el DataFrame a listas de valores nativos de Python"""
+    filas = df[COLUMNAS_PRODUCTO].to_numpy(dtype=object).tolist()
+    codigos = df["codigo"].tolist() if "codigo" in df.columns else [None] * len(filas)
+    return [[str(nombre).strip(), precio, costo, int(stock), normalizar_codigo(codigo)]
+            for (nombre, precio, costo, stock), codigo in zip(filas, codigos)]
+
+
+def _cargar_staging(cursor, filas, lote):
+    """Carga las filas en la tabla temporal; si un nombre se repite gana la última fila"""
+    if dialecto(cursor) == "sqlite":
+        # Sin viajes por red, executemany sobre una sentencia preparada es lo más rápido
+        cursor.executemany(
+            f"""INSERT INTO {TABLA_STAGING} (nombre, precio_venta, costo, stock, codigo)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT(nombre) DO UPDATE SET
+            precio_venta = excluded.precio_venta,
+            costo = excluded.costo,
+            stock = excluded.stock,
+            codigo = excluded.codigo""",
+            filas
+        )
+        return
+    for inicio in range(0, len(filas), lote):
+        bloque = filas[inicio:inicio + lote]
+        valores = ", ".join(["(%s, %s, %s, %s, %s)"] * len(bloque))
+        parametros = [valor for fila in bloque for valor in fila]
+        cursor.execute(
+            f"""INSERT INTO {TABLA_STAGING} (nombre, precio_venta, costo, stock, codigo)
+            VALUES {valores}
+            ON DUPLICATE KEY UPDATE
+            precio_venta = VALUES(precio_venta),
+            costo = VALUES(costo),
+            stock = VALUES(stock),
+            codigo = VALUES(codigo)""",
+            parametros
+        )
+
+
+def _distinto_codigo(p, s):
+    """Condición SQL 'el código cambió', tratando NULL como vacío"""
+    return f"COALESCE({p}.codigo, '') <> COALESCE({s}.codigo, '')"
+
+
+def _actualizar_existentes_sqlite(cursor, tabla, con_codigo):
+    """UPDATE con subconsultas correlacionadas: SQLite no admite UPDATE ... JOIN"""
+    asignar_codigo = (f",\n        codigo = (SELECT s.codigo FROM {TABLA_STAGING} s WHERE s.nombre = {tabla}.nombre)"
+                      if con_codigo else "")
+    cambio_codigo = f"\n             OR {_distinto_codigo(tabla, 's')}" if con_codigo else ""
+    cursor.execute(f"""
+    UPDATE {tabla}
+    SET precio_venta = (SELECT s.precio_venta FROM {TABLA_STAGING} s WHERE s.nombre = {tabla}.nombre),
+        costo = (SELECT s.costo FROM {TABLA_STAGING} s WHERE s.nombre = {tabla}.nombre),
+        stock = (SELECT s.stock FROM {TABLA_STAGING} s WHERE s.nombre = {tabla}.nombre){asignar_codigo}
+    WHERE EXISTS (
+        SELECT 1 FROM {TABLA_STAGING} s
+        WHERE s.nombre = {tabla}.nombre
+        AND (s.precio_venta <> {tabla}.precio_venta
+             OR s.costo <> {tabla}.costo
+             OR s.stock <> {tabla}.stock{cambio_codigo})
+    )
+    """)
+
+
+def importar_productos(conn, df, lote=1000, tabla="productos"):
+    """Combina el DataFrame con la tabla de productos y devuelve los conteos.
+
+    El resultado es {"insertados": n, "actualizados": n, "sin_cambios": n,
+    "repetidos": n, "modificados": [filas]}; "repetidos" cuenta las filas
+    descartadas porque otra fila posterior del CSV tenía el mismo nombre y
+    "modificados" trae los productos existentes que cambiaron, ya con los
+    valores nuevos (dicts con id, nombre, precio_venta, costo, stock y codigo,
+    como las filas de la tabla). Todo ocurre en una transacción: si algo falla no se modifica ningún producto.
+    """
+    sqlite = dialecto(conn) == "sqlite"
+    con_codigo = "codigo" in df.columns
+    borrar_staging = (f"DROP TABLE IF EXISTS temp.{TABLA_STAGING}" if sqlite
+                      else f"DROP TEMPORARY TABLE IF EXISTS {TABLA_STAGING}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(borrar_staging)
+        cursor.execute(f"""
+        CREATE TEMPORARY TABLE {TABLA_STAGING} (
+            nombre VARCHAR(255) NOT NULL PRIMARY KEY,
+            precio_venta DECIMAL(10, 2) NOT NULL,
+            costo DECIMAL(10, 2) NOT NULL,
+            stock INT NOT NULL,
+            codigo VARCHAR(50) NULL
+        )
+        """)
+
+        filas = _filas_desde_dataframe(df)
+        _cargar_staging(cursor, filas, lote)
+
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLA_STAGING}")
+        total = cursor.fetchone()[0]
+
+        igual_codigo = f" AND NOT ({_distinto_codigo('p', 's')})" if con_codigo else ""
+        cursor.execute(f"""
+        SELECT COUNT(*),
+               COALESCE(SUM(p.precio_venta = s.precio_venta AND p.costo = s.costo
+                            AND p.stock = s.stock{igual_codigo}), 0)
+        FROM {TABLA_STAGING} s
+        JOIN {tabla} p ON p.nombre = s.nombre
+        """)
+        existentes, sin_cambios = cursor.fetchone()
+        existentes, sin_cambios = int(existentes), int(sin_cambios)
+
+        # Los productos que el UPDATE va a cambiar, con sus valores nuevos
+        codigo_nuevo = "s.codigo" if con_codigo else "p.codigo"
+        cambio_codigo = f"\n           OR {_distinto_codigo('p', 's')}" if con_codigo else ""
+        cursor.execute(f"""
+        SELECT p.id, p.nombre, s.precio_venta, s.costo, s.stock, {codigo_nuevo}
+        FROM {TABLA_STAGING} s
+        JOIN {tabla} p ON p.nombre = s.nombre
+        WHERE p.precio_venta <> s.precio_venta
+           OR p.costo <> s.costo
+           OR p.stock <> s.stock{cambio_codigo}
+        """)
+        modificados = [dict(zip(("id", "nombre", "precio_venta", "costo", "stock", "codigo"), fila))
+                       for fila in cursor.fetchall()]
+
+        if sqlite:
+            _actualizar_existentes_sqlite(cursor, tabla, con_codigo)
+        else:
+            asignar_codigo = ",\n                p.codigo = s.codigo" if con_codigo else ""
+            cambio_codigo = f"\n               OR {_distinto_codigo('p', 's')}" if con_codigo else ""
+            cursor.execute(f"""
+            UPDATE {tabla} p
+            JOIN {TABLA_STAGING} s ON p.nombre = s.nombre
+            SET p.precio_venta = s.precio_venta,
+                p.costo = s.costo,
+                p.stock = s.stock{asignar_codigo}
+            WHERE p.precio_venta <> s.precio_venta
+               OR p.costo <> s.costo
+               OR p.stock <> s.stock{cambio_codigo}
+            """)
+
+        cursor.execute(f"""
+        INSERT INTO {tabla} (nombre, precio_venta, costo, stock, codigo)
+        SELECT s.nombre, s.precio_venta, s.costo, s.stock, s.codigo
+        FROM {TABLA_STAGING} s
+        LEFT JOIN {tabla} p ON p.nombre = s.nombre
+        WHERE p.id IS NULL
+        """)
+
+        conn.commit()
+        cursor.execute(borrar_staging)
+        return {
+            "insertados": total - existentes,
+            "actualizados": existentes - sin_cambios,
+            "sin_cambios": sin_cambios,
+            "repetidos": len(filas) - total,
+            "modificados": modificados
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,275 @@
+"""Índices secundarios administrados por la aplicación.
+
+La lista INDICES refleja los patrones de consulta reales: los reportes filtran
+pedidos por fecha y por cliente, los detalles se buscan por pedido y se agrupan
+por producto, la importación de CSV usa el nombre del producto como clave, el
+modo escáner busca productos por código de barras y la bandeja de pedidos evita
+guardar dos veces un pedido por su clave.
+"""
+
+import sqlite3
+
+from database.backends import dialecto
+from database.fechas import filtro_fecha, rango_dia, rango_anio
+
+# (tabla, nombre del índice, columnas, único)
+INDICES = [
+    ("pedidos", "idx_pedidos_fecha", ("fecha",), False),
+    ("pedidos", "idx_pedidos_cliente_fecha", ("cliente", "fecha"), False),
+    ("detalle_pedido", "idx_detalle_pedido", ("pedido_id",), False),
+    ("detalle_pedido", "idx_detalle_producto_cantidad", ("producto_id", "cantidad"), False),
+    ("productos", "uq_productos_nombre", ("nombre",), True),
+    ("productos", "uq_productos_codigo", ("codigo",), True),
+    ("pedidos", "uq_pedidos_clave", ("clave",), True),
+]
+
+
+class ValoresRepetidosError(Exception):
+    """Un índice único no puede crearse porque la columna tiene valores repetidos"""
+
+    def __init__(self, tabla, columna, duplicados):
+        self.tabla = tabla
+        self.columna = columna
+        self.duplicados = duplicados
+        super().__init__(f"Hay {len(duplicados)} valores repetidos en {tabla}.{columna} "
+                         f"(por ejemplo: {duplicados[:3]}); corríjalos y vuelva a ejecutar la migración")
+
+
+def indices_existentes(cursor, base):
+    """Devuelve {(tabla, índice): (columnas...)} para los índices de la base"""
+    if dialecto(cursor) == "sqlite":
+        return _indices_existentes_sqlite(cursor)
+    cursor.execute("""
+    SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = %s
+    ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """, (base,))
+    existentes = {}
+    for tabla, indice, columna in cursor.fetchall():
+        existentes.setdefault((tabla, indice), []).append(columna)
+    return {clave: tuple(columnas) for clave, columnas in existentes.items()}
+
+
+def _indices_existentes_sqlite(cursor):
+    cursor.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'index'")
+    existentes = {}
+    for tabla, indice in cursor.fetchall():
+        cursor.execute(f"PRAGMA index_info({indice})")
+        existentes[(tabla, indice)] = tuple(fila[2] for fila in sorted(cursor.fetchall()))
+    return existentes
+
+
+def _cubierto(existentes, tabla, columnas):
+    """Indica si algún índice existente empieza con las mismas columnas"""
+    return any(
+        t == tabla and cols[:len(columnas)] == columnas
+        for (t, _), cols in existentes.items()
+    )
+
+
+def _nombres_duplicados(cursor, tabla, columna):
+    cursor.execute(f"""
+    SELECT {columna}, COUNT(*) FROM {tabla}
+    WHERE {columna} IS NOT NULL
+    GROUP BY {columna} HAVING COUNT(*) > 1
+    """)
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+def crear_indices_con_cursor(cursor, base, indices=None, estricto=False):
+    """Crea los índices de INDICES (o de 'indices') que falten y devuelve los nombres creados.
+
+    Un índice único no se crea si la tabla tiene valores repetidos; en ese caso
+    se informa y queda pendiente para la próxima verificación. Con 'estricto'
+    (las migraciones) se lanza ValoresRepetidosError, para que la migración no
+    quede registrada sin el índice.
+    """
+    creados = []
+    existentes = indices_existentes(cursor, base)
+    for tabla, nombre, columnas, unico in (INDICES if indices is None else indices):
+        if (tabla, nombre) in existentes:
+            continue
+        if not unico and _cubierto(existentes, tabla, columnas):
+            continue
+        if unico:
+            duplicados = _nombres_duplicados(cursor, tabla, columnas[0])
+            if duplicados and estricto:
+                raise ValoresRepetidosError(tabla, columnas[0], duplicados)
+            if duplicados:
+                print(f"No se creó {nombre}: hay {len(duplicados)} valores repetidos en "
+                      f"{tabla}.{columnas[0]} (por ejemplo: {duplicados[:3]})")
+                continue
+        tipo = "UNIQUE INDEX" if unico else "INDEX"
+        cursor.execute(f"CREATE {tipo} {nombre} ON {tabla} ({', '.join(columnas)})")
+        creados.append(nombre)
+    return creados
+
+
+def crear_indices(conn, base):
+    """Crea los índices administrados que falten en la base"""
+    cursor = conn.cursor()
+    try:
+        creados = crear_indices_con_cursor(cursor, base)
+        conn.commit()
+        return creados
+    finally:
+        cursor.close()
+
+
+def _indices_sin_uso(cursor, base):
+    """Índices sin lecturas según performance_schema, o None si no se puede saber"""
+    if dialecto(cursor) == "sqlite":
+        return None
+    try:
+        cursor.execute("""
+        SELECT OBJECT_NAME, INDEX_NAME
+        FROM performance_schema.table_io_waits_summary_by_index_usage
+        WHERE OBJECT_SCHEMA = %s
+        AND INDEX_NAME IS NOT NULL
+        AND INDEX_NAME <> 'PRIMARY'
+        AND COUNT_STAR = 0
+        ORDER BY OBJECT_NAME, INDEX_NAME
+        """, (base,))
+        return [(tabla, indice) for tabla, indice in cursor.fetchall()]
+    except Exception:
+        return None
+
+
+def verificar_indices(conn, base):
+    """Informa los índices administrados que faltan y los índices que no se usan.
+
+    Los índices sin uso salen de performance_schema; si no está habilitado,
+    o si la base es SQLite, 'sin_uso' es None.
+    """
+    cursor = conn.cursor()
+    try:
+        existentes = indices_existentes(cursor, base)
+        faltantes = [
+            (tabla, nombre, columnas)
+            for tabla, nombre, columnas, unico in INDICES
+            if (tabla, nombre) not in existentes
+            and (unico or not _cubierto(existentes, tabla, columnas))
+        ]
+
+        sin_uso = _indices_sin_uso(cursor, base)
+
+        return {"faltantes": faltantes, "sin_uso": sin_uso, "planes": explicar_filtros_fecha(conn)}
+    finally:
+        cursor.close()
+
+
+def _consultas_por_fecha(indice=None):
+    """Consultas representativas de los reportes filtrados por fecha.
+
+    Con 'indice', la tabla pedidos se lee con INDEXED BY (solo SQLite); la
+    cláusula va después del alias, como pide la sintaxis.
+    """
+    indexado = f" INDEXED BY {indice}" if indice else ""
+    filtro_dia, parametros_dia = filtro_fecha("fecha", rango_dia())
+    filtro_anio, parametros_anio = filtro_fecha("ped.fecha", rango_anio())
+    return [
+        ("pedidos del día",
+         f"SELECT id, cliente, zona, fecha, total FROM pedidos{indexado} WHERE {filtro_dia} ORDER BY fecha DESC",
+         parametros_dia),
+        ("facturación del día",
+         f"SELECT SUM(total) FROM pedidos{indexado} WHERE {filtro_dia}",
+         parametros_dia),
+        ("ganancia del año",
+         f"""SELECT SUM((dp.precio_unitario - p.costo) * dp.cantidad)
+         FROM pedidos ped{indexado}
+         JOIN detalle_pedido dp ON ped.id = dp.pedido_id
+         JOIN productos p ON dp.producto_id = p.id
+         WHERE {filtro_anio}""",
+         parametros_anio),
+    ]
+
+
+def explicar_filtros_fecha(conn):
+    """Ejecuta EXPLAIN sobre las consultas por fecha y verifica que puedan usar el índice.
+
+    Devuelve una lista de (consulta, tipo de acceso, índice elegido, usa el
+    índice, utilizable). 'usa el índice' indica que el plan elegido recorre
+    idx_pedidos_fecha por rango. En tablas chicas o recién migradas el
+    optimizador prefiere un recorrido completo aunque el índice sirva, así que
+    la verificación se basa en 'utilizable': que el índice figure entre los
+    posibles del plan (possible_keys en MySQL) o que SQLite pueda resolver la
+    consulta con un SEARCH si se le indica el índice (INDEXED BY).
+    """
+    if dialecto(conn) == "sqlite":
+        return _explicar_filtros_fecha_sqlite(conn)
+    cursor = conn.cursor(dictionary=True)
+    resultados = []
+    try:
+        for nombre, consulta, parametros in _consultas_por_fecha():
+            cursor.execute("EXPLAIN " + consulta, parametros)
+            filas = cursor.fetchall()
+            fila = next((f for f in filas if f.get("table") in ("pedidos", "ped")), filas[0])
+            usa_indice = fila.get("key") == "idx_pedidos_fecha" and fila.get("type") == "range"
+            posibles = (fila.get("possible_keys") or "").split(",")
+            utilizable = usa_indice or "idx_pedidos_fecha" in posibles
+            resultados.append((nombre, fila.get("type"), fila.get("key"), usa_indice, utilizable))
+        return resultados
+    finally:
+        cursor.close()
+
+
+def _plan_sqlite(cursor, consulta, parametros):
+    """(acceso, índice) del paso de EXPLAIN QUERY PLAN que lee pedidos"""
+    cursor.execute("EXPLAIN QUERY PLAN " + consulta, parametros)
+    detalles = [fila[-1] for fila in cursor.fetchall()]
+    detalle = next((d for d in detalles if " pedidos" in d or " ped " in d), detalles[0])
+    acceso = "SEARCH" if detalle.startswith("SEARCH") else "SCAN"
+    indice = "idx_pedidos_fecha" if "INDEX idx_pedidos_fecha" in detalle else None
+    return acceso, indice
+
+
+def _explicar_filtros_fecha_sqlite(conn):
+    """EXPLAIN QUERY PLAN de SQLite: el índice se usa si el plan es SEARCH ... USING INDEX idx_pedidos_fecha"""
+    cursor = conn.cursor()
+    resultados = []
+    try:
+        consultas = _consultas_por_fecha()
+        forzadas = _consultas_por_fecha("idx_pedidos_fecha")
+        for (nombre, consulta, parametros), (_, forzada, _) in zip(consultas, forzadas):
+            acceso, indice = _plan_sqlite(cursor, consulta, parametros)
+            usa_indice = acceso == "SEARCH" and indice is not None
+            # Con INDEXED BY, un predicado que no admite rango da SCAN ... USING INDEX
+            try:
+                utilizable = usa_indice or _plan_sqlite(cursor, forzada, parametros) == ("SEARCH", "idx_pedidos_fecha")
+            except sqlite3.OperationalError as e:
+                if "no such index" not in str(e):
+                    raise
+                utilizable = False
+            resultados.append((nombre, acceso, indice, usa_indice, utilizable))
+        return resultados
+    finally:
+        cursor.close()
+
+
+def imprimir_reporte(reporte):
+    """Muestra por consola el resultado de verificar_indices"""
+    if reporte["faltantes"]:
+        print("Índices faltantes:")
+        for tabla, nombre, columnas in reporte["faltantes"]:
+            print(f"  - {nombre} en {tabla}({', '.join(columnas)})")
+    else:
+        print("No faltan índices")
+
+    if reporte["sin_uso"] is None:
+        print("No se pudo consultar el uso de índices (performance_schema deshabilitado o base SQLite)")
+    elif reporte["sin_uso"]:
+        print("Índices sin uso desde el último reinicio del servidor:")
+        for tabla, indice in reporte["sin_uso"]:
+            print(f"  - {indice} en {tabla}")
+    else:
+        print("Todos los índices secundarios registran uso")
+
+    for nombre, tipo, indice, usa_indice, utilizable in reporte.get("planes", []):
+        if usa_indice:
+            estado = "OK"
+        elif utilizable:
+            estado = "OK, el índice sirve pero el optimizador prefiere recorrer la tabla (pocas filas)"
+        else:
+            estado = "NO PUEDE USAR EL ÍNDICE"
+        print(f"  EXPLAIN {nombre}: acceso={tipo} índice={indice} [{estado}]")
@@ -0,0 +1,184 @@
+"""Migraciones versionadas del esquema de la base de datos.
+
+Cada migración tiene un número de versión, una descripción y una función que
+recibe el cursor y el nombre de la base. La versión aplicada se guarda en la
+tabla schema_version, así el arranque solo consulta esa tabla cuando el esquema
+ya está al día.
+"""
+
+import datetime
+
+from database.backends import dialecto, tipo_id
+from database.indices import crear_indices_con_cursor
+
+
+def _columna_existe(cursor, base, tabla, columna):
+    if dialecto(cursor) == "sqlite":
+        cursor.execute(f"PRAGMA table_info({tabla})")
+        return any(fila[1] == columna for fila in cursor.fetchall())
+    cursor.execute("""
+    SELECT COUNT(*)
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = %s
+    AND TABLE_NAME = %s
+    AND COLUMN_NAME = %s
+    """, (base, tabla, columna))
+    return cursor.fetchone()[0] > 0
+
+
+def _m001_tablas_base(cursor, base):
+    """Crea las tablas productos, pedidos y detalle_pedido"""
+    id_autoincremental = tipo_id(cursor)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS productos (
+        id {id_autoincremental},
+        nombre VARCHAR(255) NOT NULL,
+        precio_venta DECIMAL(10, 2) NOT NULL,
+        costo DECIMAL(10, 2) NOT NULL,
+        stock INT NOT NULL
+    )
+    """)
+
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS pedidos (
+        id {id_autoincremental},
+        cliente VARCHAR(255) NOT NULL,
+        zona VARCHAR(50) NOT NULL,
+        fecha DATETIME NOT NULL,
+        total DECIMAL(10, 2) NOT NULL
+    )
+    """)
+
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS detalle_pedido (
+        id {id_autoincremental},
+        pedido_id INT NOT NULL,
+        producto_id INT NOT NULL,
+        cantidad INT NOT NULL,
+        precio_unitario DECIMAL(10, 2) NOT NULL,
+        subtotal DECIMAL(10, 2) NOT NULL,
+        FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
+        FOREIGN KEY (producto_id) REFERENCES productos(id)
+    )
+    """)
+
+
+def _m002_total_pedidos(cursor, base):
+    """Agrega pedidos.total en bases creadas antes de que existiera la columna"""
+    if not _columna_existe(cursor, base, "pedidos", "total"):
+        cursor.execute("ALTER TABLE pedidos ADD COLUMN total DECIMAL(10, 2) NOT NULL DEFAULT 0")
+
+
+# Índices de cada migración, copiados y no tomados de INDICES: una migración
+# aplicada hace siempre lo mismo aunque la lista administrada cambie después
+_INDICES_M003 = [
+    ("pedidos", "idx_pedidos_fecha", ("fecha",), False),
+    ("pedidos", "idx_pedidos_cliente_fecha", ("cliente", "fecha"), False),
+    ("detalle_pedido", "idx_detalle_pedido", ("pedido_id",), False),
+    ("detalle_pedido", "idx_detalle_producto_cantidad", ("producto_id", "cantidad"), False),
+    ("productos", "uq_productos_nombre", ("nombre",), True),
+]
+_INDICES_M004 = [("productos", "uq_productos_codigo", ("codigo",), True)]
+_INDICES_M005 = [("pedidos", "uq_pedidos_clave", ("clave",), True)]
+_INDICES_M006 = [
+    ("productos", "uq_productos_nombre", ("nombre",), True),
+    ("productos", "uq_productos_codigo", ("codigo",), True),
+    ("pedidos", "uq_pedidos_clave", ("clave",), True),
+]
+
+
+def _m003_indices(cursor, base):
+    """Crea los índices secundarios de los patrones de consulta (ver database/indices.py)"""
+    crear_indices_con_cursor(cursor, base, _INDICES_M003, estricto=True)
+
+
+def _m004_codigo_productos(cursor, base):
+    """Agrega productos.codigo (código de barras o SKU) con su índice único"""
+    if not _columna_existe(cursor, base, "productos", "codigo"):
+        cursor.execute("ALTER TABLE productos ADD COLUMN codigo VARCHAR(50) NULL")
+    crear_indices_con_cursor(cursor, base, _INDICES_M004, estricto=True)
+
+
+def _m005_clave_pedidos(cursor, base):
+    """Agrega pedidos.clave (clave única del pedido, para no guardarlo dos veces)"""
+    if not _columna_existe(cursor, base, "pedidos", "clave"):
+        cursor.execute("ALTER TABLE pedidos ADD COLUMN clave VARCHAR(36) NULL")
+    crear_indices_con_cursor(cursor, base, _INDICES_M005, estricto=True)
+
+
+def _m006_indices_unicos(cursor, base):
+    """Crea los índices únicos que las migraciones 3 a 5 saltearon por valores repetidos.
+
+    Hasta esta versión, esas migraciones quedaban registradas sin el índice;
+    la importación de CSV y la bandeja de pedidos dependen de él. Con valores
+    repetidos la migración falla y no se registra.
+    """
+    crear_indices_con_cursor(cursor, base, _INDICES_M006, estricto=True)
+
+
+# Lista ordenada de migraciones: (versión, descripción, función)
+MIGRACIONES = [
+    (1, "Tablas base", _m001_tablas_base),
+    (2, "Columna total en pedidos", _m002_total_pedidos),
+    (3, "Índices secundarios", _m003_indices),
+    (4, "Código de barras en productos", _m004_codigo_productos),
+    (5, "Clave única de pedidos", _m005_clave_pedidos),
+    (6, "Índices únicos pendientes", _m006_indices_unicos),
+]
+
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+def _crear_tabla_version(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        descripcion VARCHAR(255) NOT NULL,
+        aplicada DATETIME NOT NULL
+    )
+    """)
+
+
+def version_actual(cursor):
+    """Devuelve la última versión aplicada, o 0 si la base no tiene migraciones"""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        fila = cursor.fetchone()
+    except Exception:
+        return 0
+    return (fila[0] or 0) if fila else 0
+
+
+def esquema_actualizado(conn):
+    """Indica si la base ya tiene aplicadas todas las migraciones"""
+    cursor = conn.cursor()
+    try:
+        return version_actual(cursor) >= VERSION_ESQUEMA
+    finally:
+        cursor.close()
+
+
+def migrar(conn, base):
+    """Aplica en orden las migraciones pendientes y devuelve las versiones aplicadas"""
+    cursor = conn.cursor()
+    aplicadas = []
+    try:
+        _crear_tabla_version(cursor)
+        actual = version_actual(cursor)
+        for version, descripcion, funcion in MIGRACIONES:
+            if version <= actual:
+                continue
+            funcion(cursor, base)
+            cursor.execute(
+                "INSERT INTO schema_version (version, descripcion, aplicada) VALUES (%s, %s, %s)",
+                (version, descripcion, datetime.datetime.now())
+            )
+            conn.commit()
+            aplicadas.append(version)
+            print(f"Migración {version} aplicada: {descripcion}")
+        return aplicadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
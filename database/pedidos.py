@@ -0,0 +1,198 @@
+"""Escrituras de pedidos en bloque.
+
+Las líneas de un pedido se insertan con un único INSERT de varias filas y el
+stock se descuenta con un único UPDATE que agrupa los productos repetidos, de
+modo que guardar un pedido cuesta la misma cantidad de viajes a la base sin
+importar cuántas líneas tenga.
+
+reservar_stock descuenta solo si alcanza (stock >= cantidad) en el mismo UPDATE,
+así dos sesiones que venden el último producto a la vez no dejan el stock en
+negativo: una de las dos no encuentra la fila y el pedido se deshace entero.
+
+Las filas de productos se toman siempre en orden de id y antes de insertar o
+modificar líneas: dos pedidos que comparten productos esperan uno al otro en
+lugar de bloquearse mutuamente. Las líneas insertadas después no agregan
+bloqueos nuevos sobre productos (sus claves foráneas apuntan a filas que la
+transacción ya tiene tomadas).
+
+Editar un pedido guardado sigue la misma idea: diferencias_detalles calcula en
+memoria qué líneas se borran, cuáles cambian y cuánto stock se mueve por
+producto, y la edición se aplica con un DELETE, un UPDATE, una reserva de stock
+y el total recalculado en la base, tenga el pedido las líneas que tenga.
+"""
+
+
+class StockInsuficienteError(Exception):
+    """El stock no alcanza para una o más líneas del pedido.
+
+    faltantes es {producto_id: (cantidad pedida, stock disponible)}.
+    """
+
+    def __init__(self, faltantes):
+        self.faltantes = faltantes
+        detalle = ", ".join(f"producto {producto_id}: pedido {pedida}, disponible {disponible}"
+                            for producto_id, (pedida, disponible) in faltantes.items())
+        super().__init__(f"Stock insuficiente ({detalle or 'el stock cambió mientras se guardaba'})")
+
+
+def agrupar_cantidades(detalles):
+    """Suma las cantidades por producto: {producto_id: cantidad}"""
+    cantidades = {}
+    for item in detalles:
+        cantidades[item["producto_id"]] = cantidades.get(item["producto_id"], 0) + item["cantidad"]
+    return cantidades
+
+
+def insertar_detalles(cursor, pedido_id, detalles):
+    """Inserta todas las líneas del pedido en un solo INSERT"""
+    if not detalles:
+        return
+    filas = ", ".join(["(%s, %s, %s, %s, %s)"] * len(detalles))
+    parametros = []
+    for item in detalles:
+        parametros.extend((pedido_id, item["producto_id"], item["cantidad"],
+                           item["precio_unitario"], item["subtotal"]))
+    cursor.execute(
+        f"""INSERT INTO detalle_pedido
+        (pedido_id, producto_id, cantidad, precio_unitario, subtotal)
+        VALUES {filas}""",
+        parametros
+    )
+
+
+def diferencias_detalles(actuales, nuevos):
+    """Compara las líneas guardadas con las editadas, sin tocar la base.
+
+    actuales es {detalle_id: (producto_id, cantidad, precio_unitario, subtotal)}
+    tal como están en la base; nuevos, las líneas editadas (dicts con "id",
+    "producto_id", "cantidad", "precio_unitario" y "subtotal"). Las líneas de
+    'nuevos' que ya no están en la base se ignoran.
+
+    Devuelve (ids a eliminar, líneas a actualizar, {producto_id: cantidad a
+    descontar}); una cantidad negativa devuelve stock.
+    """
+    nuevos_por_id = {d["id"]: d for d in nuevos}
+    a_eliminar = []
+    a_actualizar = []
+    cambios_stock = {}
+    for detalle_id, (producto_id, cantidad, precio_unitario, subtotal) in actuales.items():
+        nuevo = nuevos_por_id.get(detalle_id)
+        if nuevo is None:
+            a_eliminar.append(detalle_id)
+            diferencia = -cantidad
+        else:
+            diferencia = nuevo["cantidad"] - cantidad
+            if (diferencia or _distinto_importe(nuevo["precio_unitario"], precio_unitario)
+                    or _distinto_importe(nuevo["subtotal"], subtotal)):
+                a_actualizar.append(nuevo)
+        if diferencia:
+            cambios_stock[producto_id] = cambios_stock.get(producto_id, 0) + diferencia
+    return a_eliminar, a_actualizar, {i: c for i, c in cambios_stock.items() if c}
+
+
+def _distinto_importe(a, b):
+    """Compara importes al centavo (la base devuelve Decimal, la edición float)"""
+    return round(float(a), 2) != round(float(b), 2)
+
+
+def eliminar_detalles(cursor, pedido_id, ids):
+    """Borra las líneas del pedido en un solo DELETE"""
+    if not ids:
+        return
+    cursor.execute(
+        f"DELETE FROM detalle_pedido WHERE pedido_id = %s AND id IN ({', '.join(['%s'] * len(ids))})",
+        [pedido_id] + list(ids)
+    )
+
+
+def actualizar_detalles(cursor, pedido_id, detalles):
+    """Actualiza cantidad, precio y subtotal de varias líneas en un solo UPDATE"""
+    if not detalles:
+        return
+    casos = " ".join(["WHEN %s THEN %s"] * len(detalles))
+    parametros = []
+    for campo in ("cantidad", "precio_unitario", "subtotal"):
+        for detalle in detalles:
+            parametros.extend((detalle["id"], detalle[campo]))
+    parametros.append(pedido_id)
+    parametros.extend(detalle["id"] for detalle in detalles)
+    cursor.execute(
+        f"""UPDATE detalle_pedido
+        SET cantidad = CASE id {casos} END,
+            precio_unitario = CASE id {casos} END,
+            subtotal = CASE id {casos} END
+        WHERE pedido_id = %s AND id IN ({', '.join(['%s'] * len(detalles))})""",
+        parametros
+    )
+
+
+def recalcular_total(cursor, pedido_id):
+    """Recalcula pedidos.total a partir de sus líneas, en la base"""
+    cursor.execute(
+        """UPDATE pedidos
+        SET total = (SELECT COALESCE(SUM(subtotal), 0) FROM detalle_pedido WHERE pedido_id = %s)
+        WHERE id = %s""",
+        (pedido_id, pedido_id)
+    )
+
+
+def reservar_stock(cursor, cantidades):
+    """Descuenta el stock solo si alcanza para todos los productos; devuelve True si lo hizo.
+
+    Un solo UPDATE, con las filas en orden de id: las cantidades positivas se
+    descuentan solo si stock >= cantidad y las negativas devuelven stock sin
+    condición. Con False parte del UPDATE pudo aplicarse, así que la
+    transacción debe deshacerse; faltantes_stock() informa después qué
+    productos no alcanzaron.
+    """
+    cantidades = {i: c for i, c in cantidades.items() if c}
+    if not cantidades:
+        return True
+    ids = sorted(cantidades)
+    casos = " ".join(["WHEN %s THEN %s"] * len(ids))
+    valores = []
+    for producto_id in ids:
+        valores.extend((producto_id, cantidades[producto_id]))
+    a_reservar = [i for i in ids if cantidades[i] > 0]
+    condicion = ""
+    valores_condicion = []
+    if a_reservar:
+        condicion = f"AND stock >= CASE id {' '.join(['WHEN %s THEN %s'] * len(a_reservar))} ELSE stock END"
+        for producto_id in a_reservar:
+            valores_condicion.extend((producto_id, cantidades[producto_id]))
+    cursor.execute(
+        f"""UPDATE productos
+        SET stock = stock - CASE id {casos} END
+        WHERE id IN ({', '.join(['%s'] * len(ids))})
+        {condicion}""",
+        valores + ids + valores_condicion
+    )
+    return cursor.rowcount == len(ids)
+
+
+def bloquear_pedido(cursor, pedido_id):
+    """Toma la fila del pedido antes de editarlo: otra edición del mismo pedido espera.
+
+    Un UPDATE que no cambia nada bloquea la fila en MySQL y abre la transacción
+    de escritura en SQLite, así las líneas se leen después sin que otra sesión
+    pueda cambiarlas en el medio.
+    """
+    cursor.execute("UPDATE pedidos SET total = total WHERE id = %s", (pedido_id,))
+
+
+def faltantes_stock(cursor, cantidades):
+    """Productos cuyo stock actual no alcanza: {producto_id: (cantidad pedida, stock disponible)}"""
+    a_reservar = {i: c for i, c in cantidades.items() if c > 0}
+    if not a_reservar:
+        return {}
+    ids = sorted(a_reservar)
+    cursor.execute(
+        f"SELECT id, stock FROM productos WHERE id IN ({', '.join(['%s'] * len(ids))})",
+        ids
+    )
+    disponibles = {fila[0]: fila[1] for fila in cursor.fetchall()}
+    return {
+        producto_id: (cantidad, disponibles.get(producto_id, 0))
+        for producto_id, cantidad in a_reservar.items()
+        if disponibles.get(producto_id, 0) < cantidad
+    }
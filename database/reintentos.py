@@ -0,0 +1,82 @@
+"""Reintento de transacciones que chocan por bloqueos.
+
+Con varias sesiones guardando a la vez, una transacción puede perder un
+interbloqueo (MySQL 1213), agotar la espera de un bloqueo (MySQL 1205) o, con
+SQLite, encontrar la base tomada por otro escritor. En esos casos la base ya
+deshizo (o nunca aplicó) la transacción, así que repetirla entera es seguro.
+
+PoliticaReintentos repite la función con una espera creciente al azar entre
+cero y el tope de cada intento, para que las sesiones que chocaron no vuelvan a
+chocar en el mismo instante, y cuenta los reintentos en 'estadisticas'.
+Cualquier otro error se propaga en el primer intento.
+
+es_transitorio() reconoce además los errores de conexión (base caída, conexión
+cortada, pool agotado): el pedido no tiene nada que corregir y conviene volver
+a intentarlo más tarde, a diferencia de un error del propio pedido.
+"""
+
+import random
+import sqlite3
+import threading
+import time
+
+from database.db_connection import PoolAgotadoError, SinConexionError
+
+# Errores de MySQL: espera de bloqueo agotada e interbloqueo
+ERRORES_BLOQUEO_MYSQL = {1205, 1213}
+# Errores de MySQL de conexión: demasiadas conexiones, servidor inaccesible, conexión perdida
+ERRORES_CONEXION_MYSQL = {1040, 2002, 2003, 2005, 2006, 2013, 2055}
+# Códigos primarios de SQLite: SQLITE_BUSY y SQLITE_LOCKED
+ERRORES_BLOQUEO_SQLITE = {5, 6}
+
+
+def es_bloqueo(error):
+    """True si el error es un choque de bloqueos que se resuelve repitiendo la transacción"""
+    if getattr(error, "errno", None) in ERRORES_BLOQUEO_MYSQL:
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        codigo = getattr(error, "sqlite_errorcode", None)
+        if codigo is not None:
+            return codigo & 0xFF in ERRORES_BLOQUEO_SQLITE
+        return "locked" in str(error) or "busy" in str(error)
+    return False
+
+
+def es_transitorio(error):
+    """True si el error no es del pedido sino de la base o la conexión, y repetirlo más tarde puede funcionar"""
+    if es_bloqueo(error):
+        return True
+    if isinstance(error, (PoolAgotadoError, SinConexionError, ConnectionError, TimeoutError)):
+        return True
+    return getattr(error, "errno", None) in ERRORES_CONEXION_MYSQL
+
+
+class PoliticaReintentos:
+    """Repite una transacción mientras falle por bloqueos, hasta 'intentos' veces"""
+
+    def __init__(self, intentos=5, espera_minima=0.05, espera_maxima=1.0):
+        self.intentos = intentos
+        self.espera_minima = espera_minima
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        self.estadisticas = {"reintentos": 0, "agotados": 0}
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        """Devuelve funcion(*args, **kwargs); cada intento debe abrir y cerrar su propia transacción"""
+        espera = self.espera_minima
+        for intento in range(1, self.intentos + 1):
+            try:
+                return funcion(*args, **kwargs)
+            except Exception as e:
+                if not es_bloqueo(e):
+                    raise
+                if intento == self.intentos:
+                    self._contar("agotados")
+                    raise
+                self._contar("reintentos")
+                time.sleep(random.uniform(0, espera))
+                espera = min(espera * 2, self.espera_maxima)
+
+    def _contar(self, clave):
+        with self._lock:
+            self.estadisticas[clave] += 1
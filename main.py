@@ -1,20 +1,14 @@
 import flet as ft
-import mysql.connector
 import pandas as pd
 import os
+import sys
+import threading
 import datetime
-import matplotlib
-# Configurar el backend 'Agg' de matplotlib (no requiere interfaz gráfica)
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split
 from io import BytesIO
 import base64
 import tempfile
@@ -22,174 +16,425 @@ import uuid
 import webbrowser
 import urllib.parse
 from datetime import date, timedelta
+from database.config import DB_CONFIG, DB_BACKEND, DB_SQLITE_PATH, DB_POOL_CONFIG
+from database.db_connection import PoolConexiones, SinConexionError
+from database.backends import crear_backend, dialecto, a_decimal
+from database.migrations import esquema_actualizado, migrar
+from database.indices import crear_indices, verificar_indices, imprimir_reporte
+from database.fechas import a_fecha, rango_dia, rango_anio, filtro_fecha
+from database.pedidos import (agrupar_cantidades, insertar_detalles, reservar_stock,
+                              faltantes_stock, diferencias_detalles, eliminar_detalles,
+                              actualizar_detalles, recalcular_total, bloquear_pedido,
+                              StockInsuficienteError)
+from database.reintentos import PoliticaReintentos, es_transitorio
+from database.importacion import importar_productos
+from database.bandeja import (BandejaPedidos, VaciadorBandeja, GUARDADO, RECHAZADO,
+                              EVENTO_GUARDADO, EVENTO_RECHAZADO)
+from utils.tareas import EjecutorTareas, TareaCancelada
+from utils.computo import renderizar_grafico, ajustar_prediccion
+from utils.facturas import ColaFacturas, ColaFacturasLlena, LISTA
+from utils.catalogo import CatalogoCache, EVENTO_STOCK, EVENTO_RECARGA
+from utils.instantanea import sql_firma
+from utils.eventos import CanalEventos
+from utils.carrito import Carrito, AGREGADA, ACTUALIZADA, QUITADA
+from utils.busqueda import BusquedaIncremental
+from utils.lista_virtual import ListaVirtual, CacheFilas
 
 PDF_DOWNLOADS = {}  # Diccionario para almacenar PDFs temporalmente
 
-# Configuración de la conexión a la base de datos
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'joacoelmascapo',
-    'database': 'distrisulpi'
-}
+# Bandeja local donde se escriben los pedidos antes de guardarlos en la base
+ORDER_OUTBOX_PATH = os.environ.get('ORDER_OUTBOX_PATH', 'pedidos_pendientes.db')
+
+# Instantánea del catálogo para arrancar sin esperar a la base (vacío la desactiva)
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', 'catalogo.snapshot')
+
+# Resultados máximos que muestra la búsqueda de productos
+MAX_SEARCH_RESULTS = int(os.environ.get('MAX_SEARCH_RESULTS', 200))
+
+# Reintentos de una transacción que choca por bloqueos (interbloqueo o espera agotada)
+DB_RETRY_ATTEMPTS = int(os.environ.get('DB_RETRY_ATTEMPTS', 5))
+DB_RETRY_BASE_DELAY = float(os.environ.get('DB_RETRY_BASE_DELAY', 0.05))
+DB_RETRY_MAX_DELAY = float(os.environ.get('DB_RETRY_MAX_DELAY', 1.0))
 
 # Clase principal para la aplicación
 class DistriSulpiApp:
+    """Núcleo de la aplicación, compartido por todas las sesiones del proceso"""
+
+    _instancia = None
+    _lock_instancia = threading.Lock()
+
     def __init__(self):
-        self.initialize_database()
+        self.backend = crear_backend(DB_BACKEND, DB_CONFIG, DB_SQLITE_PATH)
+        # Pool de conexiones compartido; no abre conexiones hasta el primer uso
+        self.pool = PoolConexiones(self.backend.conectar, **DB_POOL_CONFIG)
+        # Transacciones de pedidos que se repiten si chocan por bloqueos con otra sesión
+        self.reintentos = PoliticaReintentos(
+            intentos=DB_RETRY_ATTEMPTS,
+            espera_minima=DB_RETRY_BASE_DELAY,
+            espera_maxima=DB_RETRY_MAX_DELAY
+        )
+        # Pools de hilos y procesos para que los manejadores de la interfaz no bloqueen
+        self.tareas = EjecutorTareas()
+        # Avisos entre sesiones (por ejemplo, cambios de stock)
+        self.eventos = CanalEventos()
+        # Catálogo en memoria: las búsquedas no consultan la base
+        self.catalogo = CatalogoCache(
+            self._consultar_productos,
+            firma=self._consultar_firma_productos,
+            cargar_stock=self._consultar_stock,
+            ruta_instantanea=CATALOG_SNAPSHOT_PATH or None,
+            eventos=self.eventos
+        )
+        # Pedidos finalizados que esperan llegar a la base, y el hilo que los guarda
+        self.bandeja = BandejaPedidos(ORDER_OUTBOX_PATH)
+        self.vaciador = VaciadorBandeja(
+            self.bandeja,
+            lambda clave, cliente, zona, detalles, fecha: self.guardar_pedido(cliente, zona, detalles, fecha, clave),
+            guardar_lote=self.guardar_pedidos,
+            rechazos=(StockInsuficienteError,),
+            on_guardado=lambda clave, pedido_id: self.eventos.publicar(
+                EVENTO_GUARDADO, {"clave": clave, "pedido_id": pedido_id}),
+            on_rechazado=lambda clave, error: self.eventos.publicar(
+                EVENTO_RECHAZADO, {"clave": clave, "error": error})
+        )
+        # Facturas armadas en el pool de procesos, fuera del guardado del pedido
+        self.facturas = ColaFacturas(self.tareas, self.datos_factura)
+        self._inicializada = False
+        self._instantanea_sin_verificar = False
+        self._lock_bootstrap = threading.Lock()
+        self._servicios_iniciados = False
+        self._lock_servicios = threading.Lock()
+
+    @classmethod
+    def instancia(cls):
+        """Devuelve el núcleo del proceso, creándolo la primera vez"""
+        if cls._instancia is None:
+            with cls._lock_instancia:
+                if cls._instancia is None:
+                    cls._instancia = cls()
+        return cls._instancia
+
+    def preparar_base(self):
+        """Prepara la base de datos una sola vez por proceso; las sesiones posteriores no ejecutan DDL.
+
+        Si el catálogo arrancó desde la instantánea, se verifica contra la base
+        en cuanto la preparación sale bien, aunque no sea en el primer intento.
+        """
+        with self._lock_bootstrap:
+            if not self._inicializada:
+                self._inicializada = self.initialize_database()
+                if self._inicializada and self._instantanea_sin_verificar:
+                    self._instantanea_sin_verificar = False
+                    self.tareas.enviar(lambda tarea: self.catalogo.verificar_vigencia(),
+                                       nombre="verificar_catalogo")
+            return self._inicializada
+
+    def bootstrap(self):
+        """Arranque de la interfaz: prepara la base y, la primera vez, inicia los servicios en segundo plano.
+
+        python main.py --migrate usa solo preparar_base(), sin hilos que el
+        sys.exit cortaría a mitad de un pedido.
+        """
+        with self._lock_servicios:
+            if not self._servicios_iniciados:
+                self._servicios_iniciados = True
+                # El catálogo guardado queda disponible antes de tocar la base
+                # y se verifica cuando preparar_base() logre conectarse
+                self._instantanea_sin_verificar = self.catalogo.cargar_instantanea()
+                inicializada = self.preparar_base()
+                # Los pedidos que quedaron en la bandeja se envían aunque la base aún no responda
+                self.vaciador.iniciar()
+                return inicializada
+        return self.preparar_base()
         
     def initialize_database(self):
-        """Inicializa la base de datos si no existe"""
+        """Crea la base si no existe y aplica las migraciones pendientes"""
         try:
-            conn = mysql.connector.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password']
-            )
-            cursor = conn.cursor()
-            
             # Crear la base de datos si no existe
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']}")
-            
-            # Conectar a la base de datos
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            
-            # Crear tablas necesarias
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS productos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                nombre VARCHAR(255) NOT NULL,
-                precio_venta DECIMAL(10, 2) NOT NULL,
-                costo DECIMAL(10, 2) NOT NULL,
-                stock INT NOT NULL
-            )
-            """)
-            
-            # Modificación importante: Asegurarnos de que la tabla pedidos tenga la columna 'total'
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pedidos (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                cliente VARCHAR(255) NOT NULL,
-                zona VARCHAR(50) NOT NULL,
-                fecha DATETIME NOT NULL,
-                total DECIMAL(10, 2) NOT NULL
-            )
-            """)
-            
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detalle_pedido (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                pedido_id INT NOT NULL,
-                producto_id INT NOT NULL,
-                cantidad INT NOT NULL,
-                precio_unitario DECIMAL(10, 2) NOT NULL,
-                subtotal DECIMAL(10, 2) NOT NULL,
-                FOREIGN KEY (pedido_id) REFERENCES pedidos(id),
-                FOREIGN KEY (producto_id) REFERENCES productos(id)
-            )
-            """)
+            self.backend.crear_base()
             
-            conn.commit()
-            cursor.close()
+            # Conectar a la base de datos y verificar la versión del esquema
+            conn = self.get_db_connection()
+            if not esquema_actualizado(conn):
+                migrar(conn, self.backend.base)
             conn.close()
             print("Base de datos inicializada correctamente")
+            return True
         except Exception as e:
             print(f"Error al inicializar la base de datos: {e}")
+            return False
+
+    def revisar_indices(self, crear_faltantes=False):
+        """Informa índices faltantes o sin uso y, opcionalmente, crea los que falten"""
+        conn = self.get_db_connection()
+        if not conn:
+            return None
+        try:
+            if crear_faltantes:
+                creados = crear_indices(conn, self.backend.base)
+                print(f"Índices creados: {', '.join(creados) if creados else 'ninguno'}")
+            reporte = verificar_indices(conn, self.backend.base)
+            imprimir_reporte(reporte)
+            return reporte
+        finally:
+            conn.close()
 
     def get_db_connection(self):
-        """Establece una conexión a la base de datos"""
+        """Obtiene una conexión del pool compartido (close() la devuelve al pool)"""
         try:
-            return mysql.connector.connect(**DB_CONFIG)
+            return self.pool.obtener()
         except Exception as e:
             print(f"Error de conexión a la base de datos: {e}")
             return None
 
     def get_productos(self):
-        """Obtiene todos los productos de la base de datos"""
+        """Obtiene todos los productos (desde el catálogo en memoria)"""
+        return self.catalogo.productos()
+
+    def _consultar_productos(self):
+        """Lee todos los productos de la base de datos; None si no hay conexión"""
         conn = self.get_db_connection()
         if conn:
             cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT id, nombre, precio_venta, costo, stock FROM productos")
+            cursor.execute("SELECT id, nombre, precio_venta, costo, stock, codigo FROM productos")
             productos = cursor.fetchall()
             cursor.close()
             conn.close()
             return productos
-        return []
+        return None
+
+    def _consultar_stock(self, ids):
+        """Lee el stock actual de esos productos: {producto_id: stock}; None si no hay conexión"""
+        conn = self.get_db_connection()
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT id, stock FROM productos WHERE id IN ({', '.join(['%s'] * len(ids))})",
+                list(ids)
+            )
+            stock = {fila[0]: fila[1] for fila in cursor.fetchall()}
+            cursor.close()
+            conn.close()
+            return stock
+        return None
+
+    def _consultar_firma_productos(self):
+        """Firma de la tabla productos para validar la instantánea del catálogo; None si no hay conexión"""
+        conn = self.get_db_connection()
+        if conn:
+            cursor = conn.cursor()
+            # Una sola fila de agregados, calculada en la base (ver utils/instantanea.py)
+            cursor.execute(sql_firma(dialecto(cursor)))
+            firma = tuple(int(valor) for valor in cursor.fetchone())
+            cursor.close()
+            conn.close()
+            return firma
+        return None
 
     def get_zonas(self):
         """Devuelve las zonas disponibles"""
         return ["Bernal", "Avellaneda #1", "Avellaneda #2", "Quilmes", "Solano"]
 
-    def guardar_pedido(self, cliente, zona, detalles, fecha_personalizada=None):
-        """Guarda un pedido en la base de datos, con opción de fecha personalizada"""
+    def guardar_pedido(self, cliente, zona, detalles, fecha_personalizada=None, clave=None):
+        """Guarda un pedido en la base de datos, con opción de fecha personalizada.
+
+        Si el stock no alcanza no se guarda nada y se lanza StockInsuficienteError
+        con los faltantes por producto. Con 'clave', un pedido ya guardado con esa
+        clave no se vuelve a guardar: se devuelve su id. Un choque de bloqueos con
+        otra sesión repite la transacción (ver self.reintentos).
+
+        Devuelve None si la base no está disponible (error transitorio, ver
+        es_transitorio); cualquier otro error se propaga.
+        """
         try:
-            conn = self.get_db_connection()
-            cursor = conn.cursor()
-            
-            # Calcular el total del pedido
-            total_pedido = sum(item["subtotal"] for item in detalles)
+            return self.reintentos.ejecutar(self._guardar_pedido, cliente, zona, detalles,
+                                            fecha_personalizada, clave)
+        except Exception as e:
+            if not es_transitorio(e):
+                raise
+            print(f"Error al guardar el pedido: {e}")
+            return None
+
+    def _guardar_pedido(self, cliente, zona, detalles, fecha_personalizada, clave):
+        """Un intento de guardar el pedido, en una sola transacción; los errores se propagan"""
+        conn = self.get_db_connection()
+        if not conn:
+            raise SinConexionError()
+        cursor = conn.cursor()
+        try:
+            # Pedido repetido (doble clic, reintento): devolver el ya guardado sin tocar nada
+            existente = self._pedido_por_clave(cursor, clave) if clave else None
+            if existente:
+                return existente
             
-            # Verificar primero si la columna 'total' existe en la tabla pedidos
-            cursor.execute("""
-            SELECT COUNT(*) 
-            FROM information_schema.COLUMNS 
-            WHERE TABLE_SCHEMA = %s
-            AND TABLE_NAME = 'pedidos'
-            AND COLUMN_NAME = 'total'
-            """, (DB_CONFIG['database'],))
+            pedido_id = self._insertar_pedido(cursor, cliente, zona, detalles, fecha_personalizada, clave)
             
-            column_exists = cursor.fetchone()[0] > 0
+            # Reservar el stock en un solo UPDATE condicionado (productos en orden de id,
+            # los repetidos se suman) y después insertar todas las líneas en un solo INSERT
+            cantidades = agrupar_cantidades(detalles)
+            if not reservar_stock(cursor, cantidades):
+                conn.rollback()
+                faltantes = faltantes_stock(cursor, cantidades)
+                # El catálogo de las sesiones tenía un stock viejo: corregirlo
+                self.catalogo.fijar_stock({i: disponible for i, (_, disponible) in faltantes.items()})
+                raise StockInsuficienteError(faltantes)
+            insertar_detalles(cursor, pedido_id, detalles)
             
-            # Si la columna no existe, agregarla
-            if not column_exists:
-                cursor.execute("ALTER TABLE pedidos ADD COLUMN total DECIMAL(10, 2) NOT NULL")
-                print("Columna 'total' agregada a la tabla 'pedidos'")
+            conn.commit()
+            self.catalogo.aplicar_deltas_stock(cantidades)
+            return pedido_id
+        except StockInsuficienteError:
+            raise
+        except Exception:
+            conn.rollback()
+            # Con la misma clave guardándose a la vez, el índice único rechaza el segundo INSERT
+            existente = None
+            if clave:
+                try:
+                    existente = self._pedido_por_clave(cursor, clave)
+                except Exception:
+                    existente = None
+            if existente:
+                return existente
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def guardar_pedidos(self, pedidos):
+        """Guarda varios pedidos de la bandeja en una sola transacción (un solo commit).
+
+        'pedidos' es [(clave, cliente, zona, detalles, fecha)]; devuelve
+        {clave: pedido_id}, con los ya guardados incluidos. Es todo o nada: si el
+        stock no alcanza para el conjunto se lanza StockInsuficienteError sin
+        guardar ninguno, y quien llama puede guardarlos de a uno para saber
+        cuál rechazar. Devuelve None si la base no está disponible.
+        """
+        try:
+            return self.reintentos.ejecutar(self._guardar_pedidos, pedidos)
+        except Exception as e:
+            if not es_transitorio(e):
+                raise
+            print(f"Error al guardar los pedidos: {e}")
+            return None
+
+    def _guardar_pedidos(self, pedidos):
+        """Un intento de guardar el lote; mismo orden de bloqueo que un pedido suelto"""
+        conn = self.get_db_connection()
+        if not conn:
+            raise SinConexionError()
+        cursor = conn.cursor()
+        try:
+            ids = {}
+            nuevos = []
+            for clave, cliente, zona, detalles, fecha in pedidos:
+                existente = self._pedido_por_clave(cursor, clave)
+                if existente:
+                    ids[clave] = existente
+                    continue
+                ids[clave] = self._insertar_pedido(cursor, cliente, zona, detalles, fecha, clave)
+                nuevos.append((ids[clave], detalles))
             
-            # Determinar la fecha a usar (personalizada o actual)
-            fecha_pedido = fecha_personalizada if fecha_personalizada else datetime.datetime.now()
+            # Una sola reserva con las cantidades de todo el lote: los productos
+            # se toman en orden de id aunque los pedidos los mezclen
+            cantidades = agrupar_cantidades([item for _, detalles in nuevos for item in detalles])
+            if not reservar_stock(cursor, cantidades):
+                conn.rollback()
+                raise StockInsuficienteError(faltantes_stock(cursor, cantidades))
+            for pedido_id, detalles in nuevos:
+                insertar_detalles(cursor, pedido_id, detalles)
             
-            # Insertar el pedido
+            conn.commit()
+            self.catalogo.aplicar_deltas_stock(cantidades)
+            return ids
+        except StockInsuficienteError:
+            raise
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    def _insertar_pedido(self, cursor, cliente, zona, detalles, fecha, clave):
+        """Inserta la fila del pedido (sin líneas ni stock) y devuelve su id"""
+        total_pedido = sum(item["subtotal"] for item in detalles)
+        # Determinar la fecha a usar (personalizada o actual)
+        fecha_pedido = fecha if fecha else datetime.datetime.now()
+        cursor.execute(
+            "INSERT INTO pedidos (cliente, zona, fecha, total, clave) VALUES (%s, %s, %s, %s, %s)",
+            (cliente, zona, fecha_pedido, total_pedido, clave)
+        )
+        return cursor.lastrowid
+
+    def guardar_cambios_pedido(self, pedido_id, detalles):
+        """Aplica la edición de un pedido guardado; 'detalles' son sus líneas tal como quedaron.
+
+        La diferencia con lo guardado se calcula en memoria y se aplica con un
+        DELETE, un UPDATE y una reserva de stock, y el total se recalcula en la
+        base. Si el stock no alcanza para los aumentos no se cambia nada y se
+        lanza StockInsuficienteError. Un choque de bloqueos repite la transacción.
+        """
+        self.reintentos.ejecutar(self._guardar_cambios_pedido, pedido_id, detalles)
+        # La factura armada antes de la edición ya no corresponde
+        self.facturas.descartar(pedido_id)
+
+    def _guardar_cambios_pedido(self, pedido_id, detalles):
+        """Un intento de aplicar la edición, en una sola transacción; los errores se propagan"""
+        conn = self.get_db_connection()
+        if not conn:
+            raise SinConexionError()
+        cursor = conn.cursor()
+        try:
+            # Mismo orden de bloqueo que un pedido nuevo: pedido, productos por id, líneas
+            bloquear_pedido(cursor, pedido_id)
             cursor.execute(
-                "INSERT INTO pedidos (cliente, zona, fecha, total) VALUES (%s, %s, %s, %s)",
-                (cliente, zona, fecha_pedido, total_pedido)
+                """SELECT id, producto_id, cantidad, precio_unitario, subtotal
+                FROM detalle_pedido WHERE pedido_id = %s""",
+                (pedido_id,)
             )
+            actuales = {fila[0]: fila[1:] for fila in cursor.fetchall()}
+            a_eliminar, a_actualizar, cambios_stock = diferencias_detalles(actuales, detalles)
             
-            # Obtener el ID del pedido insertado
-            pedido_id = cursor.lastrowid
-            
-            # Insertar los detalles del pedido
-            for item in detalles:
-                cursor.execute(
-                    """INSERT INTO detalle_pedido 
-                    (pedido_id, producto_id, cantidad, precio_unitario, subtotal) 
-                    VALUES (%s, %s, %s, %s, %s)""",
-                    (pedido_id, item["producto_id"], item["cantidad"], 
-                     item["precio_unitario"], item["subtotal"])
-                )
-                
-                # Actualizar el stock
-                cursor.execute(
-                    "UPDATE productos SET stock = stock - %s WHERE id = %s",
-                    (item["cantidad"], item["producto_id"])
-                )
+            if not reservar_stock(cursor, cambios_stock):
+                conn.rollback()
+                faltantes = faltantes_stock(cursor, cambios_stock)
+                self.catalogo.fijar_stock({i: disponible for i, (_, disponible) in faltantes.items()})
+                raise StockInsuficienteError(faltantes)
+            eliminar_detalles(cursor, pedido_id, a_eliminar)
+            actualizar_detalles(cursor, pedido_id, a_actualizar)
+            recalcular_total(cursor, pedido_id)
             
             conn.commit()
+            self.catalogo.aplicar_deltas_stock(cambios_stock)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
             cursor.close()
             conn.close()
-            return pedido_id
-        except Exception as e:
-            print(f"Error al guardar el pedido: {e}")
-            if conn:
-                conn.rollback()
-                cursor.close()
-                conn.close()
-            return None
+
+    def _pedido_por_clave(self, cursor, clave):
+        """Id del pedido guardado con esa clave, o None"""
+        cursor.execute("SELECT id FROM pedidos WHERE clave = %s", (clave,))
+        fila = cursor.fetchone()
+        return fila[0] if fila else None
+
+    def encolar_pedido(self, cliente, zona, detalles, fecha=None, clave=None):
+        """Escribe el pedido en la bandeja local y devuelve su clave; la base se actualiza en segundo plano.
+
+        Encolar otra vez la misma clave no agrega nada: devuelve la entrada existente.
+        """
+        clave = self.bandeja.encolar(cliente, zona, detalles, fecha, clave)
+        self.vaciador.avisar()
+        return clave
 
     def cargar_csv_productos(self, file_path):
-        """Carga productos desde un archivo CSV a la base de datos"""
+        """Carga productos desde un archivo CSV a la base de datos (importación masiva)"""
+        conn = None
         try:
-            df = pd.read_csv(file_path)
+            # Los códigos se leen como texto para no perder ceros a la izquierda
+            df = pd.read_csv(file_path, dtype={"codigo": str})
             
             # Verificar que el CSV tenga las columnas necesarias
             required_columns = ["nombre", "precio_venta", "costo", "stock"]
@@ -197,25 +442,26 @@ class DistriSulpiApp:
                 return False, "El archivo CSV no tiene las columnas requeridas"
             
             conn = self.get_db_connection()
-            cursor = conn.cursor()
+            if not conn:
+                return False, "Error al importar CSV: no se pudo conectar a la base de datos"
             
-            # Insertar o actualizar productos
-            for _, row in df.iterrows():
-                cursor.execute(
-                    """INSERT INTO productos (nombre, precio_venta, costo, stock) 
-                    VALUES (%s, %s, %s, %s) 
-                    ON DUPLICATE KEY UPDATE 
-                    precio_venta = VALUES(precio_venta),
-                    costo = VALUES(costo), 
-                    stock = VALUES(stock)""",
-                    (row["nombre"], row["precio_venta"], row["costo"], row["stock"])
-                )
-            
-            conn.commit()
-            cursor.close()
+            # Cargar en una tabla temporal y combinar con productos en bloque
+            resultado = importar_productos(conn, df)
             conn.close()
-            return True, f"Se importaron {len(df)} productos correctamente"
+            # Los productos modificados se corrigen en el catálogo y se avisan a las sesiones;
+            # los nuevos tienen que entrar al índice de búsqueda, así que se recarga todo
+            if resultado['insertados'] or not self.catalogo.actualizar_productos(resultado['modificados']):
+                self.catalogo.refrescar()
+            importados = resultado['insertados'] + resultado['actualizados'] + resultado['sin_cambios']
+            mensaje = (f"Se importaron {importados} productos: {resultado['insertados']} nuevos, "
+                       f"{resultado['actualizados']} actualizados y {resultado['sin_cambios']} sin cambios")
+            if resultado['repetidos']:
+                mensaje += (f" ({resultado['repetidos']} filas descartadas por nombre repetido; "
+                            f"se usó la última de cada nombre)")
+            return True, mensaje
         except Exception as e:
+            if conn:
+                conn.close()
             return False, f"Error al importar CSV: {e}"
 
     def get_ventas_diarias(self, fecha_especifica=None):
@@ -225,17 +471,17 @@ class DistriSulpiApp:
             cursor = conn.cursor(dictionary=True)
             
             # Usar fecha específica o la actual
-            fecha_consulta = fecha_especifica.strftime("%Y-%m-%d") if fecha_especifica else datetime.datetime.now().strftime("%Y-%m-%d")
+            filtro, parametros = filtro_fecha("p.fecha", rango_dia(fecha_especifica))
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT p.id, p.cliente, p.zona, p.fecha, p.total,
                    pr.nombre as producto, dp.cantidad, dp.precio_unitario, dp.subtotal
             FROM pedidos p
             JOIN detalle_pedido dp ON p.id = dp.pedido_id
             JOIN productos pr ON dp.producto_id = pr.id
-            WHERE DATE(p.fecha) = %s
+            WHERE {filtro}
             ORDER BY p.fecha DESC
-            """, (fecha_consulta,))
+            """, parametros)
             
             ventas = cursor.fetchall()
             cursor.close()
@@ -259,70 +505,36 @@ class DistriSulpiApp:
             """, (fecha_inicio,))
             
             ventas = cursor.fetchall()
+            # SQLite devuelve DATE() como texto y SUM() como número; MySQL como date y Decimal
+            for venta in ventas:
+                venta["dia"] = a_fecha(venta["dia"])
+                venta["total_ventas"] = a_decimal(venta["total_ventas"])
             cursor.close()
             conn.close()
             return ventas
         return []
 
-    def generar_prediccion_ventas(self):
-        """Genera una predicción de ventas futuras basada en datos históricos"""
-        try:
-            # Obtener datos históricos de ventas
-            conn = self.get_db_connection()
+    def get_historial_ventas(self):
+        """Obtiene el total vendido por día de todo el historial: [(día, total)]"""
+        conn = self.get_db_connection()
+        if conn:
             cursor = conn.cursor()
-            
-            # Obtener todas las ventas para tener suficientes datos
             cursor.execute("""
             SELECT DATE(fecha) as dia, SUM(total) as total_ventas
             FROM pedidos
             GROUP BY DATE(fecha)
             ORDER BY dia
             """)
-            
-            resultados = cursor.fetchall()
+            resultados = [(a_fecha(dia), a_decimal(total)) for dia, total in cursor.fetchall()]
             cursor.close()
             conn.close()
-            
-            if len(resultados) < 10:  # Necesitamos suficientes datos para la predicción
-                return None, "No hay suficientes datos históricos para hacer una predicción precisa"
-            
-            # Preparar datos para el modelo
-            fechas = []
-            ventas = []
-            for dia, total in resultados:
-                if isinstance(dia, str):
-                    dia = datetime.datetime.strptime(dia, "%Y-%m-%d").date()
-                fechas.append((dia - resultados[0][0]).days)  # Convertir fechas a días desde la primera venta
-                ventas.append(float(total))
-            
-            # Convertir a arrays de NumPy
-            X = np.array(fechas).reshape(-1, 1)
-            y = np.array(ventas)
-            
-            # Dividir datos para entrenamiento y prueba
-            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-            
-            # Entrenar modelo de regresión lineal
-            model = LinearRegression()
-            model.fit(X_train, y_train)
-            
-            # Evaluar el modelo
-            score = model.score(X_test, y_test)
-            
-            # Predicción para los próximos 30 días
-            ultimo_dia = fechas[-1]
-            dias_futuros = np.array(range(ultimo_dia + 1, ultimo_dia + 31)).reshape(-1, 1)
-            predicciones = model.predict(dias_futuros)
-            
-            # Convertir días futuros a fechas reales
-            primer_dia = resultados[0][0]
-            fechas_futuras = [primer_dia + datetime.timedelta(days=int(dia)) for dia in dias_futuros.flatten()]
-            
-            return {
-                'fechas': fechas_futuras,
-                'predicciones': predicciones.tolist(),
-                'precision': score
-            }, "Predicción generada correctamente"
+            return resultados
+        return []
+
+    def generar_prediccion_ventas(self):
+        """Genera una predicción de ventas futuras basada en datos históricos"""
+        try:
+            return ajustar_prediccion(self.get_historial_ventas())
         except Exception as e:
             return None, f"Error al generar predicción: {e}"
     
@@ -341,6 +553,8 @@ class DistriSulpiApp:
             LIMIT %s
             """, (limit,))
             productos = cursor.fetchall()
+            for producto in productos:
+                producto["total_vendido"] = a_decimal(producto["total_vendido"], 0)
             cursor.close()
             conn.close()
             return productos
@@ -353,20 +567,20 @@ class DistriSulpiApp:
             cursor = conn.cursor(dictionary=True)
             
             # Usar fecha específica o la actual
-            fecha_consulta = fecha_especifica.strftime("%Y-%m-%d") if fecha_especifica else datetime.datetime.now().strftime("%Y-%m-%d")
+            filtro, parametros = filtro_fecha("ped.fecha", rango_dia(fecha_especifica))
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT SUM((dp.precio_unitario - p.costo) * dp.cantidad) as ganancia
             FROM pedidos ped
             JOIN detalle_pedido dp ON ped.id = dp.pedido_id
             JOIN productos p ON dp.producto_id = p.id
-            WHERE DATE(ped.fecha) = %s
-            """, (fecha_consulta,))
+            WHERE {filtro}
+            """, parametros)
             
             resultado = cursor.fetchone()
             cursor.close()
             conn.close()
-            return resultado['ganancia'] if resultado and resultado['ganancia'] is not None else 0
+            return a_decimal(resultado['ganancia']) if resultado and resultado['ganancia'] is not None else 0
         return 0
 
     def get_ganancia_anual(self):
@@ -374,20 +588,20 @@ class DistriSulpiApp:
         conn = self.get_db_connection()
         if conn:
             cursor = conn.cursor(dictionary=True)
-            current_year = datetime.datetime.now().year
+            filtro, parametros = filtro_fecha("ped.fecha", rango_anio())
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT SUM((dp.precio_unitario - p.costo) * dp.cantidad) as ganancia
             FROM pedidos ped
             JOIN detalle_pedido dp ON ped.id = dp.pedido_id
             JOIN productos p ON dp.producto_id = p.id
-            WHERE YEAR(ped.fecha) = %s
-            """, (current_year,))
+            WHERE {filtro}
+            """, parametros)
             
             resultado = cursor.fetchone()
             cursor.close()
             conn.close()
-            return resultado['ganancia'] if resultado and resultado['ganancia'] is not None else 0
+            return a_decimal(resultado['ganancia']) if resultado and resultado['ganancia'] is not None else 0
         return 0
 
     def get_facturacion_diaria(self, fecha_especifica=None):
@@ -397,18 +611,18 @@ class DistriSulpiApp:
             cursor = conn.cursor(dictionary=True)
             
             # Usar fecha específica o la actual
-            fecha_consulta = fecha_especifica.strftime("%Y-%m-%d") if fecha_especifica else datetime.datetime.now().strftime("%Y-%m-%d")
+            filtro, parametros = filtro_fecha("fecha", rango_dia(fecha_especifica))
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT SUM(total) as facturacion
             FROM pedidos
-            WHERE DATE(fecha) = %s
-            """, (fecha_consulta,))
+            WHERE {filtro}
+            """, parametros)
             
             resultado = cursor.fetchone()
             cursor.close()
             conn.close()
-            return resultado['facturacion'] if resultado and resultado['facturacion'] is not None else 0
+            return a_decimal(resultado['facturacion']) if resultado and resultado['facturacion'] is not None else 0
         return 0
 
     def get_facturacion_anual(self):
@@ -416,18 +630,18 @@ class DistriSulpiApp:
         conn = self.get_db_connection()
         if conn:
             cursor = conn.cursor(dictionary=True)
-            current_year = datetime.datetime.now().year
+            filtro, parametros = filtro_fecha("fecha", rango_anio())
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT SUM(total) as facturacion
             FROM pedidos
-            WHERE YEAR(fecha) = %s
-            """, (current_year,))
+            WHERE {filtro}
+            """, parametros)
             
             resultado = cursor.fetchone()
             cursor.close()
             conn.close()
-            return resultado['facturacion'] if resultado and resultado['facturacion'] is not None else 0
+            return a_decimal(resultado['facturacion']) if resultado and resultado['facturacion'] is not None else 0
         return 0
     
     def buscar_clientes(self, query):
@@ -450,134 +664,40 @@ class DistriSulpiApp:
             return [cliente["cliente"] for cliente in clientes]
         return []
     
-    def generar_pdf_factura(self, pedido_id):
-        """Genera un PDF con la factura del pedido"""
-        try:
-            # Crear directorio para PDFs si no existe
-            os.makedirs("temp", exist_ok=True)
-            
-            conn = self.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            # Obtener información del pedido
-            cursor.execute("""
-            SELECT p.*, c.cliente, c.zona, c.fecha, c.total as total_pedido
-            FROM detalle_pedido p
-            JOIN pedidos c ON p.pedido_id = c.id
-            WHERE p.pedido_id = %s
-            """, (pedido_id,))
-            
-            detalles = cursor.fetchall()
-            
-            if not detalles:
-                return None, "Pedido no encontrado"
-            
-            # Obtener nombres de productos
-            for detalle in detalles:
-                cursor.execute("SELECT nombre FROM productos WHERE id = %s", (detalle['producto_id'],))
-                producto = cursor.fetchone()
-                detalle['producto_nombre'] = producto['nombre'] if producto else "Producto desconocido"
-            
-            cursor.close()
-            conn.close()
-            
-            # Crear PDF en memoria
-            buffer = BytesIO()
-            doc = SimpleDocTemplate(buffer, pagesize=letter)
-            elements = []
-            
-            # Estilos
-            styles = getSampleStyleSheet()
-            
-            # Título y datos del cliente
-            elements.append(Paragraph(f"<b>DistriSulpi - Factura #{pedido_id}</b>", styles['Title']))
-            
-            # Información del cliente en formato de tabla para mejor presentación
-            data_cliente = [
-                [Paragraph("<b>Cliente:</b>", styles['Normal']), detalles[0]['cliente']],
-                [Paragraph("<b>Zona:</b>", styles['Normal']), detalles[0]['zona']],
-                [Paragraph("<b>Fecha:</b>", styles['Normal']), detalles[0]['fecha'].strftime('%d/%m/%Y %H:%M')],
-                [Paragraph("<b>Nro. Factura:</b>", styles['Normal']), f"#{pedido_id}"]
-            ]
-            
-            # Crear tabla de datos del cliente
-            tabla_cliente = Table(data_cliente, colWidths=[doc.width*0.3, doc.width*0.7])
-            tabla_cliente.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lavender),
-                ('TEXTCOLOR', (0, 0), (0, -1), colors.black),
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('BACKGROUND', (1, 0), (1, -1), colors.white),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ]))
-            
-            elements.append(tabla_cliente)
-            elements.append(Paragraph("<br/>", styles['Normal']))
-            
-            # Limitamos la longitud del nombre del producto si es necesario
-            max_chars = 30  # Limitar a 30 caracteres
-            data = [["Producto", "Cantidad", "Precio Unit.", "Subtotal"]]
-            
-            total = 0
-            for detalle in detalles:
-                # Limitar el nombre del producto si es demasiado largo
-                nombre_producto = detalle['producto_nombre']
-                if len(nombre_producto) > max_chars:
-                    nombre_producto = nombre_producto[:max_chars] + "..."
-                
-                data.append([
-                    nombre_producto,
-                    str(detalle['cantidad']),
-                    f"${detalle['precio_unitario']:.2f}",
-                    f"${detalle['subtotal']:.2f}"
-                ])
-                total += detalle['subtotal']
-            
-            # Agregar fila de total - corregir el formato para evitar etiquetas HTML
-            # Usamos texto simple y aplicamos estilos con TableStyle
-            data.append(["", "", "TOTAL", f"${total:.2f}"])
-            
-            # Crear tabla con anchos mejorados
-            col_widths = [doc.width*0.5, doc.width*0.1, doc.width*0.2, doc.width*0.2]
-            table = Table(data, colWidths=col_widths)
-            
-            # Aplicar estilos a la tabla para mejor visualización
-            table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
-                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-                # Alineaciones específicas por columna
-                ('ALIGN', (0, 0), (0, -1), 'LEFT'),     # Producto a la izquierda
-                ('ALIGN', (1, 0), (1, -1), 'CENTER'),   # Cantidad centrada
-                ('ALIGN', (2, 0), (3, -1), 'RIGHT'),    # Precios a la derecha
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                # Ajustar el formato de la fila de total
-                ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
-                ('GRID', (0, 0), (-1, -2), 1, colors.black),
-                ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-                ('GRID', (2, -1), (-1, -1), 1, colors.black),
-            ]))
-            
-            elements.append(table)
-    
-            
-            # Generar PDF
-            doc.build(elements)
-            
-            # Obtener el contenido del PDF
-            pdf_content = buffer.getvalue()
-            buffer.close()
-            
-            return pdf_content, "Factura generada correctamente"
-        except Exception as e:
-            return None, f"Error al generar factura: {e}"
+    def datos_factura(self, pedido_id):
+        """Consulta lo necesario para la factura (ver renderizar_factura), o None si el pedido no existe.
+
+        Sin conexión lanza SinConexionError, para no informar el pedido como inexistente.
+        """
+        conn = self.get_db_connection()
+        if not conn:
+            raise SinConexionError()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("""
+        SELECT p.producto_id, p.cantidad, p.precio_unitario, p.subtotal, c.cliente, c.zona, c.fecha
+        FROM detalle_pedido p
+        JOIN pedidos c ON p.pedido_id = c.id
+        WHERE p.pedido_id = %s
+        """, (pedido_id,))
+        detalles = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        if not detalles:
+            return None
+        
+        # Nombres de productos desde el catálogo en memoria, sin una consulta por renglón
+        lineas = []
+        for detalle in detalles:
+            producto = self.catalogo.obtener(detalle['producto_id'])
+            lineas.append((producto.nombre if producto else "Producto desconocido",
+                           detalle['cantidad'], detalle['precio_unitario'], detalle['subtotal']))
+        return {
+            "pedido_id": pedido_id,
+            "cliente": detalles[0]['cliente'],
+            "zona": detalles[0]['zona'],
+            "fecha": detalles[0]['fecha'],
+            "lineas": lineas
+        }
 
     def generar_pdf_pedidos_hoy(self, fecha_especifica=None):
         """Genera un PDF con todos los pedidos del día actual o una fecha específica"""
@@ -649,13 +769,14 @@ class DistriSulpiApp:
         conn = self.get_db_connection()
         if conn:
             cursor = conn.cursor(dictionary=True)
+            filtro, parametros = filtro_fecha("fecha", rango_dia(fecha))
             
-            cursor.execute("""
+            cursor.execute(f"""
             SELECT id, cliente, zona, fecha, total 
             FROM pedidos 
-            WHERE DATE(fecha) = %s
+            WHERE {filtro}
             ORDER BY fecha DESC
-            """, (fecha,))
+            """, parametros)
             
             pedidos = cursor.fetchall()
             cursor.close()
@@ -798,8 +919,9 @@ class DistriSulpiApp:
 
 # Implementación de la interfaz de usuario con Flet
 def main(page: ft.Page):
-    # Instancia de la aplicación
-    app = DistriSulpiApp()
+    # Núcleo compartido del proceso (la base ya se preparó al arrancar)
+    app = DistriSulpiApp.instancia()
+    app.bootstrap()
     
     # Configuración de la página con tema personalizado
     page.title = "DistriSulpi 📦"
@@ -828,8 +950,11 @@ def main(page: ft.Page):
     # Responsive design para móviles
     page.on_resize = lambda _: page.update()
     
-    # Variables para el pedido actual
-    current_order = []
+    # Variables para el pedido actual (líneas por producto; la tabla se actualiza con sus avisos)
+    carrito = Carrito()
+    # Clave del carrito (se crea con el primer producto): si el mismo pedido se
+    # envía dos veces, la bandeja y la base lo guardan una sola vez
+    clave_carrito = None
     cliente_actual = ""
     zona_actual = ""
     fecha_pedido = datetime.datetime.now()  # Nueva variable para la fecha personalizada
@@ -837,6 +962,13 @@ def main(page: ft.Page):
     # Para prevenir la carga múltiple de componentes
     components_loaded = False
     
+    # Evita guardar dos veces el mismo pedido mientras se procesa en segundo plano
+    guardando_pedido = False
+    
+    # Tareas en segundo plano de los paneles (para cancelarlas si se vuelven a pedir)
+    tarea_estadisticas = None
+    tarea_prediccion = None
+    
     # Referencia a la página principal para menú lateral
     principal_view = None
     
@@ -869,11 +1001,27 @@ def main(page: ft.Page):
         on_change=lambda e: set_zona(e.control.value)
     )
     
-    # Campo para buscar productos
+    # Búsqueda de productos de esta sesión: espera a que el operador deje de
+    # escribir y solo publica el resultado de la última consulta
+    busqueda_productos = BusquedaIncremental(
+        app.catalogo,
+        lambda query, productos: mostrar_productos(query, productos),
+        limite=MAX_SEARCH_RESULTS
+    )
+    
+    # Modo escáner: el campo de búsqueda recibe códigos de barras y cada Enter agrega el producto
+    modo_escaner = ft.Switch(
+        label="Modo escáner",
+        value=False,
+        on_change=lambda e: cambiar_modo_escaner(e.control.value)
+    )
+    
+    # Campo para buscar productos (Enter con un código exacto agrega el producto)
     producto_search = ft.TextField(
         label="Buscar Producto",
         width=page.width - 20 if page.width < 600 else 400,
-        on_change=lambda e: filtrar_productos(e.control.value)
+        on_change=lambda e: None if modo_escaner.value else busqueda_productos.escribir(e.control.value),
+        on_submit=lambda e: agregar_por_codigo(e.control.value or "")
     )
     
     # Lista de productos
@@ -885,6 +1033,30 @@ def main(page: ft.Page):
         visible=False  # Inicialmente oculta
     )
     
+    # Alto de cada fila de producto con sus márgenes: la lista virtual necesita filas de alto fijo
+    ALTO_FILA_MOVIL = 49
+    ALTO_FILA_ESCRITORIO = 120
+    
+    def clave_fila_producto(producto):
+        """Datos que cambian el dibujo de una fila; si no cambian, la fila se reutiliza"""
+        stock = producto.stock
+        nivel_stock = 2 if stock > 10 else 1 if stock > 0 else 0
+        return (producto.nombre, producto.precio_centavos, nivel_stock, page.width < 800)
+    
+    def actualizar_fila_producto(fila, producto):
+        """Corrige en el lugar el stock de una fila reutilizada"""
+        fila.data.value = f"Stock: {producto.stock}"
+    
+    # Filas ya construidas de esta sesión, reutilizadas entre búsquedas
+    filas_producto = CacheFilas(
+        lambda producto: construir_fila_producto(producto),
+        clave_fila_producto,
+        actualizar_fila_producto
+    )
+    
+    # Lista virtual: solo se construyen las filas visibles, aunque el catálogo sea enorme
+    lista_productos = ListaVirtual(productos_list, filas_producto.obtener, ALTO_FILA_ESCRITORIO)
+    
     # Cantidad de producto
     cantidad_field = ft.TextField(
         label="Cantidad",
@@ -968,29 +1140,36 @@ def main(page: ft.Page):
             progress_dlg.open = True
             page.update()
             
-            # Procesar CSV
-            success, message = app.cargar_csv_productos(file_path)
-            
-            # Cerrar diálogo de progreso
-            progress_dlg.open = False
-            page.update()
-            
-            # Mostrar resultado
-            result_dlg = ft.AlertDialog(
-                title=ft.Text("Resultado de importación"),
-                content=ft.Text(message),
-                actions=[
-                    ft.TextButton("Aceptar", on_click=lambda _: close_dlg(result_dlg))
-                ],
-                modal=True
+            def mostrar_resultado(resultado):
+                success, message = resultado
+                
+                # Cerrar diálogo de progreso
+                progress_dlg.open = False
+                
+                # Mostrar resultado
+                result_dlg = ft.AlertDialog(
+                    title=ft.Text("Resultado de importación"),
+                    content=ft.Text(message),
+                    actions=[
+                        ft.TextButton("Aceptar", on_click=lambda _: close_dlg(result_dlg))
+                    ],
+                    modal=True
+                )
+                
+                page.dialog = result_dlg
+                result_dlg.open = True
+                page.update()
+                
+                # Actualizar lista de productos
+                filtrar_productos("")
+            
+            # Procesar CSV en segundo plano; la sesión sigue respondiendo
+            app.tareas.enviar(
+                lambda tarea: app.cargar_csv_productos(file_path),
+                nombre="importar_csv",
+                on_resultado=mostrar_resultado,
+                on_error=lambda error: mostrar_resultado((False, f"Error al importar CSV: {error}"))
             )
-            
-            page.dialog = result_dlg
-            result_dlg.open = True
-            page.update()
-            
-            # Actualizar lista de productos
-            filtrar_productos("")
     
     # Campo para cargar CSV
     csv_upload = ft.FilePicker(on_result=on_csv_selected)
@@ -1169,17 +1348,12 @@ def main(page: ft.Page):
         configurar_tabla_pedido_responsivo()
         
         # Actualizar si hay productos en el pedido
-        if current_order:
+        if carrito:
             actualizar_tabla_pedido()
-            
-            # Mostrar panel flotante si hay productos
-            if hasattr(page, 'panel_flotante') and page.panel_flotante is not None:
-                total = sum(item["subtotal"] for item in current_order)
-                actualizar_panel_flotante(total)
         
         # Mostrar el panel flotante desde el principio si hay productos
         if is_mobile and hasattr(page, 'panel_flotante') and page.panel_flotante is not None:
-            if len(current_order) > 0:
+            if len(carrito) > 0:
                 page.panel_flotante.visible = True
                 page.panel_flotante.update()
             else:
@@ -1187,94 +1361,114 @@ def main(page: ft.Page):
                 page.panel_flotante.update()
         
         # Mostrar u ocultar contenedor de fecha
-        if current_order:
+        if carrito:
             fecha_pedido_container.visible = True
         else:
             fecha_pedido_container.visible = False
         fecha_pedido_container.update()
     
-    def add_product_to_list(producto):
+    def cantidad_pedida():
+        """Cantidad indicada en el campo de cantidad (1 si está vacío o no es válida)"""
+        try:
+            if cantidad_field.value:
+                cantidad = int(cantidad_field.value)
+                if cantidad > 0:
+                    return cantidad
+        except:
+            pass
+        return 1
+    
+    def vaciar_carrito():
+        """Vacía el pedido actual; el próximo producto inicia un carrito con clave nueva"""
+        nonlocal clave_carrito
+        clave_carrito = None
+        carrito.vaciar()
+    
+    def descartar_clave_carrito(clave):
+        """La bandeja rechazó el pedido con esa clave: volver a enviar el carrito usa una clave nueva"""
+        nonlocal clave_carrito
+        if clave_carrito == clave:
+            clave_carrito = None
+    
+    def restaurar_pedido_rechazado(clave, error):
+        """Vuelve a cargar en el carrito un pedido rechazado cuyo diálogo ya se cerró, para corregirlo"""
+        datos = app.bandeja.pedido(clave)
+        if not datos:
+            return
+        
+        def restaurar(_=None):
+            nonlocal cliente_actual, zona_actual
+            vaciar_carrito()
+            for linea in datos["detalles"]:
+                carrito.agregar(linea["producto_id"], linea["producto_nombre"],
+                                linea["cantidad"], linea["precio_unitario"])
+            cliente_actual = cliente_field.value = datos["cliente"]
+            zona_actual = zona_dropdown.value = datos["zona"]
+            page.update()
+        
+        mensaje = f"Pedido de {datos['cliente']} no guardado: {error}"
+        if not carrito:
+            restaurar()
+            page.snack_bar = ft.SnackBar(content=ft.Text(f"{mensaje}. Se volvió a cargar para corregirlo"))
+        else:
+            # Hay otro pedido en curso: no reemplazarlo sin que el operador lo pida
+            page.snack_bar = ft.SnackBar(content=ft.Text(mensaje), action="Restaurar",
+                                         on_action=restaurar, duration=15000)
+        page.snack_bar.open = True
+        page.update()
+    
+    def agregar_al_pedido(producto, cantidad):
+        """Agrega el producto al pedido actual (o suma la cantidad si ya estaba); devuelve True si lo agregó"""
+        nonlocal clave_carrito
+        # Usar el registro vigente del catálogo: la lista pudo dibujarse
+        # antes de una venta de otra sesión o de una importación
+        actual = app.catalogo.obtener(producto.id) or producto
+        
+        # Verificar stock, contando lo que ya está en el pedido
+        linea = carrito.obtener(actual.id)
+        en_pedido = linea["cantidad"] if linea else 0
+        if en_pedido + cantidad > actual.stock:
+            page.snack_bar = ft.SnackBar(content=ft.Text(f"Stock insuficiente. Disponible: {actual.stock}"))
+            page.snack_bar.open = True
+            page.update()
+            return False
+            
+        precio = actual.precio_venta
+        
+        # Actualizar campo de precio
+        precio_field.value = str(precio)
+        precio_field.update()
+        
+        # Si ya está en el pedido se suma la cantidad; la tabla y el panel se actualizan con el aviso del carrito
+        if not carrito or clave_carrito is None:
+            clave_carrito = str(uuid.uuid4())
+        carrito.agregar(actual.id, actual.nombre, cantidad, precio)
+            
+        # Notificar
+        page.snack_bar = ft.SnackBar(
+            content=ft.Text(f"Agregado: {actual.nombre}"),
+            bgcolor=ft.Colors.GREEN
+        )
+        page.snack_bar.open = True
+        
+        # Restablecer cantidad a 1 para el próximo producto
+        cantidad_field.value = "1"
+        cantidad_field.update()
+        
+        # Ocultar lista de productos después de agregar (solo en móvil)
+        is_mobile = page.width < 800
+        if is_mobile:
+            productos_list.visible = False
+            productos_list.update()
+        
+        return True
+    
+    def construir_fila_producto(producto):
+        """Construye el control de una fila de la lista de productos"""
         # Función interna para manejar el clic en el producto
         def on_producto_click(e):
             try:
-                # Obtener cantidad actual
-                cantidad = 1
-                try:
-                    if cantidad_field.value:
-                        cantidad = int(cantidad_field.value)
-                        if cantidad <= 0:
-                            cantidad = 1
-                except:
-                    cantidad = 1
-                    
-                # Verificar stock
-                if cantidad > producto["stock"]:
-                    page.snack_bar = ft.SnackBar(content=ft.Text(f"Stock insuficiente. Disponible: {producto['stock']}"))
-                    page.snack_bar.open = True
-                    page.update()
-                    return
-                    
-                # Calcular subtotal
-                precio = float(producto["precio_venta"])
-                subtotal = precio * cantidad
-                
-                # Actualizar campo de precio
-                precio_field.value = str(precio)
-                precio_field.update()
-                
-                # Verificar si ya existe en el pedido
-                encontrado = False
-                for i, item in enumerate(current_order):
-                    if item["producto_id"] == producto["id"]:
-                        # Actualizar cantidad
-                        current_order[i]["cantidad"] += cantidad
-                        current_order[i]["subtotal"] = current_order[i]["cantidad"] * current_order[i]["precio_unitario"]
-                        encontrado = True
-                        break
-                        
-                # Si no se encontró, agregar como nuevo
-                if not encontrado:
-                    current_order.append({
-                        "producto_id": producto["id"],
-                        "producto_nombre": producto["nombre"],
-                        "cantidad": cantidad,
-                        "precio_unitario": precio,
-                        "subtotal": subtotal
-                    })
-                    
-                # Notificar
-                page.snack_bar = ft.SnackBar(
-                    content=ft.Text(f"Agregado: {producto['nombre']}"),
-                    bgcolor=ft.Colors.GREEN
-                )
-                page.snack_bar.open = True
-                
-                # Actualizar tabla de pedidos
-                try:
-                    actualizar_tabla_pedido()
-                    pedido_actual_table.update()
-                except Exception as e:
-                    print(f"Error actualizando tabla: {e}")
-                
-                # Mostrar panel flotante con la información actualizada
-                total = sum(item["subtotal"] for item in current_order)
-                actualizar_panel_flotante(total)
-                
-                # Mostrar el contenedor de fecha si es el primer producto
-                if len(current_order) == 1:
-                    fecha_pedido_container.visible = True
-                    fecha_pedido_container.update()
-                
-                # Restablecer cantidad a 1 para el próximo producto
-                cantidad_field.value = "1"
-                cantidad_field.update()
-                
-                # Ocultar lista de productos después de agregar (solo en móvil)
-                is_mobile = page.width < 800
-                if is_mobile:
-                    productos_list.visible = False
-                    productos_list.update()
-                
+                agregar_al_pedido(producto, cantidad_pedida())
             except Exception as e:
                 page.snack_bar = ft.SnackBar(content=ft.Text(f"Error: {str(e)}"))
                 page.snack_bar.open = True
@@ -1285,14 +1479,19 @@ def main(page: ft.Page):
         
         if is_mobile:
             # VERSIÓN MÓVIL COMPACTA - Elementos más pequeños
-            productos_list.controls.append(
+            texto_stock = ft.Text(f"Stock: {producto.stock}", 
+                color=ft.Colors.GREEN if producto.stock > 10 
+                else ft.Colors.ORANGE if producto.stock > 0 
+                else ft.Colors.RED,
+                size=10)  # Texto más pequeño
+            fila = (
                 ft.Container(
                     content=ft.Row([
                         # Icono más pequeño
                         ft.Icon(
                             ft.Icons.INVENTORY_2, 
-                            color=ft.Colors.GREEN if producto["stock"] > 10 
-                            else ft.Colors.ORANGE if producto["stock"] > 0 
+                            color=ft.Colors.GREEN if producto.stock > 10 
+                            else ft.Colors.ORANGE if producto.stock > 0 
                             else ft.Colors.RED,
                             size=16  # Icono más pequeño
                         ),
@@ -1300,7 +1499,7 @@ def main(page: ft.Page):
                         ft.Column([
                             # Nombre del producto (más pequeño)
                             ft.Text(
-                                producto["nombre"][:20] + ('...' if len(producto["nombre"]) > 20 else ''),
+                                producto.nombre[:20] + ('...' if len(producto.nombre) > 20 else ''),
                                 size=12,  # Texto más pequeño
                                 weight=ft.FontWeight.BOLD,
                                 overflow=ft.TextOverflow.ELLIPSIS,
@@ -1308,15 +1507,11 @@ def main(page: ft.Page):
                             ),
                             # Precio y stock en una fila horizontal para ahorrar espacio
                             ft.Row([
-                                ft.Text(f"${producto['precio_venta']:.1f}", 
+                                ft.Text(f"${producto.precio_venta:.1f}", 
                                     color=ft.Colors.BLUE,
                                     size=11),  # Texto más pequeño
                                 ft.Text(" | ", color=ft.Colors.GREY, size=10),
-                                ft.Text(f"Stock: {producto['stock']}", 
-                                    color=ft.Colors.GREEN if producto["stock"] > 10 
-                                    else ft.Colors.ORANGE if producto["stock"] > 0 
-                                    else ft.Colors.RED,
-                                    size=10)  # Texto más pequeño
+                                texto_stock
                             ], spacing=2)
                         ], 
                         spacing=2,  # Reducir espaciado
@@ -1345,45 +1540,50 @@ def main(page: ft.Page):
             )
         else:
             # VERSIÓN ESCRITORIO - Sin cambios (mantener el diseño original)
-            productos_list.controls.append(
+            texto_stock = ft.Text(f"Stock: {producto.stock}", 
+                color=ft.Colors.GREEN if producto.stock > 10 
+                else ft.Colors.ORANGE if producto.stock > 0 
+                else ft.Colors.RED)
+            fila = (
                 ft.Container(
                     content=ft.ListTile(
                         leading=ft.Icon(ft.Icons.INVENTORY_2, 
-                                    color=ft.Colors.GREEN if producto["stock"] > 10 
-                                    else ft.Colors.ORANGE if producto["stock"] > 0 
+                                    color=ft.Colors.GREEN if producto.stock > 10 
+                                    else ft.Colors.ORANGE if producto.stock > 0 
                                     else ft.Colors.RED),
                         title=ft.Text(
-                            producto["nombre"], 
+                            producto.nombre, 
                             size=16, 
                             weight=ft.FontWeight.BOLD,
                             overflow=ft.TextOverflow.ELLIPSIS,
                         ),
                         subtitle=ft.Column([
-                            ft.Text(f"${producto['precio_venta']:.2f}", 
+                            ft.Text(f"${producto.precio_venta:.2f}", 
                                 color=ft.Colors.BLUE),
-                            ft.Text(f"Stock: {producto['stock']}", 
-                                color=ft.Colors.GREEN if producto["stock"] > 10 
-                                else ft.Colors.ORANGE if producto["stock"] > 0 
-                                else ft.Colors.RED)
+                            texto_stock
                         ]),
                         on_click=on_producto_click
                     ),
                     border=ft.border.all(1, ft.Colors.BLACK26),
                     border_radius=10,
                     margin=5,
-                    padding=10
+                    padding=10,
+                    height=ALTO_FILA_ESCRITORIO - 10  # Altura fija (sin márgenes) para la lista virtual
                 )
             )
+        
+        # El texto del stock queda a mano para corregirlo sin reconstruir la fila
+        fila.data = texto_stock
+        return fila
 
     # También necesitas modificar la función filtrar_productos para aumentar ligeramente la altura en móvil
     def filtrar_productos(query):
-        try:
-            productos_list.controls.clear()
-            productos_list.update()  # Actualizar la lista primero
-        except:
-            pass  # Ignorar errores de limpieza
-        
-        # Resto del código igual...
+        """Busca y muestra los productos en el momento, sin esperar al operador"""
+        busqueda_productos.cancelar()
+        mostrar_productos(query, busqueda_productos.buscar(query))
+    
+    def mostrar_productos(query, productos):
+        """Dibuja en productos_list el resultado de una búsqueda"""
         is_mobile = page.width < 800
         if is_mobile:
             if query:
@@ -1392,48 +1592,106 @@ def main(page: ft.Page):
             else:
                 productos_list.visible = False
         
-        # Mostrar la lista solo si hay texto para filtrar (en móvil)
-        productos_list.controls = []  # Usar esto en su lugar
-        productos = app.get_productos()
-        
         if not query:
-            if not is_mobile:  # En escritorio siempre mostramos productos
-                for producto in productos:
-                    add_product_to_list(producto)
+            # En escritorio siempre mostramos productos; en móvil la lista solo aparece al buscar
+            elementos = [] if is_mobile else app.get_productos()
         else:
-            query = query.lower()
-            for producto in productos:
-                if query in producto["nombre"].lower():
-                    add_product_to_list(producto)
+            # Resultado del índice del catálogo, ordenado por relevancia
+            elementos = productos
+        
+        # Solo se construyen las filas de la ventana visible
+        lista_productos.mostrar(elementos, ALTO_FILA_MOVIL if is_mobile else ALTO_FILA_ESCRITORIO)
         
         # Actualizar la página
         page.update()
     
+    def agregar_por_codigo(codigo):
+        """Agrega el producto cuyo código coincide exactamente, sin pasar por la búsqueda por nombre"""
+        producto = app.catalogo.buscar_codigo(codigo)
+        if producto is None:
+            if not modo_escaner.value:
+                # Enter sin código conocido: buscar por nombre en el momento
+                filtrar_productos(codigo)
+                return
+            page.snack_bar = ft.SnackBar(content=ft.Text(f"Código no encontrado: {codigo.strip()}"))
+            page.snack_bar.open = True
+        else:
+            busqueda_productos.cancelar()
+            try:
+                agregar_al_pedido(producto, cantidad_pedida())
+            except Exception as e:
+                page.snack_bar = ft.SnackBar(content=ft.Text(f"Error: {str(e)}"))
+                page.snack_bar.open = True
+        
+        # Dejar el campo listo para el próximo código
+        producto_search.value = ""
+        producto_search.focus()
+        page.update()
+    
+    def cambiar_modo_escaner(activo):
+        """Alterna el campo de búsqueda entre nombres y códigos de barras"""
+        busqueda_productos.cancelar()
+        producto_search.label = "Escanear código" if activo else "Buscar Producto"
+        producto_search.value = ""
+        producto_search.focus()
+        filtrar_productos("")
+    
+    def on_stock_cambiado(stock):
+        """Corrige las filas visibles de los productos vendidos o editados en cualquier sesión"""
+        try:
+            if lista_productos.actualizar(stock):
+                productos_list.update()
+        except Exception as e:
+            print(f"Error actualizando el stock en pantalla: {e}")
+    
+    def on_catalogo_recargado(_version):
+        """El catálogo se reemplazó completo (importación con productos nuevos): repetir la búsqueda actual"""
+        try:
+            filtrar_productos(producto_search.value or "")
+        except Exception as e:
+            print(f"Error actualizando la lista de productos: {e}")
+    
+    # Suscripciones de esta sesión; se quitan cuando la sesión se cierra
+    # (una desconexión momentánea puede reconectarse y seguir recibiendo avisos)
+    suscripciones = [
+        app.eventos.suscribir(EVENTO_STOCK, on_stock_cambiado),
+        app.eventos.suscribir(EVENTO_RECARGA, on_catalogo_recargado),
+        app.eventos.suscribir(EVENTO_GUARDADO, lambda datos: resolver_pedido(datos["clave"], datos["pedido_id"], None)),
+        app.eventos.suscribir(EVENTO_RECHAZADO, lambda datos: resolver_pedido(datos["clave"], None, datos["error"]))
+    ]
+    
+    def on_cerrar_sesion(_):
+        busqueda_productos.cancelar()
+        for token in suscripciones:
+            app.eventos.desuscribir(token)
+    
+    page.on_disconnect = lambda _: busqueda_productos.cancelar()
+    page.on_close = on_cerrar_sesion
+    
     # MODIFICACIÓN: Nueva función para actualizar cantidad directa desde la tabla
-    def actualizar_cantidad_directa(nueva_cantidad, index):
+    def actualizar_cantidad_directa(nueva_cantidad, producto_id):
         try:
             cantidad = int(nueva_cantidad)
             if cantidad <= 0:
                 raise ValueError("Cantidad debe ser mayor a 0")
             
-            # Actualizar cantidad y subtotal
-            current_order[index]["cantidad"] = cantidad
-            current_order[index]["subtotal"] = cantidad * current_order[index]["precio_unitario"]
+            # Actualizar cantidad y subtotal (el carrito avisa y se modifica solo esa fila)
+            item = carrito.fijar_cantidad(producto_id, cantidad)
             
             # Notificar al usuario del cambio
             page.snack_bar = ft.SnackBar(
-                content=ft.Text(f"Cantidad actualizada: {current_order[index]['producto_nombre']}")
+                content=ft.Text(f"Cantidad actualizada: {item['producto_nombre']}")
             )
             page.snack_bar.open = True
-            
-            # Actualizar tabla
-            actualizar_tabla_pedido()
+            page.update()
             
         except ValueError as e:
             page.snack_bar = ft.SnackBar(content=ft.Text(f"Error: {e}"))
             page.snack_bar.open = True
             # Revertir al valor anterior
-            actualizar_tabla_pedido()
+            celdas = filas_pedido.get(producto_id)
+            if celdas is not None:
+                actualizar_fila_pedido(celdas, carrito.obtener(producto_id))
             page.update()
     
     def actualizar_panel_flotante(total=0):
@@ -1444,10 +1702,10 @@ def main(page: ft.Page):
         # Actualizar información del panel
         if hasattr(page, 'lbl_total_flotante'):
             page.lbl_total_flotante.value = f"Total: ${total:.2f}"
-            page.lbl_productos_flotante.value = f"{len(current_order)} productos"
+            page.lbl_productos_flotante.value = f"{len(carrito)} productos"
             
             # Mostrar u ocultar el panel según si hay productos
-            if len(current_order) > 0:
+            if len(carrito) > 0:
                 page.panel_flotante.visible = True
             else:
                 page.panel_flotante.visible = False
@@ -1461,7 +1719,7 @@ def main(page: ft.Page):
 
     def mostrar_pedido_completo():
         """Muestra un diálogo con el pedido actual completo"""
-        if not current_order:
+        if not carrito:
             page.snack_bar = ft.SnackBar(content=ft.Text("No hay productos en el pedido"))
             page.snack_bar.open = True
             page.update()
@@ -1479,7 +1737,7 @@ def main(page: ft.Page):
         )
         
         # Agregar filas con los productos
-        for i, item in enumerate(current_order):
+        for i, item in enumerate(carrito):
             tabla_completa.rows.append(
                 ft.DataRow(
                     cells=[
@@ -1492,8 +1750,7 @@ def main(page: ft.Page):
                 )
             )
         
-        # Calcular total
-        total = sum(item["subtotal"] for item in current_order)
+        total = carrito.total
         
         # Agregar fila de total
         tabla_completa.rows.append(
@@ -1649,137 +1906,203 @@ def main(page: ft.Page):
             print(f"Error creando enlace de descarga: {e}")
             return None
     
-    # MODIFICACIÓN: Actualizar tabla de pedidos con edición directa de cantidad
-    def actualizar_tabla_pedido():
-        """Actualiza la tabla de pedidos con mejor visualización para móviles"""
-        try:
-            pedido_actual_table.rows.clear()
-        except:
-            pedido_actual_table.rows = []
-        
+    # Filas de la tabla del pedido por producto_id: cada cambio del carrito modifica solo su fila
+    filas_pedido = {}
+    fila_total_pedido = None
+    
+    def color_fila_pedido(i):
+        """Fondo alternado de la fila i en móvil, para mejor visibilidad"""
+        return ft.Colors.with_opacity(0.03, ft.Colors.BLUE_100) if i % 2 == 0 else None
+    
+    def construir_fila_pedido(item, i):
+        """Arma la fila del producto; devuelve {"fila", "cantidad", "precio", "subtotal"} para modificarla después"""
         # Detectar si estamos en móvil
         is_mobile = page.width < 800
+        producto_id = item["producto_id"]
         
-        for i, item in enumerate(current_order):
-            # Cantidad para editar - hacer más compacto
-            cantidad_campo = ft.TextField(
-                value=str(item["cantidad"]),
-                width=40 if is_mobile else 60,  # Reducir ancho en móvil
-                height=30 if is_mobile else None,
-                text_align=ft.TextAlign.CENTER,
-                border_color=ft.Colors.BLUE_200,
-                keyboard_type=ft.KeyboardType.NUMBER,
-                on_submit=lambda e, idx=i: actualizar_cantidad_directa(e.control.value, idx),
-                text_size=12 if is_mobile else None  # Texto más pequeño
+        # Cantidad para editar - hacer más compacto
+        cantidad_campo = ft.TextField(
+            value=str(item["cantidad"]),
+            width=40 if is_mobile else 60,  # Reducir ancho en móvil
+            height=30 if is_mobile else None,
+            text_align=ft.TextAlign.CENTER,
+            border_color=ft.Colors.BLUE_200,
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_submit=lambda e, pid=producto_id: actualizar_cantidad_directa(e.control.value, pid),
+            text_size=12 if is_mobile else None  # Texto más pequeño
+        )
+        
+        # Botón de eliminar más pequeño en móvil
+        boton_eliminar = ft.IconButton(
+            icon=ft.Icons.DELETE,
+            tooltip="Eliminar",
+            on_click=lambda _, pid=producto_id: eliminar_item_pedido(pid),
+            icon_color=ft.Colors.RED,
+            icon_size=16 if is_mobile else 20  # Tamaño más pequeño en móvil
+        )
+        
+        if is_mobile:
+            # Versión móvil con 4 columnas compactas; precio con 1 decimal
+            precio_texto = ft.Text(f"${item['precio_unitario']:.1f}", size=11)
+            fila = ft.DataRow(
+                cells=[
+                    # Nombre producto (más estrecho)
+                    ft.DataCell(
+                        ft.Text(
+                            item["producto_nombre"][:12] + ('...' if len(item["producto_nombre"]) > 12 else ''),  # Acortar más
+                            overflow=ft.TextOverflow.ELLIPSIS,
+                            max_lines=1,
+                            size=11  # Texto más pequeño
+                        )
+                    ),
+                    ft.DataCell(cantidad_campo),
+                    ft.DataCell(precio_texto),
+                    # Botón eliminar separado para asegurar que sea visible
+                    ft.DataCell(boton_eliminar)
+                ],
+                # Alternar colores para mejor visibilidad
+                color=color_fila_pedido(i)
             )
-            
-            # Botón de eliminar más pequeño en móvil
-            boton_eliminar = ft.IconButton(
-                icon=ft.Icons.DELETE,
-                tooltip="Eliminar",
-                on_click=lambda _, idx=i: eliminar_item_pedido(idx),
-                icon_color=ft.Colors.RED,
-                icon_size=16 if is_mobile else 20  # Tamaño más pequeño en móvil
+            return {"fila": fila, "cantidad": cantidad_campo, "precio": precio_texto, "subtotal": None}
+        
+        # Versión original para escritorio
+        precio_texto = ft.Text(f"${item['precio_unitario']:.2f}")
+        subtotal_texto = ft.Text(f"${item['subtotal']:.2f}")
+        fila = ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(item["producto_nombre"], overflow=ft.TextOverflow.ELLIPSIS)),
+                ft.DataCell(cantidad_campo),
+                ft.DataCell(precio_texto),
+                ft.DataCell(subtotal_texto),
+                ft.DataCell(boton_eliminar)
+            ]
+        )
+        return {"fila": fila, "cantidad": cantidad_campo, "precio": precio_texto, "subtotal": subtotal_texto}
+    
+    def actualizar_fila_pedido(celdas, item):
+        """Pasa a la fila los valores actuales de la línea"""
+        celdas["cantidad"].value = str(item["cantidad"])
+        if celdas["subtotal"] is None:
+            celdas["precio"].value = f"${item['precio_unitario']:.1f}"
+        else:
+            celdas["precio"].value = f"${item['precio_unitario']:.2f}"
+            celdas["subtotal"].value = f"${item['subtotal']:.2f}"
+    
+    def construir_fila_total():
+        """Fila de total con fondo destacado; devuelve {"fila", "lineas", "total"}"""
+        is_mobile = page.width < 800
+        if is_mobile:
+            # Versión móvil del total (más visible)
+            lineas_texto = ft.Text("", size=12)
+            total_texto = ft.Text("", weight=ft.FontWeight.BOLD, size=12, color=ft.Colors.GREEN_700)
+            fila = ft.DataRow(
+                cells=[
+                    ft.DataCell(ft.Text("TOTAL", weight=ft.FontWeight.BOLD, size=12)),
+                    ft.DataCell(lineas_texto),
+                    ft.DataCell(ft.Text("")),
+                    ft.DataCell(total_texto)
+                ],
+                color=ft.Colors.with_opacity(0.15, ft.Colors.BLUE_100)
             )
-            
-            if is_mobile:
-                # Versión móvil con 4 columnas compactas
-                pedido_actual_table.rows.append(
-                    ft.DataRow(
-                        cells=[
-                            # Nombre producto (más estrecho)
-                            ft.DataCell(
-                                ft.Text(
-                                    item["producto_nombre"][:12] + ('...' if len(item["producto_nombre"]) > 12 else ''),  # Acortar más
-                                    overflow=ft.TextOverflow.ELLIPSIS,
-                                    max_lines=1,
-                                    size=11  # Texto más pequeño
-                                )
-                            ),
-                            # Cantidad
-                            ft.DataCell(cantidad_campo),
-                            # Precio unitario - ahora con texto más pequeño
-                            ft.DataCell(
-                                ft.Text(
-                                    f"${item['precio_unitario']:.1f}",  # Reducir a 1 decimal
-                                    size=11
-                                )
-                            ),
-                            # Botón eliminar separado para asegurar que sea visible
-                            ft.DataCell(boton_eliminar)
-                        ],
-                        # Alternar colores para mejor visibilidad
-                        color=ft.Colors.with_opacity(0.03, ft.Colors.BLUE_100) if i % 2 == 0 else None
-                    )
-                )
-            else:
-                # Versión original para escritorio
-                pedido_actual_table.rows.append(
-                    ft.DataRow(
-                        cells=[
-                            ft.DataCell(ft.Text(item["producto_nombre"], overflow=ft.TextOverflow.ELLIPSIS)),
-                            ft.DataCell(cantidad_campo),
-                            ft.DataCell(ft.Text(f"${item['precio_unitario']:.2f}")),
-                            ft.DataCell(ft.Text(f"${item['subtotal']:.2f}")),
-                            ft.DataCell(boton_eliminar)
-                        ]
-                    )
-                )
+            return {"fila": fila, "lineas": lineas_texto, "total": total_texto}
         
-        # Agregar fila de total con fondo destacado para mejor visibilidad
-        total = sum(item["subtotal"] for item in current_order)
-        if current_order:
-            if is_mobile:
-                # Versión móvil del total (más visible)
-                pedido_actual_table.rows.append(
-                    ft.DataRow(
-                        cells=[
-                            ft.DataCell(ft.Text("TOTAL", weight=ft.FontWeight.BOLD, size=12)),
-                            ft.DataCell(ft.Text(f"{len(current_order)}", size=12)),  # Más compacto
-                            ft.DataCell(ft.Text("")),
-                            ft.DataCell(
-                                ft.Text(
-                                    f"${total:.1f}",  # Reducir a 1 decimal
-                                    weight=ft.FontWeight.BOLD, 
-                                    size=12,
-                                    color=ft.Colors.GREEN_700
-                                )
-                            )
-                        ],
-                        # Fondo destacado para el total
-                        color=ft.Colors.with_opacity(0.15, ft.Colors.BLUE_100)
-                    )
-                )
+        # Versión escritorio de la fila de total
+        total_texto = ft.Text("", weight=ft.FontWeight.BOLD)
+        fila = ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text("")),
+                ft.DataCell(ft.Text("")),
+                ft.DataCell(ft.Text("TOTAL", weight=ft.FontWeight.BOLD)),
+                ft.DataCell(total_texto),
+                ft.DataCell(ft.Text(""))
+            ],
+            color=ft.Colors.with_opacity(0.1, ft.Colors.BLUE_GREY)
+        )
+        return {"fila": fila, "lineas": None, "total": total_texto}
+    
+    def actualizar_resumen_pedido():
+        """Fila de total, panel flotante, botón de borrar y fecha según el carrito (sin recorrer las líneas)"""
+        nonlocal fila_total_pedido
+        if carrito:
+            if fila_total_pedido is None:
+                fila_total_pedido = construir_fila_total()
+                pedido_actual_table.rows.append(fila_total_pedido["fila"])
+            if fila_total_pedido["lineas"] is None:
+                fila_total_pedido["total"].value = f"${carrito.total:.2f}"
             else:
-                # Versión escritorio de la fila de total
-                pedido_actual_table.rows.append(
-                    ft.DataRow(
-                        cells=[
-                            ft.DataCell(ft.Text("")),
-                            ft.DataCell(ft.Text("")),
-                            ft.DataCell(ft.Text("TOTAL", weight=ft.FontWeight.BOLD)),
-                            ft.DataCell(ft.Text(f"${total:.2f}", weight=ft.FontWeight.BOLD)),
-                            ft.DataCell(ft.Text(""))
-                        ],
-                        color=ft.Colors.with_opacity(0.1, ft.Colors.BLUE_GREY)
-                    )
-                )
+                fila_total_pedido["lineas"].value = f"{len(carrito)}"
+                fila_total_pedido["total"].value = f"${carrito.total:.1f}"  # Reducir a 1 decimal
+        elif fila_total_pedido is not None:
+            pedido_actual_table.rows.remove(fila_total_pedido["fila"])
+            fila_total_pedido = None
         
-        pedido_actual_table.update()
+        # Actualizar contador de productos en el panel flotante si existe
+        actualizar_panel_flotante(carrito.total)
+        
+        # Botón para borrar productos y fecha del pedido solo con productos
+        borrar_productos_btn.visible = bool(carrito)
+        fecha_pedido_container.visible = bool(carrito)
+    
+    def actualizar_tabla_pedido():
+        """Redibuja la tabla completa; se usa al cambiar entre móvil y escritorio"""
+        nonlocal fila_total_pedido
+        if pedido_actual_table.rows is None:
+            pedido_actual_table.rows = []
+        pedido_actual_table.rows.clear()
+        filas_pedido.clear()
+        fila_total_pedido = None
         
-        # Actualizar contador de productos en el panel flotante si existe
-        if hasattr(page, 'panel_flotante') and page.panel_flotante is not None:
-            actualizar_panel_flotante(total)
+        for i, item in enumerate(carrito):
+            celdas = construir_fila_pedido(item, i)
+            filas_pedido[item["producto_id"]] = celdas
+            pedido_actual_table.rows.append(celdas["fila"])
+        actualizar_resumen_pedido()
         
-        # Actualizar visibilidad del botón para borrar productos
-        if current_order:
-            borrar_productos_btn.visible = True
-        else:
-            borrar_productos_btn.visible = False
+        pedido_actual_table.update()
         borrar_productos_btn.update()
+    
+    def on_carrito_cambiado(evento, item):
+        """Agrega, modifica o quita solo la fila del producto que cambió"""
+        nonlocal fila_total_pedido
+        if pedido_actual_table.rows is None:
+            pedido_actual_table.rows = []
+        filas = pedido_actual_table.rows
+        if evento == AGREGADA:
+            celdas = construir_fila_pedido(item, len(filas_pedido))
+            filas_pedido[item["producto_id"]] = celdas
+            # Antes de la fila de total
+            filas.insert(len(filas) - 1 if fila_total_pedido is not None else len(filas), celdas["fila"])
+        elif evento == ACTUALIZADA:
+            celdas = filas_pedido.get(item["producto_id"])
+            if celdas is not None:
+                actualizar_fila_pedido(celdas, item)
+        elif evento == QUITADA:
+            celdas = filas_pedido.pop(item["producto_id"], None)
+            if celdas is not None:
+                indice = filas.index(celdas["fila"])
+                del filas[indice]
+                # Las filas siguientes suben un lugar: en móvil se corrige su color alternado
+                if celdas["subtotal"] is None:
+                    for j in range(indice, len(filas)):
+                        if fila_total_pedido is None or filas[j] is not fila_total_pedido["fila"]:
+                            filas[j].color = color_fila_pedido(j)
+        else:
+            filas.clear()
+            filas_pedido.clear()
+            fila_total_pedido = None
+        actualizar_resumen_pedido()
+        
+        try:
+            pedido_actual_table.update()
+            borrar_productos_btn.update()
+            fecha_pedido_container.update()
+        except Exception as e:
+            print(f"Error actualizando tabla: {e}")
+    
+    carrito.suscribir(on_carrito_cambiado)
         
-    def editar_item_pedido(index):
-        item = current_order[index]
+    def editar_item_pedido(producto_id):
+        item = carrito.obtener(producto_id)
         
         # Diálogo para editar cantidad
         dlg = ft.AlertDialog(
@@ -1791,20 +2114,20 @@ def main(page: ft.Page):
                     keyboard_type=ft.KeyboardType.NUMBER,
                     width=300,
                     autofocus=True,
-                    on_submit=lambda e, idx=index: guardar_edicion(e.control.value, idx, dlg)
+                    on_submit=lambda e, pid=producto_id: guardar_edicion(e.control.value, pid, dlg)
                 ),
                 ft.TextField(
                     label="Precio Unitario",
                     value=str(item["precio_unitario"]),
                     keyboard_type=ft.KeyboardType.NUMBER,
                     width=300,
-                    on_submit=lambda e, idx=index: guardar_edicion_precio(e.control.value, idx, dlg)
+                    on_submit=lambda e, pid=producto_id: guardar_edicion_precio(e.control.value, pid, dlg)
                 )
             ], tight=True, spacing=20, width=300),
             actions=[
                 ft.TextButton("Cancelar", on_click=lambda _: close_dlg(dlg)),
-                ft.TextButton("Guardar", on_click=lambda _, idx=index, d=dlg: 
-                            guardar_edicion(d.content.controls[0].value, idx, d))
+                ft.TextButton("Guardar", on_click=lambda _, pid=producto_id, d=dlg: 
+                            guardar_edicion(d.content.controls[0].value, pid, d))
             ],
             modal=True
         )
@@ -1813,65 +2136,56 @@ def main(page: ft.Page):
         dlg.open = True
         page.update()
 
-    def guardar_edicion(nueva_cantidad, index, dlg):
+    def mensaje_faltantes(error):
+        """Texto para el operador con los productos sin stock suficiente"""
+        partes = []
+        for producto_id, (pedida, disponible) in error.faltantes.items():
+            producto = app.catalogo.obtener(producto_id)
+            nombre = producto.nombre if producto else f"Producto {producto_id}"
+            partes.append(f"{nombre} (pedido {pedida}, disponible {disponible})")
+        if not partes:
+            return "El stock cambió mientras se guardaba el pedido. Intente nuevamente"
+        return "Stock insuficiente: " + "; ".join(partes)
+    
+    def guardar_edicion(nueva_cantidad, producto_id, dlg):
         try:
             cantidad = int(nueva_cantidad)
             if cantidad <= 0:
                 raise ValueError("Cantidad debe ser mayor a 0")
             
-            # Verificar stock disponible
-            conn = app.get_db_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT stock FROM productos WHERE id = %s", (current_order[index]["producto_id"],))
-            producto = cursor.fetchone()
-            cursor.close()
-            conn.close()
+            # Verificar contra el catálogo en memoria; la reserva al guardar el pedido es la que manda
+            producto = app.catalogo.obtener(producto_id)
             
-            if cantidad > producto["stock"]:
-                page.snack_bar = ft.SnackBar(content=ft.Text(f"Stock insuficiente. Disponible: {producto['stock']}"))
+            if producto is not None and cantidad > producto.stock:
+                page.snack_bar = ft.SnackBar(content=ft.Text(f"Stock insuficiente. Disponible: {producto.stock}"))
                 page.snack_bar.open = True
                 page.update()
                 return
             
-            current_order[index]["cantidad"] = cantidad
-            current_order[index]["subtotal"] = cantidad * current_order[index]["precio_unitario"]
-            actualizar_tabla_pedido()
+            carrito.fijar_cantidad(producto_id, cantidad)
             close_dlg(dlg)
         except ValueError:
             page.snack_bar = ft.SnackBar(content=ft.Text("Ingresa una cantidad válida"))
             page.snack_bar.open = True
             page.update()
     
-    def guardar_edicion_precio(nuevo_precio, index, dlg):
+    def guardar_edicion_precio(nuevo_precio, producto_id, dlg):
         try:
             precio = float(nuevo_precio)
             if precio <= 0:
                 raise ValueError("Precio debe ser mayor a 0")
             
-            current_order[index]["precio_unitario"] = precio
-            current_order[index]["subtotal"] = current_order[index]["cantidad"] * precio
-            actualizar_tabla_pedido()
+            carrito.fijar_precio(producto_id, precio)
             close_dlg(dlg)
         except ValueError:
             page.snack_bar = ft.SnackBar(content=ft.Text("Ingresa un precio válido"))
             page.snack_bar.open = True
             page.update()
     
-    def eliminar_item_pedido(index):
-        # Eliminar el item del pedido
-        current_order.pop(index)
-        
-        # Actualizar tabla de pedidos
-        actualizar_tabla_pedido()
-        
-        # Actualizar panel flotante
-        total = sum(item["subtotal"] for item in current_order) if current_order else 0
-        actualizar_panel_flotante(total)
-        
-        # Ocultar contenedor de fecha si no hay productos
-        if not current_order:
-            fecha_pedido_container.visible = False
-            fecha_pedido_container.update()
+    def eliminar_item_pedido(producto_id):
+        # Quitar el producto del pedido: el carrito avisa y se quita solo su fila
+        # (el panel flotante y la fecha se actualizan con el mismo aviso)
+        carrito.quitar(producto_id)
 
     def close_dlg(dlg):
         dlg.open = False
@@ -1879,7 +2193,7 @@ def main(page: ft.Page):
     
     # Nueva función para confirmar antes de borrar todos los productos
     def confirmar_borrar_todos_productos():
-        if not current_order:
+        if not carrito:
             return
             
         dlg = ft.AlertDialog(
@@ -1906,10 +2220,7 @@ def main(page: ft.Page):
     
     def borrar_todos_productos(dlg):
         """Borra todos los productos del pedido actual"""
-        current_order.clear()
-        actualizar_tabla_pedido()
-        fecha_pedido_container.visible = False
-        fecha_pedido_container.update()
+        vaciar_carrito()
         close_dlg(dlg)
         
         # Notificar
@@ -1922,7 +2233,11 @@ def main(page: ft.Page):
     
     # MODIFICACIÓN: Agregar opción para ver pedidos después de finalizar
     def finalizar_pedido():
-        if not current_order:
+        nonlocal guardando_pedido, clave_carrito
+        if guardando_pedido:
+            return
+        
+        if not carrito:
             page.snack_bar = ft.SnackBar(content=ft.Text("Agrega productos al pedido primero"))
             page.snack_bar.open = True
             page.update()
@@ -1940,60 +2255,167 @@ def main(page: ft.Page):
             page.update()
             return
         
-        # Guardar pedido en la base de datos con la fecha personalizada
-        pedido_id = app.guardar_pedido(cliente_actual, zona_actual, current_order, fecha_pedido)
+        # Copiar los datos del pedido: la tarea corre mientras la interfaz sigue activa
+        cliente = cliente_actual
+        zona = zona_actual
+        detalles = carrito.detalles()
+        fecha = fecha_pedido
+        if clave_carrito is None:
+            clave_carrito = str(uuid.uuid4())
+        clave = clave_carrito
+        
+        guardando_pedido = True
+        finalizar_pedido_btn.disabled = True
+        progreso_texto = ft.Text("Guardando pedido...")
+        progress_dlg = ft.AlertDialog(
+            title=ft.Text("Finalizando pedido"),
+            content=ft.Column([
+                progreso_texto,
+                ft.ProgressBar(width=300)
+            ], tight=True, spacing=20),
+            modal=True
+        )
+        page.dialog = progress_dlg
+        progress_dlg.open = True
+        page.update()
+        
+        def guardar(tarea):
+            # Escribir el pedido en la bandeja local: al volver queda en disco aunque la base no responda
+            # Con la clave del carrito, reintentar después de un error no duplica el pedido
+            return app.encolar_pedido(cliente, zona, detalles, fecha, clave)
         
-        if pedido_id:
-            # Generar PDF de factura
-            pdf_content, mensaje = app.generar_pdf_factura(pedido_id)
+        def mostrar_resultado(clave):
+            nonlocal guardando_pedido
+            guardando_pedido = False
+            finalizar_pedido_btn.disabled = False
+            progress_dlg.open = False
             
-            if pdf_content:
-                # Crear directorio para PDFs si no existe
-                os.makedirs("temp", exist_ok=True)
-                
-                # Guardar PDF temporalmente
-                temp_file = os.path.join("temp", f"factura_{pedido_id}.pdf")
-                with open(temp_file, "wb") as f:
-                    f.write(pdf_content)
-                
-                # Mostrar mensaje de éxito con opciones
-                dlg_success = ft.AlertDialog(
-                    title=ft.Text("Pedido Completado"),
-                    content=ft.Column([
-                        ft.Text(f"Pedido #{pedido_id} guardado correctamente"),
-                        ft.Row([
-                            ft.ElevatedButton(
-                                "Descargar Factura",
-                                icon=ft.Icons.DOWNLOAD,
-                                on_click=lambda _: download_file(temp_file, f"factura_{pedido_id}.pdf")
-                            ),
-                            ft.ElevatedButton(
-                                "Compartir por WhatsApp",
-                                icon=ft.Icons.WHATSAPP,
-                                on_click=lambda _: compartir_por_whatsapp(pedido_id, cliente_actual)
-                            )
-                        ], alignment=ft.MainAxisAlignment.CENTER)
-                    ], tight=True, spacing=20),
-                    actions=[
-                        # Botón para ver pedidos
-                        ft.TextButton("Ver todos los pedidos", on_click=lambda _: close_dlg_and_ver_pedidos(dlg_success)),
-                        # Botón para cerrar
-                        ft.TextButton("Aceptar", on_click=lambda _: close_dlg_and_reset(dlg_success))
-                    ],
-                    modal=True
-                )
-                
-                page.dialog = dlg_success
-                dlg_success.open = True
+            # El pedido ya no se pierde: se confirma enseguida y la factura se habilita
+            # cuando el pedido llega a la base de datos
+            # El carrito se limpia al cerrar el diálogo; si el pedido se rechaza
+            # antes, el diálogo ofrece volver al carrito intacto para corregirlo
+            dialogo_abierto = True
+            lock_dialogo = threading.Lock()
+            
+            def cerrar_dialogo(accion):
+                nonlocal dialogo_abierto
+                with lock_dialogo:
+                    dialogo_abierto = False
+                accion(dlg_success)
+            
+            estado_texto = ft.Text("Guardando en la base de datos...")
+            descargar_btn = ft.ElevatedButton("Descargar Factura", icon=ft.Icons.DOWNLOAD, disabled=True)
+            whatsapp_btn = ft.ElevatedButton("Compartir por WhatsApp", icon=ft.Icons.WHATSAPP, disabled=True)
+            dlg_success = ft.AlertDialog(
+                title=ft.Text("Pedido Registrado"),
+                content=ft.Column([
+                    estado_texto,
+                    ft.Row([descargar_btn, whatsapp_btn], alignment=ft.MainAxisAlignment.CENTER)
+                ], tight=True, spacing=20),
+                actions=[
+                    # Botón para ver pedidos
+                    ft.TextButton("Ver todos los pedidos", on_click=lambda _: cerrar_dialogo(close_dlg_and_ver_pedidos)),
+                    # Botón para cerrar
+                    ft.TextButton("Aceptar", on_click=lambda _: cerrar_dialogo(close_dlg_and_reset))
+                ],
+                modal=True
+            )
+            page.dialog = dlg_success
+            dlg_success.open = True
+            page.update()
+            
+            def factura_lista(trabajo):
+                pedido_id = trabajo.pedido_id
+                if trabajo.estado == LISTA:
+                    estado_texto.value = f"Pedido #{pedido_id} guardado correctamente"
+                    descargar_btn.on_click = lambda _: download_file(trabajo.ruta, f"factura_{pedido_id}.pdf")
+                    descargar_btn.disabled = False
+                else:
+                    estado_texto.value = f"Pedido #{pedido_id} guardado. {trabajo.error}"
+                whatsapp_btn.on_click = lambda _: compartir_por_whatsapp(pedido_id, cliente)
+                whatsapp_btn.disabled = False
                 page.update()
-            else:
-                page.snack_bar = ft.SnackBar(content=ft.Text(f"Error al generar factura: {mensaje}"))
-                page.snack_bar.open = True
+            
+            def al_guardarse(pedido_id, error):
+                if error is not None:
+                    descartar_clave_carrito(clave)
+                    with lock_dialogo:
+                        abierto = dialogo_abierto
+                        if abierto:
+                            # El carrito no se tocó: el único botón vuelve a él sin vaciarlo
+                            dlg_success.title = ft.Text("Pedido no guardado")
+                            estado_texto.value = f"El pedido no se pudo guardar: {error}"
+                            estado_texto.color = ft.Colors.RED
+                            dlg_success.actions = [
+                                ft.TextButton("Volver al pedido", on_click=lambda _: cerrar_dialogo(close_dlg))
+                            ]
+                    if abierto:
+                        page.update()
+                    else:
+                        restaurar_pedido_rechazado(clave, error)
+                    return
+                estado_texto.value = f"Pedido #{pedido_id} guardado. Generando factura..."
                 page.update()
-        else:
-            page.snack_bar = ft.SnackBar(content=ft.Text("Error al guardar el pedido"))
-            page.snack_bar.open = True
-            page.update()
+                try:
+                    app.facturas.solicitar(pedido_id, factura_lista)
+                except ColaFacturasLlena as e:
+                    # La factura puede pedirse más tarde desde la lista de pedidos
+                    estado_texto.value = f"Pedido #{pedido_id} guardado. {e}"
+                    whatsapp_btn.on_click = lambda _: compartir_por_whatsapp(pedido_id, cliente)
+                    whatsapp_btn.disabled = False
+                    page.update()
+            
+            def avisar_si_demora():
+                if clave in pedidos_en_espera:
+                    estado_texto.value = ("La base de datos no responde: el pedido quedó guardado en esta "
+                                          "terminal y se enviará automáticamente")
+                    page.update()
+            
+            esperar_pedido(clave, al_guardarse)
+            demora = threading.Timer(3, avisar_si_demora)
+            demora.daemon = True
+            demora.start()
+        
+        app.tareas.enviar(
+            guardar,
+            nombre="finalizar_pedido",
+            on_resultado=mostrar_resultado,
+            on_error=lambda error: mostrar_error_guardado(progress_dlg, f"Error al registrar el pedido: {error}")
+        )
+    
+    def mostrar_error_guardado(progress_dlg, mensaje):
+        """El pedido no llegó a la bandeja: el carrito sigue intacto para reintentar"""
+        nonlocal guardando_pedido
+        guardando_pedido = False
+        finalizar_pedido_btn.disabled = False
+        progress_dlg.open = False
+        page.snack_bar = ft.SnackBar(content=ft.Text(mensaje))
+        page.snack_bar.open = True
+        page.update()
+    
+    # Pedidos de esta sesión que esperan llegar a la base: clave -> callback(pedido_id, error)
+    pedidos_en_espera = {}
+    
+    def esperar_pedido(clave, callback):
+        """Llama a callback cuando el pedido de la bandeja se guarde o se rechace"""
+        pedidos_en_espera[clave] = callback
+        # El pedido pudo guardarse antes de registrar la espera
+        estado = app.bandeja.estado(clave)
+        if estado and estado["estado"] == GUARDADO:
+            resolver_pedido(clave, estado["pedido_id"], None)
+        elif estado and estado["estado"] == RECHAZADO:
+            resolver_pedido(clave, None, estado["error"])
+    
+    def resolver_pedido(clave, pedido_id, error):
+        callback = pedidos_en_espera.pop(clave, None)
+        if callback is None:
+            return
+        if isinstance(error, StockInsuficienteError):
+            error = mensaje_faltantes(error)
+        try:
+            callback(pedido_id, error)
+        except Exception as e:
+            print(f"Error al informar el pedido guardado: {e}")
     
     # Nueva función para compartir pedido por WhatsApp
     def compartir_por_whatsapp(pedido_id, cliente):
@@ -2003,7 +2425,7 @@ def main(page: ft.Page):
             cursor = conn.cursor(dictionary=True)
             
             cursor.execute("""
-            SELECT p.*, DATE_FORMAT(p.fecha, '%d/%m/%Y') as fecha_formateada
+            SELECT p.*
             FROM pedidos p
             WHERE p.id = %s
             """, (pedido_id,))
@@ -2032,7 +2454,7 @@ def main(page: ft.Page):
             mensaje = f"*PEDIDO #{pedido_id} - DistriSulpi*\n"
             mensaje += f"*Cliente:* {cliente}\n"
             mensaje += f"*Zona:* {pedido['zona']}\n"
-            mensaje += f"*Fecha:* {pedido['fecha_formateada']}\n\n"
+            mensaje += f"*Fecha:* {pedido['fecha'].strftime('%d/%m/%Y')}\n\n"
             
             mensaje += "*Detalles del pedido:*\n"
             for detalle in detalles:
@@ -2060,14 +2482,14 @@ def main(page: ft.Page):
         # Obtener todos los pedidos del día
         conn = app.get_db_connection()
         cursor = conn.cursor(dictionary=True)
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
+        filtro, parametros = filtro_fecha("fecha", rango_dia())
         
-        cursor.execute("""
+        cursor.execute(f"""
         SELECT id, cliente, zona, fecha, total
         FROM pedidos
-        WHERE DATE(fecha) = %s
+        WHERE {filtro}
         ORDER BY fecha DESC
-        """, (today,))
+        """, parametros)
         
         pedidos_hoy = cursor.fetchall()
         cursor.close()
@@ -2184,7 +2606,7 @@ def main(page: ft.Page):
             
             for pedido_id in pedidos_ids:
                 cursor.execute("""
-                SELECT p.*, DATE_FORMAT(p.fecha, '%d/%m/%Y') as fecha_formateada, c.cliente
+                SELECT p.*, c.cliente
                 FROM pedidos p
                 JOIN (SELECT id, cliente FROM pedidos WHERE id = %s) c ON p.id = c.id
                 WHERE p.id = %s
@@ -2292,8 +2714,7 @@ def main(page: ft.Page):
         page.update()
         
         # Resetear pedido actual
-        current_order.clear()
-        actualizar_tabla_pedido()
+        vaciar_carrito()
         
         # Limpiar campos
         cliente_field.value = ""
@@ -2317,8 +2738,7 @@ def main(page: ft.Page):
         dlg.open = False
         
         # Limpiar pedido actual
-        current_order.clear()
-        actualizar_tabla_pedido()
+        vaciar_carrito()
         
         # Limpiar campos
         cliente_field.value = ""
@@ -2342,6 +2762,7 @@ def main(page: ft.Page):
             
     def configurar_tabla_pedido_responsivo():
             """Configura la estructura de la tabla de pedidos para dispositivos móviles"""
+            nonlocal fila_total_pedido
             # Verificar si estamos en móvil
             is_mobile = page.width < 800
             
@@ -2350,6 +2771,8 @@ def main(page: ft.Page):
                 pedido_actual_table.rows.clear()
             except:
                 pedido_actual_table.rows = []
+            filas_pedido.clear()
+            fila_total_pedido = None
             # ✅ NO limpiar columnas, solo ajustar ancho
             pedido_actual_table.width = min(page.width - 40, 600)
             # ✅ Asegurar que las columnas existan
@@ -2477,22 +2900,20 @@ def main(page: ft.Page):
         page.dialog = progress_dlg
         progress_dlg.open = True
         page.update()
-        try:
-            pdf_content, mensaje = app.generar_pdf_factura(pedido_id)
+        
+        def factura_lista(trabajo):
             progress_dlg.open = False
             page.update()
-            
-            if pdf_content:
-                os.makedirs("temp", exist_ok=True)
-                temp_file = os.path.join("temp", f"factura_{pedido_id}.pdf")
-                with open(temp_file, "wb") as f:
-                    f.write(pdf_content)
-                
-                download_file_mobile(temp_file, f"factura_{pedido_id}.pdf")
+            if trabajo.estado == LISTA:
+                download_file_mobile(trabajo.ruta, f"factura_{pedido_id}.pdf")
             else:
-                page.snack_bar = ft.SnackBar(content=ft.Text(mensaje))
+                page.snack_bar = ft.SnackBar(content=ft.Text(trabajo.error))
                 page.snack_bar.open = True
                 page.update()
+        
+        try:
+            # La factura se arma en el pool de procesos; si ya estaba lista se descarga enseguida
+            app.facturas.solicitar(pedido_id, factura_lista)
         except Exception as e:
             progress_dlg.open = False
             page.update()
@@ -2755,6 +3176,8 @@ def main(page: ft.Page):
         # Mostrar u ocultar panel de estadísticas
         if estadisticas_container.visible:
             estadisticas_container.visible = False
+            if tarea_estadisticas:
+                tarea_estadisticas.cancelar()
         else:
             # Cargar estadísticas
             cargar_estadisticas()
@@ -2767,154 +3190,192 @@ def main(page: ft.Page):
         page.update()
     
     def cargar_estadisticas():
-        # Obtener datos de ventas de los últimos 30 días
-        ventas = app.get_ventas_ultimos_30_dias()
+        """Consulta las estadísticas en segundo plano y muestra el avance"""
+        nonlocal tarea_estadisticas
+        if tarea_estadisticas:
+            tarea_estadisticas.cancelar()
         
-        # Obtener ventas de hoy
-        ventas_hoy = app.get_ventas_diarias()
-        total_hoy = sum(venta["subtotal"] for venta in ventas_hoy)
+        progreso = ft.ProgressBar(width=300, value=0)
+        estadisticas_container.content = ft.Column([
+            ft.Text("Cargando estadísticas...", size=20, weight=ft.FontWeight.BOLD),
+            progreso,
+            ft.TextButton("Cancelar", on_click=lambda _: toggle_estadisticas())
+        ])
+        estadisticas_container.update()
         
-        # Obtener productos más vendidos
-        productos_mas_vendidos = app.get_productos_mas_vendidos(5)
+        def consultar(tarea):
+            pasos = [
+                # Datos de ventas de los últimos 30 días
+                ("ventas", app.get_ventas_ultimos_30_dias),
+                # Ventas de hoy
+                ("ventas_hoy", app.get_ventas_diarias),
+                # Productos más vendidos
+                ("productos_mas_vendidos", lambda: app.get_productos_mas_vendidos(5)),
+                # Ganancias y facturación
+                ("ganancia_diaria", app.get_ganancia_diaria),
+                ("ganancia_anual", app.get_ganancia_anual),
+                ("facturacion_diaria", app.get_facturacion_diaria),
+                ("facturacion_anual", app.get_facturacion_anual),
+            ]
+            datos = {}
+            for i, (clave, consulta) in enumerate(pasos):
+                datos[clave] = consulta()
+                tarea.reportar((i + 1) / (len(pasos) + 1))
+            
+            # El gráfico se dibuja en el pool de procesos
+            datos["grafico"], datos["error_grafico"] = None, None
+            if datos["ventas"]:
+                try:
+                    datos["grafico"] = app.tareas.en_proceso(
+                        renderizar_grafico,
+                        [venta["dia"] for venta in datos["ventas"]],
+                        [float(venta["total_ventas"]) for venta in datos["ventas"]],
+                        os.path.join("temp", "ventas_chart.png"),
+                        'Ventas de los últimos 30 días',
+                        'Total ($)',
+                        tarea=tarea
+                    )
+                except TareaCancelada:
+                    raise
+                except Exception as e:
+                    print(f"Error al generar gráfico: {e}")
+                    datos["error_grafico"] = str(e)
+            return datos
         
-        # Obtener ganancias y facturación
-        ganancia_diaria = app.get_ganancia_diaria()
-        ganancia_anual = app.get_ganancia_anual()
-        facturacion_diaria = app.get_facturacion_diaria()
-        facturacion_anual = app.get_facturacion_anual()
+        def informar_progreso(fraccion, mensaje):
+            progreso.value = fraccion
+            progreso.update()
         
-        # Limpiar contenedor
-        estadisticas_container.content = ft.Column([
-            ft.Text("Estadísticas de Ventas", size=20, weight=ft.FontWeight.BOLD),
-            
-            # Resumen general - ganancia y facturación
-            ft.Container(
-                content=ft.Column([
-                    ft.Text("Resumen de Resultados", size=16, weight=ft.FontWeight.BOLD),
-                    ft.Row([
-                        # Hoy
-                        ft.Container(
-                            content=ft.Column([
-                                ft.Text("HOY", size=14, weight=ft.FontWeight.BOLD),
-                                ft.Text(f"Facturado: ${facturacion_diaria:.2f}", size=14),
-                                ft.Text(f"Ganancia: ${ganancia_diaria:.2f}", 
-                                    size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_400)
-                            ]),
-                            padding=10,
-                            border=ft.border.all(1, ft.Colors.GREEN_100),
-                            border_radius=5,
-                            expand=True
-                        ),
-                        # Separador
-                        ft.VerticalDivider(width=10),
-                        # Año
-                        ft.Container(
-                            content=ft.Column([
-                                ft.Text("AÑO " + str(datetime.datetime.now().year), 
-                                    size=14, weight=ft.FontWeight.BOLD),
-                                ft.Text(f"Facturado: ${facturacion_anual:.2f}", size=14),
-                                ft.Text(f"Ganancia: ${ganancia_anual:.2f}", 
-                                    size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_400)
-                            ]),
-                            padding=10,
-                            border=ft.border.all(1, ft.Colors.BLUE_100),
-                            border_radius=5,
-                            expand=True
-                        )
-                    ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
-                ]),
-                padding=10,
-                bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.PURPLE),
-                border_radius=5,
-                margin=ft.margin.only(bottom=10)
-            ),
-            
-            # Ventas del día
-            ft.Container(
-                content=ft.Column([
-                    ft.Text("Detalle de Hoy", size=16, weight=ft.FontWeight.BOLD),
-                    ft.Text(f"Número de pedidos: {len(set(venta['id'] for venta in ventas_hoy)) if ventas_hoy else 0}", size=14),
-                    ft.Text(f"Total facturado: ${total_hoy:.2f}", size=14)
-                ]),
-                padding=10,
-                border=ft.border.all(1, ft.Colors.BLACK26),
-                border_radius=5,
-                margin=ft.margin.only(bottom=10)
-            ),
-            
-            # Productos más vendidos
-            ft.Container(
-                content=ft.Column([
-                    ft.Text("Productos Más Vendidos", size=16, weight=ft.FontWeight.BOLD),
-                    *[ft.Container(
-                        content=ft.Row([
-                            ft.Text(f"{i+1}.", size=14, weight=ft.FontWeight.BOLD),
-                            ft.Text(producto['nombre'], size=14, expand=True),
+        def mostrar_estadisticas(datos):
+            ventas = datos["ventas"]
+            ventas_hoy = datos["ventas_hoy"]
+            total_hoy = sum(venta["subtotal"] for venta in ventas_hoy)
+            productos_mas_vendidos = datos["productos_mas_vendidos"]
+            ganancia_diaria = datos["ganancia_diaria"]
+            ganancia_anual = datos["ganancia_anual"]
+            facturacion_diaria = datos["facturacion_diaria"]
+            facturacion_anual = datos["facturacion_anual"]
+            
+            # Limpiar contenedor
+            estadisticas_container.content = ft.Column([
+                ft.Text("Estadísticas de Ventas", size=20, weight=ft.FontWeight.BOLD),
+            
+                # Resumen general - ganancia y facturación
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text("Resumen de Resultados", size=16, weight=ft.FontWeight.BOLD),
+                        ft.Row([
+                            # Hoy
                             ft.Container(
-                                content=ft.Text(f"{producto['total_vendido']} unidades", 
-                                            size=14, weight=ft.FontWeight.BOLD),
-                                padding=ft.padding.only(left=5, right=5),
-                                bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.BLUE),
-                                border_radius=5
+                                content=ft.Column([
+                                    ft.Text("HOY", size=14, weight=ft.FontWeight.BOLD),
+                                    ft.Text(f"Facturado: ${facturacion_diaria:.2f}", size=14),
+                                    ft.Text(f"Ganancia: ${ganancia_diaria:.2f}", 
+                                        size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_400)
+                                ]),
+                                padding=10,
+                                border=ft.border.all(1, ft.Colors.GREEN_100),
+                                border_radius=5,
+                                expand=True
+                            ),
+                            # Separador
+                            ft.VerticalDivider(width=10),
+                            # Año
+                            ft.Container(
+                                content=ft.Column([
+                                    ft.Text("AÑO " + str(datetime.datetime.now().year), 
+                                        size=14, weight=ft.FontWeight.BOLD),
+                                    ft.Text(f"Facturado: ${facturacion_anual:.2f}", size=14),
+                                    ft.Text(f"Ganancia: ${ganancia_anual:.2f}", 
+                                        size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_400)
+                                ]),
+                                padding=10,
+                                border=ft.border.all(1, ft.Colors.BLUE_100),
+                                border_radius=5,
+                                expand=True
                             )
-                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                        padding=5,
-                        border_radius=5,
-                        bgcolor=ft.Colors.with_opacity(0.05, ft.Colors.PURPLE) if i % 2 == 0 else None
-                    ) for i, producto in enumerate(productos_mas_vendidos)]
-                ]),
-                padding=10,
-                border=ft.border.all(1, ft.Colors.BLACK26),
-                border_radius=5,
-                margin=ft.margin.only(bottom=10)
-            ),
+                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+                    ]),
+                    padding=10,
+                    bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.PURPLE),
+                    border_radius=5,
+                    margin=ft.margin.only(bottom=10)
+                ),
             
-            # Gráfico de ventas (si hay datos)
-            ft.Container(
-                content=ft.Column([
-                    ft.Text("Ventas de los últimos 30 días", size=16, weight=ft.FontWeight.BOLD),
-                    generate_chart_container(ventas) if ventas else ft.Text("No hay datos de ventas")
-                ]),
-                padding=10,
-                border=ft.border.all(1, ft.Colors.BLACK26),
-                border_radius=5
-            )
-        ], scroll=ft.ScrollMode.AUTO, spacing=10)
+                # Ventas del día
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text("Detalle de Hoy", size=16, weight=ft.FontWeight.BOLD),
+                        ft.Text(f"Número de pedidos: {len(set(venta['id'] for venta in ventas_hoy)) if ventas_hoy else 0}", size=14),
+                        ft.Text(f"Total facturado: ${total_hoy:.2f}", size=14)
+                    ]),
+                    padding=10,
+                    border=ft.border.all(1, ft.Colors.BLACK26),
+                    border_radius=5,
+                    margin=ft.margin.only(bottom=10)
+                ),
+            
+                # Productos más vendidos
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text("Productos Más Vendidos", size=16, weight=ft.FontWeight.BOLD),
+                        *[ft.Container(
+                            content=ft.Row([
+                                ft.Text(f"{i+1}.", size=14, weight=ft.FontWeight.BOLD),
+                                ft.Text(producto['nombre'], size=14, expand=True),
+                                ft.Container(
+                                    content=ft.Text(f"{producto['total_vendido']} unidades", 
+                                                size=14, weight=ft.FontWeight.BOLD),
+                                    padding=ft.padding.only(left=5, right=5),
+                                    bgcolor=ft.Colors.with_opacity(0.1, ft.Colors.BLUE),
+                                    border_radius=5
+                                )
+                            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                            padding=5,
+                            border_radius=5,
+                            bgcolor=ft.Colors.with_opacity(0.05, ft.Colors.PURPLE) if i % 2 == 0 else None
+                        ) for i, producto in enumerate(productos_mas_vendidos)]
+                    ]),
+                    padding=10,
+                    border=ft.border.all(1, ft.Colors.BLACK26),
+                    border_radius=5,
+                    margin=ft.margin.only(bottom=10)
+                ),
+            
+                # Gráfico de ventas (si hay datos)
+                ft.Container(
+                    content=ft.Column([
+                        ft.Text("Ventas de los últimos 30 días", size=16, weight=ft.FontWeight.BOLD),
+                        generate_chart_container(datos) if ventas else ft.Text("No hay datos de ventas")
+                    ]),
+                    padding=10,
+                    border=ft.border.all(1, ft.Colors.BLACK26),
+                    border_radius=5
+                )
+            ], scroll=ft.ScrollMode.AUTO, spacing=10)
         
-        estadisticas_container.update()
+            estadisticas_container.update()
+        
+        def mostrar_error(error):
+            estadisticas_container.content = ft.Column([
+                ft.Text("Error al cargar estadísticas", size=20, weight=ft.FontWeight.BOLD),
+                ft.Text(str(error), color=ft.Colors.RED)
+            ])
+            estadisticas_container.update()
+        
+        tarea_estadisticas = app.tareas.enviar(
+            consultar,
+            nombre="estadisticas",
+            on_progreso=informar_progreso,
+            on_resultado=mostrar_estadisticas,
+            on_error=mostrar_error
+        )
     
-    def generate_chart_container(ventas):
-        """Genera un gráfico de ventas y devuelve un contenedor con la imagen"""
-        try:
-            # Crear directorio para gráficos si no existe
-            os.makedirs("temp", exist_ok=True)
-            
-            # Configurar matplotlib para usar 'Agg' como backend
-            # Crear figura y ejes
-            fig, ax = plt.subplots(figsize=(10, 5))
-            
-            # Extraer fechas y totales
-            fechas = [venta["dia"] for venta in ventas]
-            totales = [float(venta["total_ventas"]) for venta in ventas]
-            
-            # Crear gráfico
-            ax.plot(fechas, totales, marker='o')
-            ax.set_title('Ventas de los últimos 30 días')
-            ax.set_xlabel('Fecha')
-            ax.set_ylabel('Total ($)')
-            plt.xticks(rotation=45)
-            plt.tight_layout()
-            
-            # Guardar gráfico como imagen
-            chart_path = os.path.join("temp", "ventas_chart.png")
-            plt.savefig(chart_path)
-            plt.close(fig)
-            
-            # Mostrar gráfico en la interfaz
-            return ft.Image(src=chart_path, width=600)
-        except Exception as e:
-            print(f"Error al generar gráfico: {e}")
-            return ft.Text(f"No se pudo generar el gráfico: {e}")
+    def generate_chart_container(datos):
+        """Devuelve un contenedor con el gráfico de ventas ya generado"""
+        if datos["grafico"]:
+            return ft.Image(src=datos["grafico"], width=600)
+        return ft.Text(f"No se pudo generar el gráfico: {datos['error_grafico']}")
     
     
     # ---------- FUNCIONES DE PREDICCIÓN ----------
@@ -2923,6 +3384,8 @@ def main(page: ft.Page):
         # Mostrar u ocultar panel de predicción
         if prediccion_container.visible:
             prediccion_container.visible = False
+            if tarea_prediccion:
+                tarea_prediccion.cancelar()
         else:
             # Cargar predicción
             cargar_prediccion()
@@ -2935,43 +3398,50 @@ def main(page: ft.Page):
         page.update()
     
     def cargar_prediccion():
-        """Carga y muestra la predicción de ventas"""
+        """Carga y muestra la predicción de ventas (el modelo se ajusta en segundo plano)"""
+        nonlocal tarea_prediccion
+        if tarea_prediccion:
+            tarea_prediccion.cancelar()
+        
         # Mostrar mensaje de carga
+        estado_texto = ft.Text("Consultando historial de ventas...")
         prediccion_container.content = ft.Column([
             ft.Text("Generando predicción de ventas...", size=20, weight=ft.FontWeight.BOLD),
-            ft.ProgressBar(width=300)
+            estado_texto,
+            ft.ProgressBar(width=300),
+            ft.TextButton("Cancelar", on_click=lambda _: toggle_prediccion())
         ])
         prediccion_container.update()
         
-        try:
-            # Generar predicción
-            prediccion, mensaje = app.generar_prediccion_ventas()
-            
+        def calcular(tarea):
+            resultados = app.get_historial_ventas()
+            
+            # Ajustar el modelo y dibujar el gráfico en el pool de procesos
+            tarea.reportar(0.3, "Ajustando modelo...")
+            prediccion, mensaje = app.tareas.en_proceso(ajustar_prediccion, resultados, tarea=tarea)
+            if not prediccion:
+                return None, mensaje, None
+            
+            tarea.reportar(0.7, "Dibujando gráfico...")
+            chart_path = app.tareas.en_proceso(
+                renderizar_grafico,
+                [fecha.strftime("%d/%m") for fecha in prediccion["fechas"]],
+                prediccion["predicciones"],
+                os.path.join("temp", "prediccion_chart.png"),
+                'Predicción de Ventas para los próximos 30 días',
+                'Ventas Estimadas ($)',
+                'green',
+                tarea=tarea
+            )
+            return prediccion, mensaje, chart_path
+        
+        def informar_progreso(fraccion, mensaje):
+            estado_texto.value = mensaje
+            estado_texto.update()
+        
+        def mostrar_prediccion(resultado):
+            prediccion, mensaje, chart_path = resultado
             if prediccion:
-                # Crear directorio para gráficos si no existe
-                os.makedirs("temp", exist_ok=True)
-                
-                # Configurar matplotlib para usar 'Agg' como backend
-                # Crear figura y ejes
-                fig, ax = plt.subplots(figsize=(10, 5))
-                
-                # Extraer fechas y predicciones
-                fechas = [fecha.strftime("%d/%m") for fecha in prediccion["fechas"]]
-                valores = prediccion["predicciones"]
-                
-                # Crear gráfico
-                ax.plot(fechas, valores, marker='o', color='green')
-                ax.set_title('Predicción de Ventas para los próximos 30 días')
-                ax.set_xlabel('Fecha')
-                ax.set_ylabel('Ventas Estimadas ($)')
-                plt.xticks(rotation=45)
-                plt.tight_layout()
-                
-                # Guardar gráfico como imagen
-                chart_path = os.path.join("temp", "prediccion_chart.png")
-                plt.savefig(chart_path)
-                plt.close(fig)
-                
                 # Mostrar gráfico y detalles en la interfaz
                 prediccion_container.content = ft.Column([
                     ft.Text("Predicción de Ventas (BETA)", size=20, weight=ft.FontWeight.BOLD),
@@ -2989,26 +3459,23 @@ def main(page: ft.Page):
                     ft.Text("Recomendación: Necesitas más datos históricos para generar una predicción precisa.", 
                            size=12, italic=True)
                 ])
-            
             prediccion_container.update()
-        except Exception as e:
+        
+        def mostrar_error(error):
             prediccion_container.content = ft.Column([
                 ft.Text("Error al generar predicción", size=20, weight=ft.FontWeight.BOLD),
-                ft.Text(str(e), color=ft.Colors.RED),
+                ft.Text(str(error), color=ft.Colors.RED),
             ])
             prediccion_container.update()
-            print(f"Error en predicción: {e}")
-    
-        else:
-            # Mostrar mensaje de error
-            prediccion_container.content = ft.Column([
-                ft.Text("Predicción de Ventas (BETA)", size=20, weight=ft.FontWeight.BOLD),
-                ft.Text(mensaje, color=ft.Colors.RED),
-                ft.Text("Recomendación: Necesitas más datos históricos para generar una predicción precisa.", 
-                       size=12, italic=True)
-            ])
+            print(f"Error en predicción: {error}")
         
-        prediccion_container.update()
+        tarea_prediccion = app.tareas.enviar(
+            calcular,
+            nombre="prediccion",
+            on_progreso=informar_progreso,
+            on_resultado=mostrar_prediccion,
+            on_error=mostrar_error
+        )
     
     # ---------- FUNCIONES DE PEDIDOS HOY ----------
     
@@ -3350,13 +3817,16 @@ def main(page: ft.Page):
         
         query_base = "SELECT id, cliente, zona, fecha, total FROM pedidos "
         
-        if fecha_str:
-            query_base += " WHERE DATE(fecha) = %s"
-            cursor.execute(query_base + " ORDER BY fecha DESC", (fecha_str,))
-        else:
-            cursor.execute(query_base + " ORDER BY fecha DESC")
-        
-        pedidos = cursor.fetchall()
+        try:
+            if fecha_str:
+                filtro, parametros = filtro_fecha("fecha", rango_dia(fecha_str))
+                cursor.execute(query_base + f" WHERE {filtro} ORDER BY fecha DESC", parametros)
+            else:
+                cursor.execute(query_base + " ORDER BY fecha DESC")
+            pedidos = cursor.fetchall()
+        except ValueError:
+            # Fecha escrita a mano con formato inválido: no hay pedidos que mostrar
+            pedidos = []
         cursor.close()
         conn.close()
         
@@ -3860,75 +4330,7 @@ def main(page: ft.Page):
             def guardar_cambios_pedido():
                 """Guarda los cambios realizados al pedido"""
                 try:
-                    conn = app.get_db_connection()
-                    cursor = conn.cursor()
-                    
-                    # Calcular nuevo total
-                    nuevo_total = sum(detalle["subtotal"] for detalle in detalles_modificados)
-                    
-                    # Actualizar total del pedido
-                    cursor.execute(
-                        "UPDATE pedidos SET total = %s WHERE id = %s",
-                        (nuevo_total, pedido_id)
-                    )
-                    
-                    # Obtener detalles actuales para comparar
-                    cursor.execute(
-                        "SELECT id, cantidad FROM detalle_pedido WHERE pedido_id = %s",
-                        (pedido_id,)
-                    )
-                    detalles_actuales = {row[0]: row[1] for row in cursor.fetchall()}
-                    
-                    # Identificar detalles a actualizar y eliminar
-                    ids_modificados = [d["id"] for d in detalles_modificados]
-                    ids_a_eliminar = [id_detalle for id_detalle in detalles_actuales if id_detalle not in ids_modificados]
-                    
-                    # Eliminar detalles que ya no están
-                    for id_detalle in ids_a_eliminar:
-                        # Obtener información del detalle antes de eliminarlo
-                        cursor.execute(
-                            "SELECT producto_id, cantidad FROM detalle_pedido WHERE id = %s",
-                            (id_detalle,)
-                        )
-                        detalle_a_eliminar = cursor.fetchone()
-                        if detalle_a_eliminar:
-                            # Restaurar stock
-                            cursor.execute(
-                                "UPDATE productos SET stock = stock + %s WHERE id = %s",
-                                (detalle_a_eliminar[1], detalle_a_eliminar[0])
-                            )
-                        
-                        # Eliminar detalle
-                        cursor.execute(
-                            "DELETE FROM detalle_pedido WHERE id = %s",
-                            (id_detalle,)
-                        )
-                    
-                    # Actualizar detalles modificados
-                    for detalle in detalles_modificados:
-                        if detalle["id"] in detalles_actuales:
-                            # Es un detalle existente, actualizarlo
-                            diferencia_cantidad = detalle["cantidad"] - detalles_actuales[detalle["id"]]
-                            
-                            # Actualizar detalle
-                            cursor.execute(
-                                """UPDATE detalle_pedido 
-                                SET cantidad = %s, precio_unitario = %s, subtotal = %s
-                                WHERE id = %s""",
-                                (detalle["cantidad"], detalle["precio_unitario"], 
-                                detalle["subtotal"], detalle["id"])
-                            )
-                            
-                            # Actualizar stock (restar si se aumentó la cantidad, sumar si se disminuyó)
-                            if diferencia_cantidad != 0:
-                                cursor.execute(
-                                    "UPDATE productos SET stock = stock - %s WHERE id = %s",
-                                    (diferencia_cantidad, detalle["producto_id"])
-                                )
-                    
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
+                    app.guardar_cambios_pedido(pedido_id, detalles_modificados)
                     
                     # Mostrar mensaje de éxito
                     page.snack_bar = ft.SnackBar(
@@ -3944,7 +4346,9 @@ def main(page: ft.Page):
                     cargar_pedidos()
                     
                 except Exception as e:
-                    page.snack_bar = ft.SnackBar(content=ft.Text(f"Error al actualizar pedido: {e}"))
+                    mensaje = (mensaje_faltantes(e) if isinstance(e, StockInsuficienteError)
+                               else f"Error al actualizar pedido: {e}")
+                    page.snack_bar = ft.SnackBar(content=ft.Text(mensaje))
                     page.snack_bar.open = True
                     page.update()
             
@@ -4296,6 +4700,7 @@ def main(page: ft.Page):
                     ], spacing=5),
                     ft.Container(height=8),
                     producto_search,
+                    modo_escaner,
                     ft.Container(height=5),
                     # ✅ LISTA DE PRODUCTOS - Más grande y cómoda
                     ft.Container(
@@ -4372,7 +4777,7 @@ def main(page: ft.Page):
                                     content=ft.Column([
                                         ft.Text("Selección de Productos", 
                                             size=18, weight=ft.FontWeight.BOLD),
-                                        producto_search,
+                                        ft.Row([producto_search, modo_escaner]),
                                         ft.Container(content=productos_list, margin=ft.margin.only(top=10, bottom=10)),
                                         ft.Row([
                                             ft.Text("Cantidad:"),
@@ -4460,7 +4865,7 @@ def main(page: ft.Page):
         components_loaded = True
         
         # Actualizar si hay productos en el pedido
-        if current_order:
+        if carrito:
             actualizar_tabla_pedido()
             aplicar_mejoras_movil()
 
@@ -4469,4 +4874,20 @@ def main(page: ft.Page):
     load_components()
 
 # Ejecutar la aplicación
-ft.app(target=main, port=8550, view=ft.AppView.FLET_APP)
\ No newline at end of file
+if __name__ == "__main__":
+    app_core = DistriSulpiApp.instancia()
+    
+    # "python main.py --migrate" solo prepara la base de datos y termina
+    if "--migrate" in sys.argv:
+        sys.exit(0 if app_core.preparar_base() else 1)
+    
+    # "python main.py --verificar-indices [--crear-indices]" revisa los índices de una base existente
+    if "--verificar-indices" in sys.argv:
+        reporte = app_core.revisar_indices(crear_faltantes="--crear-indices" in sys.argv)
+        # Falla si falta un índice o si una consulta por fecha no puede recorrer idx_pedidos_fecha por rango
+        correcto = (reporte is not None and not reporte["faltantes"]
+                    and all(utilizable for *_, utilizable in reporte["planes"]))
+        sys.exit(0 if correcto else 1)
+    
+    app_core.bootstrap()
+    ft.app(target=main, port=8550, view=ft.AppView.FLET_APP)
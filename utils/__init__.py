@@ -0,0 +1 @@
+"""Utilidades de DistriSulpi"""
@@ -0,0 +1,309 @@
+"""Índice de búsqueda de productos por nombre.
+
+Los nombres se normalizan (minúsculas, sin acentos ni puntuación) y se indexan
+de dos formas: un vocabulario ordenado de palabras, para encontrar por prefijo
+con búsqueda binaria, y un índice invertido de trigramas, para encontrar
+fragmentos dentro de una palabra ("200" en "x200gs"). Una consulta de varias
+palabras devuelve los productos que contienen todas.
+
+Orden de los resultados: primero los nombres que empiezan con la consulta,
+después los que tienen palabras que empiezan con cada término, y al final los
+que solo los contienen; dentro de cada grupo, por orden alfabético.
+
+BusquedaIncremental arma sobre el índice la búsqueda de una sesión: espera a
+que el operador deje de escribir, descarta las búsquedas que quedaron viejas y,
+si la consulta nueva extiende a la anterior, filtra el resultado anterior en
+lugar de volver a recorrer el índice.
+"""
+
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+_NO_ALFANUMERICO = re.compile(r"[^0-9a-z]+")
+
+
+def normalizar(texto):
+    """'9 ORO Agridulce X200GS.' -> '9 oro agridulce x200gs'"""
+    texto = unicodedata.normalize("NFKD", str(texto).lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _NO_ALFANUMERICO.sub(" ", texto).strip()
+
+
+def _trigramas(palabra):
+    return {palabra[i:i + 3] for i in range(len(palabra) - 2)}
+
+
+def _empieza_palabra(nombre, termino):
+    """Indica si alguna palabra del nombre empieza con el término"""
+    return nombre.startswith(termino) or (" " + termino) in nombre
+
+
+def se_puede_refinar(anterior, nueva):
+    """Indica si los resultados de 'nueva' están contenidos en los de 'anterior'.
+
+    Ambas consultas ya normalizadas. Vale cuando la nueva extiende a la anterior,
+    salvo que su último término pase de 2 a 3 letras: desde 3 letras un término
+    también coincide dentro de una palabra, no solo al comienzo.
+    """
+    if not anterior or not nueva.startswith(anterior):
+        return False
+    ultimo_anterior = anterior.split()[-1]
+    if len(ultimo_anterior) >= 3 or nueva[len(anterior):len(anterior) + 1] == " ":
+        return True
+    return len(nueva[len(anterior) - len(ultimo_anterior):].split()[0]) < 3
+
+
+class IndiceBusqueda:
+    """Índice de nombres de producto; buscar() devuelve ids ordenados por relevancia"""
+
+    def __init__(self, productos=()):
+        self._claves = {}         # id -> (nombre normalizado, id): clave de orden
+        self._palabras = {}       # palabra -> [claves] ordenadas
+        self._vocabulario = []    # palabras ordenadas, para buscar por prefijo
+        self._trigramas = {}      # trigrama -> {ids}
+        self._por_nombre = []     # todas las claves ordenadas
+
+        # Carga inicial: se indexa todo y se ordena una sola vez al final
+        for producto in productos:
+            self._indexar(producto["id"], normalizar(producto["nombre"]))
+        for claves in self._palabras.values():
+            claves.sort()
+        self._vocabulario = sorted(self._palabras)
+        self._por_nombre = sorted(self._claves.values())
+
+    def __len__(self):
+        return len(self._claves)
+
+    def a_datos(self):
+        """Estado del índice en listas y diccionarios simples (para la instantánea en JSON)"""
+        return {
+            "nombres": [[producto_id, normalizado] for normalizado, producto_id in self._por_nombre],
+            "palabras": {palabra: [clave[1] for clave in claves] for palabra, claves in self._palabras.items()},
+            "trigramas": {trigrama: list(ids) for trigrama, ids in self._trigramas.items()}
+        }
+
+    @classmethod
+    def desde_datos(cls, datos):
+        """Rearma el índice guardado con a_datos() sin volver a normalizar ni ordenar los nombres"""
+        indice = cls()
+        indice._por_nombre = [(str(normalizado), int(producto_id)) for producto_id, normalizado in datos["nombres"]]
+        indice._claves = {clave[1]: clave for clave in indice._por_nombre}
+        claves = indice._claves
+        indice._palabras = {palabra: [claves[int(i)] for i in ids] for palabra, ids in datos["palabras"].items()}
+        indice._vocabulario = sorted(indice._palabras)
+        indice._trigramas = {trigrama: {int(i) for i in ids} for trigrama, ids in datos["trigramas"].items()}
+        return indice
+
+    def _indexar(self, producto_id, normalizado):
+        """Agrega el producto a los diccionarios sin ordenar; devuelve su clave y sus palabras nuevas"""
+        clave = self._claves[producto_id] = (normalizado, producto_id)
+        nuevas = []
+        for palabra in set(normalizado.split()):
+            claves = self._palabras.get(palabra)
+            if claves is None:
+                claves = self._palabras[palabra] = []
+                nuevas.append(palabra)
+            claves.append(clave)
+            for trigrama in _trigramas(palabra):
+                self._trigramas.setdefault(trigrama, set()).add(producto_id)
+        return clave, nuevas
+
+    def agregar(self, producto_id, nombre):
+        """Indexa un producto; si ya estaba, reemplaza su nombre"""
+        if producto_id in self._claves:
+            self.quitar(producto_id)
+        normalizado = normalizar(nombre)
+        # Se agrega al final de cada lista y se reubica con insort para mantener el orden
+        clave, nuevas = self._indexar(producto_id, normalizado)
+        for palabra in set(normalizado.split()):
+            claves = self._palabras[palabra]
+            claves.pop()
+            insort(claves, clave)
+        for palabra in nuevas:
+            insort(self._vocabulario, palabra)
+        insort(self._por_nombre, clave)
+
+    def quitar(self, producto_id):
+        """Saca un producto del índice"""
+        clave = self._claves.pop(producto_id, None)
+        if clave is None:
+            return
+        del self._por_nombre[bisect_left(self._por_nombre, clave)]
+        for palabra in set(clave[0].split()):
+            claves = self._palabras[palabra]
+            del claves[bisect_left(claves, clave)]
+            if not claves:
+                del self._palabras[palabra]
+                del self._vocabulario[bisect_left(self._vocabulario, palabra)]
+            for trigrama in _trigramas(palabra):
+                ids = self._trigramas.get(trigrama)
+                if ids is not None:
+                    ids.discard(producto_id)
+                    if not ids:
+                        del self._trigramas[trigrama]
+
+    def _palabras_con_prefijo(self, prefijo):
+        """Palabras del vocabulario que empiezan con el prefijo"""
+        inicio = bisect_left(self._vocabulario, prefijo)
+        fin = inicio
+        while fin < len(self._vocabulario) and self._vocabulario[fin].startswith(prefijo):
+            fin += 1
+        return self._vocabulario[inicio:fin]
+
+    def _con_fragmentos(self, fragmentos):
+        """Ids cuyo nombre contiene todos los fragmentos (de 3 letras o más)"""
+        trigramas = set()
+        for fragmento in fragmentos:
+            trigramas |= _trigramas(fragmento)
+        conjuntos = sorted((self._trigramas.get(t, set()) for t in trigramas), key=len)
+        candidatos = set(conjuntos[0])
+        for conjunto in conjuntos[1:]:
+            candidatos &= conjunto
+            if not candidatos:
+                return candidatos
+        return {i for i in candidatos if all(f in self._claves[i][0] for f in fragmentos)}
+
+    def refinar(self, ids, consulta, limite=None):
+        """Filtra y ordena 'ids' (resultado completo de una consulta anterior) para la nueva consulta"""
+        normalizada = normalizar(consulta)
+        if not normalizada:
+            return []
+        terminos = normalizada.split()
+        por_fragmento = min(len(t) for t in terminos) >= 3
+        ordenados = []
+        for producto_id in ids:
+            clave = self._claves.get(producto_id)
+            if clave is None:
+                continue
+            nombre = clave[0]
+            if nombre.startswith(normalizada):
+                grupo = 0
+            elif all(_empieza_palabra(nombre, t) for t in terminos):
+                grupo = 1
+            elif por_fragmento and all(t in nombre for t in terminos):
+                grupo = 2
+            else:
+                continue
+            ordenados.append((grupo, clave))
+        ordenados = sorted(ordenados) if limite is None else heapq.nsmallest(limite, ordenados)
+        return [clave[1] for _, clave in ordenados]
+
+    def buscar(self, consulta, limite=None):
+        """Devuelve los ids que coinciden con la consulta, de más a menos relevante.
+
+        Con 'limite' la búsqueda se detiene en cuanto junta esa cantidad, así
+        que el costo depende de los resultados pedidos y no del catálogo.
+        """
+        normalizada = normalizar(consulta)
+        if not normalizada:
+            return []
+        terminos = sorted(set(normalizada.split()), key=len, reverse=True)
+        resultados = []
+        vistos = set()
+
+        def completo():
+            return limite is not None and len(resultados) >= limite
+
+        # 1) Nombres que empiezan con la consulta completa, en orden alfabético
+        i = bisect_left(self._por_nombre, (normalizada,))
+        while i < len(self._por_nombre) and self._por_nombre[i][0].startswith(normalizada):
+            resultados.append(self._por_nombre[i][1])
+            vistos.add(self._por_nombre[i][1])
+            if completo():
+                return resultados
+            i += 1
+
+        # 2) Cada término es el comienzo de alguna palabra. Se recorren en orden
+        # las listas del término más selectivo y se verifican los demás en el nombre
+        palabras = {t: self._palabras_con_prefijo(t) for t in terminos}
+        guia = min(terminos, key=lambda t: sum(len(self._palabras[p]) for p in palabras[t]))
+        otros = [t for t in terminos if t != guia]
+        for nombre, producto_id in heapq.merge(*(self._palabras[p] for p in palabras[guia])):
+            if producto_id in vistos:
+                continue
+            if all(_empieza_palabra(nombre, t) for t in otros):
+                resultados.append(producto_id)
+                vistos.add(producto_id)
+                if completo():
+                    return resultados
+
+        # 3) Cada término aparece dentro del nombre (solo términos de 3 letras o más)
+        if len(terminos[-1]) < 3:
+            return resultados
+        candidatos = [self._claves[i] for i in self._con_fragmentos(terminos) if i not in vistos]
+        restantes = None if limite is None else limite - len(resultados)
+        ordenados = sorted(candidatos) if restantes is None else heapq.nsmallest(restantes, candidatos)
+        resultados.extend(producto_id for _, producto_id in ordenados)
+        return resultados
+
+
+class BusquedaIncremental:
+    """Búsqueda de una sesión con espera entre teclas y refinamiento del resultado anterior.
+
+    escribir() se llama en cada cambio del campo de búsqueda. La búsqueda corre
+    recién cuando pasan 'demora' segundos sin cambios, y publicar(consulta,
+    productos) se llama solo si nadie escribió mientras tanto.
+    """
+
+    def __init__(self, catalogo, publicar, demora=0.15, limite=None):
+        self._catalogo = catalogo
+        self._publicar = publicar
+        self._demora = demora
+        self._limite = limite
+        self._lock = threading.Lock()
+        self._lock_publicar = threading.Lock()
+        self._generacion = 0
+        self._temporizador = None
+        # (índice, consulta normalizada, ids) de la última búsqueda completa
+        self._anterior = None
+
+    def escribir(self, consulta):
+        """Programa la búsqueda de 'consulta' y descarta las anteriores pendientes"""
+        with self._lock:
+            self._generacion += 1
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+            self._temporizador = threading.Timer(self._demora, self._ejecutar, (self._generacion, consulta))
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def cancelar(self):
+        """Descarta la búsqueda pendiente y la que esté en curso"""
+        with self._lock:
+            self._generacion += 1
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+                self._temporizador = None
+
+    def buscar(self, consulta):
+        """Busca en el momento, refinando el resultado anterior cuando se puede"""
+        normalizada = normalizar(consulta)
+        if not normalizada:
+            return []
+        # Cada recarga del catálogo trae un índice nuevo e invalida el resultado anterior
+        indice = self._catalogo.indice
+        anterior = self._anterior
+        if anterior and anterior[0] is indice and se_puede_refinar(anterior[1], normalizada):
+            ids = indice.refinar(anterior[2], normalizada, self._limite)
+        else:
+            ids = indice.buscar(normalizada, self._limite)
+
+        completo = self._limite is None or len(ids) < self._limite
+        self._anterior = (indice, normalizada, ids) if completo else None
+        productos = (self._catalogo.obtener(producto_id) for producto_id in ids)
+        return [producto for producto in productos if producto is not None]
+
+    def _vigente(self, generacion):
+        return generacion == self._generacion
+
+    def _ejecutar(self, generacion, consulta):
+        if not self._vigente(generacion):
+            return
+        productos = self.buscar(consulta)
+        # Se publica en orden: si llegó una consulta más nueva, esta se descarta
+        with self._lock_publicar:
+            if self._vigente(generacion):
+                self._publicar(consulta, productos)
@@ -0,0 +1,118 @@
+"""Carrito del pedido en curso de una sesión.
+
+Las líneas se guardan en un diccionario ordenado por producto_id: agregar un
+producto que ya está suma la cantidad sin recorrer el pedido, y el total se
+lleva en centavos a medida que cambian las líneas, sin volver a sumarlas.
+
+Cada cambio avisa a los suscriptores con (evento, línea), para que la interfaz
+agregue, modifique o quite una sola fila en lugar de redibujar la tabla.
+Las líneas son diccionarios con las claves que usa guardar_pedido.
+"""
+
+from collections import OrderedDict
+
+from utils.catalogo import a_centavos
+
+AGREGADA = "agregada"
+ACTUALIZADA = "actualizada"
+QUITADA = "quitada"
+VACIADO = "vaciado"
+
+
+class Carrito:
+    """Líneas del pedido en curso, por producto, con el total al día"""
+
+    def __init__(self):
+        self._lineas = OrderedDict()   # producto_id -> línea
+        self._centavos = {}            # producto_id -> subtotal en centavos
+        self._total_centavos = 0
+        self._suscriptores = []
+
+    def suscribir(self, callback):
+        """Registra callback(evento, linea); con VACIADO la línea es None"""
+        self._suscriptores.append(callback)
+
+    def desuscribir(self, callback):
+        if callback in self._suscriptores:
+            self._suscriptores.remove(callback)
+
+    def __len__(self):
+        return len(self._lineas)
+
+    def __iter__(self):
+        return iter(self._lineas.values())
+
+    def __contains__(self, producto_id):
+        return producto_id in self._lineas
+
+    def obtener(self, producto_id):
+        return self._lineas.get(producto_id)
+
+    @property
+    def total(self):
+        return self._total_centavos / 100
+
+    def detalles(self):
+        """Copia de las líneas, en el orden en que se agregaron, para guardar el pedido"""
+        return [dict(linea) for linea in self._lineas.values()]
+
+    def agregar(self, producto_id, nombre, cantidad, precio):
+        """Agrega el producto o, si ya estaba, suma la cantidad (con el precio de la línea)"""
+        linea = self._lineas.get(producto_id)
+        if linea is not None:
+            return self._cambiar(producto_id, cantidad=linea["cantidad"] + cantidad)
+        linea = {
+            "producto_id": producto_id,
+            "producto_nombre": nombre,
+            "cantidad": cantidad,
+            "precio_unitario": precio,
+            "subtotal": precio * cantidad
+        }
+        self._lineas[producto_id] = linea
+        self._sumar(producto_id, linea)
+        self._avisar(AGREGADA, linea)
+        return linea
+
+    def fijar_cantidad(self, producto_id, cantidad):
+        return self._cambiar(producto_id, cantidad=cantidad)
+
+    def fijar_precio(self, producto_id, precio):
+        return self._cambiar(producto_id, precio=precio)
+
+    def quitar(self, producto_id):
+        linea = self._lineas.pop(producto_id, None)
+        if linea is None:
+            return None
+        self._total_centavos -= self._centavos.pop(producto_id)
+        self._avisar(QUITADA, linea)
+        return linea
+
+    def vaciar(self):
+        self._lineas.clear()
+        self._centavos.clear()
+        self._total_centavos = 0
+        self._avisar(VACIADO, None)
+
+    def _cambiar(self, producto_id, cantidad=None, precio=None):
+        linea = self._lineas[producto_id]
+        if cantidad is not None:
+            linea["cantidad"] = cantidad
+        if precio is not None:
+            linea["precio_unitario"] = precio
+        linea["subtotal"] = linea["cantidad"] * linea["precio_unitario"]
+        self._total_centavos -= self._centavos[producto_id]
+        self._sumar(producto_id, linea)
+        self._avisar(ACTUALIZADA, linea)
+        return linea
+
+    def _sumar(self, producto_id, linea):
+        centavos = a_centavos(linea["subtotal"])
+        self._centavos[producto_id] = centavos
+        self._total_centavos += centavos
+
+    def _avisar(self, evento, linea):
+        for callback in list(self._suscriptores):
+            try:
+                callback(evento, linea)
+            except Exception as e:
+                print(f"Error al actualizar el carrito ({evento}): {e}")
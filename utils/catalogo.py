@@ -0,0 +1,366 @@
+"""Catálogo de productos en memoria, compartido por todas las sesiones del proceso.
+
+Se carga una vez desde la base y se mantiene al día con las escrituras de la
+propia aplicación: el stock se corrige en el lugar al confirmar un pedido o una
+edición, y también los productos que modifica una importación de CSV; solo una
+importación que agrega productos recarga el catálogo completo, porque los
+nombres nuevos tienen que entrar al índice de búsqueda. Cada
+cambio incrementa 'version', así una sesión puede saber si lo que muestra quedó
+desactualizado. Los productos que venden otras sesiones mientras el catálogo se
+recarga se releen de la base al terminar la recarga (ver refrescar()).
+
+Las búsquedas por nombre usan un IndiceBusqueda que se reconstruye con cada
+recarga; las correcciones de stock no lo tocan porque no cambian nombres. Los
+códigos de barras se resuelven con un diccionario exacto, sin pasar por el índice.
+
+Cada producto se guarda como un registro Producto con __slots__: precios en
+centavos enteros en lugar de Decimal y nombres internados, lo que reduce la
+memoria de catálogos grandes y evita convertir Decimal a float en cada uso.
+
+Con un CanalEventos, cada cambio se publica para las sesiones abiertas:
+EVENTO_STOCK lleva {producto_id: stock actual} de los productos tocados (por
+una venta o por una importación) y EVENTO_RECARGA avisa que los registros se
+reemplazaron por completo.
+
+Con una ruta de instantánea, el catálogo y su índice se guardan en disco unos
+segundos después de cada cambio (ver utils/instantanea.py) y el próximo arranque
+los toma de ahí mientras verifica contra la base, en segundo plano, que sigan
+vigentes.
+"""
+
+import sys
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+from utils import instantanea
+from utils.busqueda import IndiceBusqueda
+
+EVENTO_STOCK = "catalogo.stock"
+EVENTO_RECARGA = "catalogo.recarga"
+
+
+def a_centavos(valor):
+    """Decimal, float o texto con dos decimales -> centavos enteros"""
+    return int((Decimal(str(valor)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+class Producto:
+    """Registro compacto de un producto del catálogo.
+
+    Se lee por atributo (producto.stock); producto["stock"] y producto.get()
+    siguen funcionando para el código escrito contra las filas en dict.
+    """
+
+    __slots__ = ("id", "nombre", "precio_centavos", "costo_centavos", "stock", "codigo")
+
+    def __init__(self, id, nombre, precio_centavos, costo_centavos, stock, codigo=None):
+        self.id = id
+        self.nombre = nombre
+        self.precio_centavos = precio_centavos
+        self.costo_centavos = costo_centavos
+        self.stock = stock
+        self.codigo = codigo
+
+    @classmethod
+    def desde_fila(cls, fila):
+        """Convierte una fila de cursor(dictionary=True) de la tabla productos"""
+        return cls(
+            int(fila["id"]),
+            sys.intern(str(fila["nombre"])),
+            a_centavos(fila["precio_venta"]),
+            a_centavos(fila["costo"]),
+            int(fila["stock"]),
+            fila.get("codigo") or None
+        )
+
+    @property
+    def precio_venta(self):
+        return self.precio_centavos / 100
+
+    @property
+    def costo(self):
+        return self.costo_centavos / 100
+
+    def __getitem__(self, clave):
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+
+    def get(self, clave, defecto=None):
+        return getattr(self, clave, defecto)
+
+    def __repr__(self):
+        return f"Producto(id={self.id}, nombre={self.nombre!r}, stock={self.stock})"
+
+
+class CatalogoCache:
+    """Copia en memoria de la tabla productos"""
+
+    # Relecturas como máximo después de una recarga, mientras sigan llegando cambios de stock
+    RELECTURAS_MAXIMAS = 3
+
+    def __init__(self, cargar, firma=None, ruta_instantanea=None, demora_guardado=2.0, eventos=None,
+                 cargar_stock=None):
+        # cargar() devuelve las filas de productos (dicts) o None si no pudo leerlas;
+        # firma() devuelve la firma de la tabla (ver utils/instantanea.py) o None;
+        # cargar_stock(ids) devuelve {producto_id: stock} de esos productos o None
+        self._cargar = cargar
+        self._firma = firma
+        self._cargar_stock = cargar_stock
+        self._eventos = eventos
+        self.ruta_instantanea = ruta_instantanea
+        self._demora_guardado = demora_guardado
+        self._temporizador = None
+        self._lock_guardado = threading.Lock()
+        self._productos = None
+        self._por_id = {}
+        self._por_codigo = {}
+        self._indice = IndiceBusqueda()
+        self._lock = threading.Lock()
+        # Productos cuyo stock cambió durante cada recarga en curso, para releerlos de la base
+        self._registros_recarga = []
+        self.version = 0
+
+    def productos(self):
+        """Devuelve la lista de productos (registros Producto), cargándola la primera vez"""
+        productos = self._productos
+        if productos is None:
+            productos = self.refrescar()
+        return productos if productos is not None else []
+
+    def obtener(self, producto_id):
+        """Devuelve el producto con ese id, o None"""
+        if self._productos is None:
+            self.refrescar()
+        return self._por_id.get(producto_id)
+
+    @property
+    def indice(self):
+        """Índice de búsqueda del catálogo vigente"""
+        if self._productos is None:
+            self.refrescar()
+        return self._indice
+
+    def buscar(self, consulta, limite=None):
+        """Productos cuyo nombre coincide con la consulta, ordenados por relevancia"""
+        if self._productos is None:
+            self.refrescar()
+        por_id = self._por_id
+        return [por_id[i] for i in self._indice.buscar(consulta, limite) if i in por_id]
+
+    def buscar_codigo(self, codigo):
+        """Devuelve el producto con ese código de barras o SKU, o None"""
+        codigo = str(codigo).strip()
+        if not codigo:
+            return None
+        if self._productos is None:
+            self.refrescar()
+        return self._por_codigo.get(codigo)
+
+    def refrescar(self):
+        """Vuelve a leer todo el catálogo desde la base.
+
+        La lectura y el armado ocurren fuera del lock, así que una venta
+        confirmada mientras tanto se aplica sobre los registros anteriores y no
+        se sabe si la lectura ya la incluye. Por eso no se repite el cambio: se
+        anotan los productos tocados y, ya reemplazados los registros, se relee
+        de la base el stock de esos productos.
+        """
+        registro = set()
+        with self._lock:
+            self._registros_recarga.append(registro)
+        try:
+            filas = self._cargar()
+            if filas is None:
+                return None
+            # Los registros y el índice se arman fuera del lock; las búsquedas siguen usando los anteriores
+            productos = [Producto.desde_fila(fila) for fila in filas]
+            indice = IndiceBusqueda(productos)
+            with self._lock:
+                self._productos = productos
+                self._por_id = {producto.id: producto for producto in productos}
+                self._por_codigo = {producto.codigo: producto for producto in productos if producto.codigo}
+                self._indice = indice
+                self.version += 1
+            self._releer_stock(registro)
+        finally:
+            with self._lock:
+                self._registros_recarga = [r for r in self._registros_recarga if r is not registro]
+        self._programar_guardado()
+        self._publicar(EVENTO_RECARGA, self.version)
+        return productos
+
+    def _releer_stock(self, registro):
+        """Corrige con la base el stock de los productos anotados en el registro de una recarga.
+
+        El registro sigue abierto mientras se relee: si otra venta toca esos
+        productos en el medio, se vuelven a leer.
+        """
+        if self._cargar_stock is None:
+            return
+        for _ in range(self.RELECTURAS_MAXIMAS):
+            with self._lock:
+                ids = sorted(registro)
+                registro.clear()
+            if not ids:
+                return
+            stock = self._cargar_stock(ids)
+            if stock is None:
+                return
+            self._fijar(stock)
+
+    def invalidar(self):
+        """Descarta la copia; la próxima lectura vuelve a la base"""
+        with self._lock:
+            self._productos = None
+            self._por_id = {}
+            self._por_codigo = {}
+            self._indice = IndiceBusqueda()
+            self.version += 1
+        self._publicar(EVENTO_RECARGA, self.version)
+
+    def _publicar(self, tema, datos):
+        if self._eventos is not None:
+            self._eventos.publicar(tema, datos)
+
+    def aplicar_deltas_stock(self, cantidades):
+        """Descuenta del stock en memoria {producto_id: cantidad} ya confirmado en la base.
+
+        Un valor negativo devuelve stock, igual que en database.pedidos.reservar_stock.
+        """
+        if not cantidades:
+            return
+        stock = {}
+        with self._lock:
+            for registro in self._registros_recarga:
+                registro.update(cantidades)
+            if self._productos is None:
+                return
+            for producto_id, cantidad in cantidades.items():
+                producto = self._por_id.get(producto_id)
+                if producto is not None:
+                    producto.stock -= cantidad
+                    stock[producto_id] = producto.stock
+            self.version += 1
+        self._programar_guardado()
+        if stock:
+            self._publicar(EVENTO_STOCK, stock)
+
+    def fijar_stock(self, stock):
+        """Corrige el stock en memoria con valores leídos de la base: {producto_id: stock}"""
+        with self._lock:
+            for registro in self._registros_recarga:
+                registro.update(stock)
+        self._fijar(stock)
+
+    def _fijar(self, stock):
+        corregidos = {}
+        with self._lock:
+            if self._productos is None:
+                return
+            for producto_id, valor in stock.items():
+                producto = self._por_id.get(producto_id)
+                if producto is not None and producto.stock != valor:
+                    producto.stock = valor
+                    corregidos[producto_id] = valor
+            if corregidos:
+                self.version += 1
+        if corregidos:
+            self._programar_guardado()
+            self._publicar(EVENTO_STOCK, corregidos)
+
+    def actualizar_productos(self, filas):
+        """Aplica en el lugar productos existentes que cambiaron en la base (filas como las de cargar()).
+
+        Los nombres no cambian, así que el índice de búsqueda sigue valiendo.
+        Devuelve False sin tocar nada si alguna fila no está en el catálogo: hay
+        que recargarlo.
+        """
+        if not filas:
+            return True
+        nuevos = [Producto.desde_fila(fila) for fila in filas]
+        with self._lock:
+            for registro in self._registros_recarga:
+                registro.update(nuevo.id for nuevo in nuevos)
+            if self._productos is None:
+                # La próxima lectura va a la base
+                return True
+            actuales = [self._por_id.get(nuevo.id) for nuevo in nuevos]
+            if any(actual is None for actual in actuales):
+                return False
+            for actual in actuales:
+                if actual.codigo and self._por_codigo.get(actual.codigo) is actual:
+                    del self._por_codigo[actual.codigo]
+            for actual, nuevo in zip(actuales, nuevos):
+                actual.precio_centavos = nuevo.precio_centavos
+                actual.costo_centavos = nuevo.costo_centavos
+                actual.stock = nuevo.stock
+                actual.codigo = nuevo.codigo
+                if actual.codigo:
+                    self._por_codigo[actual.codigo] = actual
+            self.version += 1
+        self._programar_guardado()
+        # Las sesiones vuelven a pedir las filas de estos productos, así que también ven los precios nuevos
+        self._publicar(EVENTO_STOCK, {nuevo.id: nuevo.stock for nuevo in nuevos})
+        return True
+
+    def cargar_instantanea(self):
+        """Adopta la instantánea guardada si el catálogo aún no se cargó; devuelve True si la usó"""
+        if not self.ruta_instantanea or self._productos is not None:
+            return False
+        leida = instantanea.leer(self.ruta_instantanea)
+        if leida is None:
+            return False
+        _, productos, indice = leida
+        with self._lock:
+            if self._productos is not None:
+                return False
+            self._productos = productos
+            self._por_id = {producto.id: producto for producto in productos}
+            self._por_codigo = {producto.codigo: producto for producto in productos if producto.codigo}
+            self._indice = indice
+            self.version += 1
+        return True
+
+    def verificar_vigencia(self):
+        """Compara el catálogo con la firma de la base y lo recarga si difiere; devuelve True si estaba al día"""
+        if self._firma is None or self._productos is None:
+            return False
+        firma = self._firma()
+        if firma is None:
+            # Sin base se sigue con lo que hay en memoria
+            return False
+        with self._lock:
+            vigente = tuple(firma) == instantanea.firma_productos(self._productos)
+        if not vigente:
+            self.refrescar()
+        return vigente
+
+    def _programar_guardado(self):
+        """Guarda la instantánea unos segundos después del último cambio (varios cambios, una escritura)"""
+        if not self.ruta_instantanea:
+            return
+        with self._lock:
+            if self._temporizador is not None:
+                self._temporizador.cancel()
+            self._temporizador = threading.Timer(self._demora_guardado, self.guardar_instantanea)
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def guardar_instantanea(self):
+        """Escribe ahora la instantánea del catálogo en memoria"""
+        if not self.ruta_instantanea:
+            return False
+        with self._lock:
+            if self._productos is None:
+                return False
+            # Se serializa bloqueado para no capturar un descuento de stock a medias
+            datos = instantanea.serializar(self._productos, self._indice)
+        try:
+            with self._lock_guardado:
+                instantanea.escribir(self.ruta_instantanea, datos)
+            return True
+        except OSError as e:
+            print(f"No se pudo guardar la instantánea del catálogo: {e}")
+            return False
@@ -0,0 +1,167 @@
+"""Trabajo de CPU que se ejecuta en el pool de procesos.
+
+Las funciones de este módulo son de nivel superior y reciben solo datos simples
+para poder enviarse a otro proceso.
+"""
+
+import datetime
+import os
+
+
+def renderizar_grafico(etiquetas, valores, ruta, titulo, ylabel, color=None):
+    """Dibuja un gráfico de líneas y lo guarda como imagen; devuelve la ruta"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    fig, ax = plt.subplots(figsize=(10, 5))
+    if color:
+        ax.plot(etiquetas, valores, marker='o', color=color)
+    else:
+        ax.plot(etiquetas, valores, marker='o')
+    ax.set_title(titulo)
+    ax.set_xlabel('Fecha')
+    ax.set_ylabel(ylabel)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.savefig(ruta)
+    plt.close(fig)
+    return ruta
+
+
+def ajustar_prediccion(resultados):
+    """Ajusta una regresión lineal sobre [(día, total)] y predice los próximos 30 días"""
+    import numpy as np
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+
+    if len(resultados) < 10:  # Necesitamos suficientes datos para la predicción
+        return None, "No hay suficientes datos históricos para hacer una predicción precisa"
+
+    # Convertir fechas a días desde la primera venta
+    dias = []
+    for dia, _ in resultados:
+        if isinstance(dia, str):
+            dia = datetime.datetime.strptime(dia, "%Y-%m-%d").date()
+        dias.append(dia)
+    fechas = [(dia - dias[0]).days for dia in dias]
+    ventas = [float(total) for _, total in resultados]
+
+    X = np.array(fechas).reshape(-1, 1)
+    y = np.array(ventas)
+
+    # Dividir datos para entrenamiento y prueba
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    model = LinearRegression()
+    model.fit(X_train, y_train)
+    score = model.score(X_test, y_test)
+
+    # Predicción para los próximos 30 días
+    ultimo_dia = fechas[-1]
+    dias_futuros = np.array(range(ultimo_dia + 1, ultimo_dia + 31)).reshape(-1, 1)
+    predicciones = model.predict(dias_futuros)
+    fechas_futuras = [dias[0] + datetime.timedelta(days=int(dia)) for dia in dias_futuros.flatten()]
+
+    return {
+        'fechas': fechas_futuras,
+        'predicciones': predicciones.tolist(),
+        'precision': score
+    }, "Predicción generada correctamente"
+
+
+def renderizar_factura(datos, ruta=None):
+    """Arma el PDF de la factura a partir de los datos ya consultados.
+
+    datos es el diccionario de DistriSulpiApp.datos_factura. Sin 'ruta' devuelve
+    el contenido del PDF; con 'ruta' lo escribe en un temporal, lo reemplaza de
+    una vez y devuelve la ruta.
+    """
+    from io import BytesIO
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+    pedido_id = datos["pedido_id"]
+    fecha = datos["fecha"]
+
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Título y datos del cliente
+    elements.append(Paragraph(f"<b>DistriSulpi - Factura #{pedido_id}</b>", styles['Title']))
+    data_cliente = [
+        [Paragraph("<b>Cliente:</b>", styles['Normal']), datos["cliente"]],
+        [Paragraph("<b>Zona:</b>", styles['Normal']), datos["zona"]],
+        [Paragraph("<b>Fecha:</b>", styles['Normal']),
+         fecha.strftime('%d/%m/%Y %H:%M') if hasattr(fecha, "strftime") else str(fecha)],
+        [Paragraph("<b>Nro. Factura:</b>", styles['Normal']), f"#{pedido_id}"]
+    ]
+    tabla_cliente = Table(data_cliente, colWidths=[doc.width*0.3, doc.width*0.7])
+    tabla_cliente.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.lavender),
+        ('TEXTCOLOR', (0, 0), (0, -1), colors.black),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+        ('BACKGROUND', (1, 0), (1, -1), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    elements.append(tabla_cliente)
+    elements.append(Paragraph("<br/>", styles['Normal']))
+
+    # Nombres de producto limitados a 30 caracteres
+    max_chars = 30
+    data = [["Producto", "Cantidad", "Precio Unit.", "Subtotal"]]
+    total = 0
+    for nombre_producto, cantidad, precio_unitario, subtotal in datos["lineas"]:
+        if len(nombre_producto) > max_chars:
+            nombre_producto = nombre_producto[:max_chars] + "..."
+        data.append([
+            nombre_producto,
+            str(cantidad),
+            f"${precio_unitario:.2f}",
+            f"${subtotal:.2f}"
+        ])
+        total += subtotal
+    data.append(["", "", "TOTAL", f"${total:.2f}"])
+
+    col_widths = [doc.width*0.5, doc.width*0.1, doc.width*0.2, doc.width*0.2]
+    table = Table(data, colWidths=col_widths)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -2), colors.beige),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('ALIGN', (1, 0), (1, -1), 'CENTER'),
+        ('ALIGN', (2, 0), (3, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
+        ('GRID', (0, 0), (-1, -2), 1, colors.black),
+        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+        ('GRID', (2, -1), (-1, -1), 1, colors.black),
+    ]))
+    elements.append(table)
+
+    doc.build(elements)
+    pdf_content = buffer.getvalue()
+    buffer.close()
+
+    if ruta is None:
+        return pdf_content
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(pdf_content)
+    os.replace(temporal, ruta)
+    return ruta
@@ -0,0 +1,48 @@
+"""Canal de eventos entre las sesiones del proceso.
+
+Cada sesión de Flet corre en el mismo proceso que el núcleo de la aplicación,
+así que basta un registro de callbacks por tema: el que publica llama a los
+suscriptores desde su propio hilo, fuera del lock. Un suscriptor que falla se
+informa por consola y no afecta a los demás.
+"""
+
+import itertools
+import threading
+
+
+class CanalEventos:
+    """Publicación y suscripción por tema dentro del proceso"""
+
+    def __init__(self):
+        self._suscriptores = {}   # tema -> {token: callback}
+        self._tokens = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def suscribir(self, tema, callback):
+        """Registra callback(datos) para el tema y devuelve el token para desuscribirse"""
+        with self._lock:
+            token = next(self._tokens)
+            self._suscriptores.setdefault(tema, {})[token] = callback
+            return token
+
+    def desuscribir(self, token):
+        """Quita la suscripción del token (de cualquier tema)"""
+        with self._lock:
+            for callbacks in self._suscriptores.values():
+                if callbacks.pop(token, None) is not None:
+                    return True
+        return False
+
+    def cantidad(self, tema):
+        """Suscriptores actuales del tema"""
+        return len(self._suscriptores.get(tema, ()))
+
+    def publicar(self, tema, datos):
+        """Llama a todos los suscriptores del tema con los datos"""
+        with self._lock:
+            callbacks = list(self._suscriptores.get(tema, {}).values())
+        for callback in callbacks:
+            try:
+                callback(datos)
+            except Exception as e:
+                print(f"Error en un suscriptor de '{tema}': {e}")
@@ -0,0 +1,196 @@
+"""Cola de facturas: arma los PDF en el pool de procesos, fuera del guardado.
+
+Guardar un pedido no espera a su factura. solicitar() registra un trabajo por
+pedido: los datos se consultan en el pool de hilos y el PDF se arma y se escribe
+en el pool de procesos (renderizar_factura no toca la base). Cuando el archivo
+está listo se llama a los callbacks del trabajo, que pueden habilitar los
+botones de descarga.
+
+Pedir la factura de un pedido que ya se está armando no lanza otro trabajo: se
+suma el callback. Con 'maximo' trabajos en curso, solicitar() lanza
+ColaFacturasLlena en lugar de acumular trabajo que la terminal no puede atender.
+
+Cada trabajo escribe el PDF en un archivo propio y recién al terminar lo mueve
+a la ruta de la factura, si no se descartó mientras tanto: la factura de un
+pedido editado que todavía se estaba armando no pisa la nueva.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils.computo import renderizar_factura
+
+PENDIENTE = "pendiente"
+RENDERIZANDO = "renderizando"
+LISTA = "lista"
+ERROR = "error"
+
+# Error de un trabajo descartado porque el pedido cambió mientras se armaba
+DESCARTADA = "El pedido cambió mientras se armaba la factura; vuelva a pedirla"
+
+
+class ColaFacturasLlena(Exception):
+    """Hay demasiadas facturas en preparación"""
+
+    def __init__(self, en_curso):
+        self.en_curso = en_curso
+        super().__init__(f"Hay {en_curso} facturas en preparación; intente de nuevo en unos segundos")
+
+
+class TrabajoFactura:
+    """Estado de la factura de un pedido"""
+
+    def __init__(self, pedido_id, ruta, version):
+        self.pedido_id = pedido_id
+        self.ruta = ruta
+        # El proceso escribe acá; el archivo se mueve a 'ruta' si el trabajo sigue vigente
+        self.ruta_parcial = f"{ruta}.{version}.parcial"
+        self.descartado = False
+        self.estado = PENDIENTE
+        self.error = None
+        self.creado = time.monotonic()
+        self.terminado = None
+        self._callbacks = []
+
+    @property
+    def en_curso(self):
+        return self.estado in (PENDIENTE, RENDERIZANDO)
+
+    @property
+    def duracion(self):
+        """Segundos desde la solicitud hasta el PDF listo (o hasta ahora)"""
+        return (self.terminado or time.monotonic()) - self.creado
+
+    def __repr__(self):
+        return f"TrabajoFactura(pedido_id={self.pedido_id!r}, estado={self.estado!r})"
+
+
+class ColaFacturas:
+    """Facturas pedidas por las sesiones, armadas en segundo plano.
+
+    obtener_datos(pedido_id) devuelve el diccionario que recibe
+    renderizar_factura, o None si el pedido no existe.
+    """
+
+    def __init__(self, tareas, obtener_datos, directorio="temp", maximo=16, historial=200):
+        self._tareas = tareas
+        self._obtener_datos = obtener_datos
+        self.directorio = directorio
+        self.maximo = maximo
+        self._historial = historial
+        self._trabajos = OrderedDict()   # pedido_id -> TrabajoFactura
+        self._en_curso = 0
+        self._versiones = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def ruta(self, pedido_id):
+        return os.path.join(self.directorio, f"factura_{pedido_id}.pdf")
+
+    def solicitar(self, pedido_id, callback=None):
+        """Pide la factura del pedido y devuelve su trabajo.
+
+        callback(trabajo) se llama una vez, desde otro hilo, cuando el trabajo
+        termina (trabajo.estado es LISTA o ERROR); si la factura ya estaba
+        lista se llama enseguida.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(pedido_id)
+            if trabajo is not None and trabajo.en_curso:
+                if callback:
+                    trabajo._callbacks.append(callback)
+                return trabajo
+            if trabajo is None or trabajo.estado != LISTA or not os.path.exists(trabajo.ruta):
+                if self._en_curso >= self.maximo:
+                    raise ColaFacturasLlena(self._en_curso)
+                trabajo = TrabajoFactura(pedido_id, self.ruta(pedido_id), next(self._versiones))
+                if callback:
+                    trabajo._callbacks.append(callback)
+                self._trabajos[pedido_id] = trabajo
+                self._trabajos.move_to_end(pedido_id)
+                self._en_curso += 1
+                nuevo = True
+            else:
+                nuevo = False
+        if nuevo:
+            self._tareas.enviar(self._consultar, trabajo, nombre=f"factura_{pedido_id}")
+        elif callback:
+            self._avisar(callback, trabajo)
+        return trabajo
+
+    def estado(self, pedido_id):
+        """Trabajo de la factura del pedido, o None si no se pidió"""
+        with self._lock:
+            return self._trabajos.get(pedido_id)
+
+    @property
+    def en_curso(self):
+        """Facturas pendientes o armándose"""
+        return self._en_curso
+
+    def descartar(self, pedido_id):
+        """Olvida la factura del pedido (por ejemplo, porque el pedido se editó).
+
+        Un trabajo en curso sigue hasta terminar, pero su PDF no reemplaza la
+        factura y sus callbacks reciben un error.
+        """
+        with self._lock:
+            trabajo = self._trabajos.pop(pedido_id, None)
+            if trabajo is not None:
+                trabajo.descartado = True
+
+    def _consultar(self, tarea, trabajo):
+        try:
+            if trabajo.descartado:
+                self._terminar(trabajo, DESCARTADA)
+                return
+            datos = self._obtener_datos(trabajo.pedido_id)
+            if not datos:
+                self._terminar(trabajo, "Pedido no encontrado")
+                return
+            trabajo.estado = RENDERIZANDO
+            future = self._tareas.enviar_proceso(renderizar_factura, datos, trabajo.ruta_parcial)
+        except Exception as e:
+            self._terminar(trabajo, f"Error al generar factura: {e}")
+            return
+        future.add_done_callback(lambda f: self._publicar(trabajo, f))
+
+    def _publicar(self, trabajo, future):
+        """Mueve el PDF terminado a la ruta de la factura, salvo que el trabajo se haya descartado"""
+        error = None
+        try:
+            if future.exception() is not None:
+                error = f"Error al generar factura: {future.exception()}"
+            else:
+                with self._lock:
+                    vigente = not trabajo.descartado
+                    if vigente:
+                        os.replace(trabajo.ruta_parcial, trabajo.ruta)
+                if not vigente:
+                    os.remove(trabajo.ruta_parcial)
+                    error = DESCARTADA
+        except OSError as e:
+            error = f"Error al generar factura: {e}"
+        self._terminar(trabajo, error)
+
+    def _terminar(self, trabajo, error):
+        with self._lock:
+            trabajo.estado = ERROR if error else LISTA
+            trabajo.error = error
+            trabajo.terminado = time.monotonic()
+            callbacks, trabajo._callbacks = trabajo._callbacks, []
+            self._en_curso -= 1
+            # Los trabajos terminados más viejos se olvidan; el archivo queda en disco
+            terminados = [i for i, t in self._trabajos.items() if not t.en_curso]
+            for pedido_id in terminados[:max(0, len(terminados) - self._historial)]:
+                del self._trabajos[pedido_id]
+        for callback in callbacks:
+            self._avisar(callback, trabajo)
+
+    def _avisar(self, callback, trabajo):
+        try:
+            callback(trabajo)
+        except Exception as e:
+            print(f"Error al avisar la factura del pedido {trabajo.pedido_id}: {e}")
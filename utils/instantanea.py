@@ -0,0 +1,115 @@
+"""Instantánea del catálogo en disco, para arrancar sin esperar a la base.
+
+Guarda los registros Producto y el índice de búsqueda ya armado en un archivo
+JSON, junto con una firma del contenido: cantidad de productos, id máximo,
+stock total, suma de precios en centavos y la suma de un CRC32 de cada fila
+(id, nombre, precio, costo, stock y código). Al arrancar, la firma se compara
+con la misma cuenta hecha en la base (una sola fila de agregados, ver
+sql_firma()) para saber si la instantánea sigue vigente; el CRC32 detecta también
+un cambio de nombre, de costo o de código, o dos cambios de precio que se
+compensan.
+
+El archivo se escribe en uno temporal y se reemplaza de una vez, así un corte a
+mitad de la escritura nunca deja una instantánea a medias. Es JSON y no pickle:
+leer un archivo modificado puede dar un catálogo incorrecto (que la firma
+detecta), pero nunca ejecutar código. Se crea con permisos solo para el usuario.
+"""
+
+import json
+import os
+import sys
+import zlib
+
+from utils.busqueda import IndiceBusqueda
+
+# Cambia cuando cambian Producto, IndiceBusqueda o la firma; una instantánea de otro formato se descarta
+FORMATO = 4
+
+
+# La misma firma calculada en la base, por motor. El texto de cada fila tiene que
+# ser idéntico al de texto_fila(); en SQLite, CRC32 lo registra BackendSQLite
+_CENTAVOS = {"mysql": "CAST(ROUND({columna} * 100) AS SIGNED)", "sqlite": "CAST(ROUND({columna} * 100) AS INTEGER)"}
+_TEXTO_FILA = {
+    "mysql": "CONCAT_WS('|', id, nombre, {precio}, {costo}, stock, COALESCE(codigo, ''))",
+    "sqlite": "id || '|' || nombre || '|' || {precio} || '|' || {costo} || '|' || stock || '|' || COALESCE(codigo, '')"
+}
+
+
+def sql_firma(dialecto):
+    """Consulta de una sola fila con la firma de la tabla productos"""
+    texto = _TEXTO_FILA[dialecto].format(
+        precio=_CENTAVOS[dialecto].format(columna="precio_venta"),
+        costo=_CENTAVOS[dialecto].format(columna="costo")
+    )
+    return (f"SELECT COUNT(*), COALESCE(MAX(id), 0), COALESCE(SUM(stock), 0), "
+            f"COALESCE(SUM({_CENTAVOS[dialecto].format(columna='precio_venta')}), 0), "
+            f"COALESCE(SUM(CRC32({texto})), 0) FROM productos")
+
+
+def texto_fila(producto):
+    """Texto de la fila que se resume con CRC32; el mismo que arma sql_firma()"""
+    return (f"{producto.id}|{producto.nombre}|{producto.precio_centavos}|"
+            f"{producto.costo_centavos}|{producto.stock}|{producto.codigo or ''}")
+
+
+def crc32(texto):
+    return zlib.crc32(texto.encode("utf-8"))
+
+
+def firma_productos(productos):
+    """(cantidad, id máximo, stock total, precios en centavos, suma de CRC32) de los registros.
+
+    La suma no depende del orden de las filas.
+    """
+    return (
+        len(productos),
+        max((p.id for p in productos), default=0),
+        sum(p.stock for p in productos),
+        sum(p.precio_centavos for p in productos),
+        sum(crc32(texto_fila(p)) for p in productos)
+    )
+
+
+def serializar(productos, indice):
+    """Arma el contenido del archivo; se llama con el catálogo bloqueado"""
+    return json.dumps({
+        "formato": FORMATO,
+        "firma": firma_productos(productos),
+        "productos": [[p.id, p.nombre, p.precio_centavos, p.costo_centavos, p.stock, p.codigo]
+                      for p in productos],
+        "indice": indice.a_datos()
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def escribir(ruta, datos):
+    """Reemplaza el archivo de forma atómica; solo el usuario puede leerlo o escribirlo"""
+    temporal = f"{ruta}.tmp"
+    descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "wb") as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+
+
+def _producto(fila):
+    # Import diferido: utils.catalogo importa este módulo
+    from utils.catalogo import Producto
+    id, nombre, precio_centavos, costo_centavos, stock, codigo = fila
+    return Producto(int(id), sys.intern(str(nombre)), int(precio_centavos), int(costo_centavos),
+                    int(stock), str(codigo) if codigo else None)
+
+
+def leer(ruta):
+    """Devuelve (firma, productos, índice), o None si no hay instantánea utilizable"""
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, "rb") as archivo:
+            contenido = json.loads(archivo.read().decode("utf-8"))
+        if not isinstance(contenido, dict) or contenido.get("formato") != FORMATO:
+            return None
+        productos = [_producto(fila) for fila in contenido["productos"]]
+        indice = IndiceBusqueda.desde_datos(contenido["indice"])
+        return tuple(int(valor) for valor in contenido["firma"]), productos, indice
+    except Exception as e:
+        print(f"No se pudo leer la instantánea del catálogo ({ruta}): {e}")
+        return None
@@ -0,0 +1,164 @@
+"""Lista virtual de filas sobre un ft.ListView.
+
+Solo existen los controles de las filas visibles más unas pocas de margen
+(overscan) arriba y abajo; el resto del recorrido lo ocupan dos espaciadores
+con el alto de las filas que faltan, así la barra de desplazamiento se comporta
+como si la lista estuviera completa. Al desplazarse se reutilizan las filas que
+siguen en la ventana y solo se construyen las que entran. Los avisos de stock
+llegan desde el hilo de otra sesión, así que la ventana se cambia bajo un lock.
+
+CacheFilas guarda las filas ya construidas por id para reutilizarlas entre
+búsquedas: una fila se reconstruye solo si cambió algún dato que altera su
+dibujo, y los datos menores (como el stock exacto) se corrigen en el lugar.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import flet as ft
+
+
+class ListaVirtual:
+    """Muestra una lista larga de elementos con una cantidad acotada de controles.
+
+    construir_fila(elemento) devuelve el control de una fila; todas las filas
+    deben medir alto_fila (incluidos sus márgenes). 'presupuesto' es la cantidad
+    máxima de filas que pueden existir a la vez.
+    """
+
+    def __init__(self, lista, construir_fila, alto_fila, overscan=5, presupuesto=60):
+        self.lista = lista
+        self._construir_fila = construir_fila
+        self.alto_fila = alto_fila
+        self.overscan = overscan
+        self.presupuesto = presupuesto
+        self._elementos = []
+        self._filas = {}          # índice -> control, solo para la ventana actual
+        self._ventana = (0, 0)
+        self._desplazamiento = 0  # último desplazamiento informado por la lista
+        self._alto_visible = None
+        self._arriba = ft.Container(height=0, visible=False)
+        self._abajo = ft.Container(height=0, visible=False)
+        # mostrar() y _on_scroll() corren en la sesión; actualizar(), en el hilo que publica el aviso
+        self._lock = threading.RLock()
+
+        # La lista se desplaza solo por el usuario; auto_scroll saltaría al espaciador final
+        lista.auto_scroll = False
+        lista.on_scroll = self._on_scroll
+        lista.scroll_interval = 50
+
+    @property
+    def _paso(self):
+        return self.alto_fila + (self.lista.spacing or 0)
+
+    def __len__(self):
+        return len(self._elementos)
+
+    def _filas_visibles(self):
+        alto = self._alto_visible or self.lista.height or 300
+        return math.ceil(alto / self._paso)
+
+    def _calcular_ventana(self):
+        total = len(self._elementos)
+        visibles = self._filas_visibles()
+        primera = min(int(self._desplazamiento // self._paso), max(0, total - visibles))
+        inicio = max(0, primera - self.overscan)
+        fin = min(total, primera + visibles + self.overscan, inicio + self.presupuesto)
+        return inicio, fin
+
+    def mostrar(self, elementos, alto_fila=None):
+        """Reemplaza los elementos de la lista (no llama a update)"""
+        with self._lock:
+            self._elementos = list(elementos)
+            if alto_fila:
+                self.alto_fila = alto_fila
+            self._filas = {}
+            self._dibujar(*self._calcular_ventana())
+
+    def _dibujar(self, inicio, fin):
+        """Arma la ventana [inicio, fin); se llama con el lock tomado"""
+        espacio = self.lista.spacing or 0
+        filas = {}
+        for i in range(inicio, fin):
+            fila = self._filas.get(i)
+            filas[i] = fila if fila is not None else self._construir_fila(self._elementos[i])
+        self._filas = filas
+        self._ventana = (inicio, fin)
+
+        # Los espaciadores ocultos no ocupan lugar ni suman el espaciado de la lista
+        restantes = len(self._elementos) - fin
+        self._arriba.visible = inicio > 0
+        self._arriba.height = max(0, inicio * self._paso - espacio)
+        self._abajo.visible = restantes > 0
+        self._abajo.height = max(0, restantes * self._paso - espacio)
+        self.lista.controls = [self._arriba] + [filas[i] for i in range(inicio, fin)] + [self._abajo]
+
+    def actualizar(self, ids):
+        """Vuelve a pedir las filas visibles de los elementos con esos ids (no llama a update).
+
+        Devuelve True si alguna fila de la ventana cambió.
+        """
+        with self._lock:
+            inicio = self._ventana[0]
+            cambiadas = False
+            for i, fila in self._filas.items():
+                elemento = self._elementos[i]
+                if elemento["id"] not in ids:
+                    continue
+                nueva = self._construir_fila(elemento)
+                if nueva is not fila:
+                    self._filas[i] = nueva
+                    # controls[0] es el espaciador de arriba
+                    self.lista.controls[i - inicio + 1] = nueva
+                cambiadas = True
+            return cambiadas
+
+    def _on_scroll(self, e):
+        with self._lock:
+            self._desplazamiento = e.pixels
+            self._alto_visible = e.viewport_dimension or self._alto_visible
+            ventana = self._calcular_ventana()
+            if ventana == self._ventana:
+                return
+            self._dibujar(*ventana)
+        self.lista.update()
+
+
+class CacheFilas:
+    """Filas construidas por id de elemento, con capacidad acotada (se descartan las menos usadas).
+
+    clave(elemento) resume los datos que cambian el dibujo; si coincide con la
+    de la fila guardada, se reutiliza y actualizar(fila, elemento) corrige el resto.
+    """
+
+    def __init__(self, construir, clave, actualizar=None, capacidad=500):
+        self._construir = construir
+        self._clave = clave
+        self._actualizar = actualizar
+        self.capacidad = capacidad
+        self._filas = OrderedDict()   # id -> (clave, fila)
+        self.construidas = 0
+        self.reutilizadas = 0
+
+    def obtener(self, elemento):
+        """Devuelve la fila del elemento, reutilizándola si sigue vigente"""
+        clave = self._clave(elemento)
+        guardada = self._filas.get(elemento["id"])
+        if guardada is not None and guardada[0] == clave:
+            fila = guardada[1]
+            if self._actualizar is not None:
+                self._actualizar(fila, elemento)
+            self._filas.move_to_end(elemento["id"])
+            self.reutilizadas += 1
+            return fila
+        fila = self._construir(elemento)
+        self._filas[elemento["id"]] = (clave, fila)
+        self._filas.move_to_end(elemento["id"])
+        if len(self._filas) > self.capacidad:
+            self._filas.popitem(last=False)
+        self.construidas += 1
+        return fila
+
+    def limpiar(self):
+        self._filas.clear()
@@ -0,0 +1,129 @@
+"""Ejecución en segundo plano para los manejadores de eventos de Flet.
+
+Los manejadores no deben bloquear la sesión: el trabajo de E/S (consultas,
+archivos) va a un pool de hilos y el trabajo de CPU (gráficos, modelos) a un
+pool de procesos. El resultado vuelve por callbacks, que pueden actualizar la
+página directamente.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, CancelledError
+from concurrent.futures import TimeoutError as EsperaAgotada
+
+
+class TareaCancelada(Exception):
+    """La tarea fue cancelada por el usuario"""
+
+
+class Tarea:
+    """Tarea en curso: permite informar progreso, consultar el estado y cancelarla"""
+
+    def __init__(self, nombre, on_progreso=None):
+        self.nombre = nombre
+        self.estado = "pendiente"
+        self.future = None
+        self._on_progreso = on_progreso
+        self._cancelada = threading.Event()
+
+    @property
+    def cancelada(self):
+        return self._cancelada.is_set()
+
+    def cancelar(self):
+        """Pide la cancelación; si la tarea aún no empezó, no llega a ejecutarse"""
+        self._cancelada.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def verificar(self):
+        """Lanza TareaCancelada si se pidió cancelar la tarea"""
+        if self.cancelada:
+            raise TareaCancelada(self.nombre)
+
+    def reportar(self, fraccion, mensaje=""):
+        """Informa el avance (0 a 1) y corta la tarea si fue cancelada"""
+        self.verificar()
+        if self._on_progreso:
+            try:
+                self._on_progreso(fraccion, mensaje)
+            except Exception as e:
+                print(f"Error al informar progreso de {self.nombre}: {e}")
+
+
+class EjecutorTareas:
+    """Pools compartidos de hilos (E/S) y procesos (CPU) del proceso"""
+
+    def __init__(self, hilos=8, procesos=None):
+        self._hilos = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="distri-tarea")
+        self._max_procesos = procesos or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self._procesos = None
+        self._lock = threading.Lock()
+
+    def _pool_procesos(self):
+        with self._lock:
+            if self._procesos is None:
+                # spawn y no fork: el proceso tiene muchos hilos (Flet, bandeja, temporizadores) y
+                # un hijo creado con fork podría heredar un lock tomado por alguno de ellos
+                self._procesos = ProcessPoolExecutor(max_workers=self._max_procesos,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._procesos
+
+    def enviar(self, funcion, *args, nombre=None, on_resultado=None, on_error=None,
+               on_progreso=None, **kwargs):
+        """Ejecuta funcion(tarea, *args, **kwargs) en el pool de hilos y devuelve la Tarea.
+
+        on_resultado(resultado) y on_error(excepcion) se llaman desde el hilo de
+        la tarea; si la tarea se cancela no se llama a ninguno de los dos.
+        """
+        tarea = Tarea(nombre or getattr(funcion, "__name__", "tarea"), on_progreso)
+
+        def ejecutar():
+            if tarea.cancelada:
+                return
+            tarea.estado = "ejecutando"
+            try:
+                resultado = funcion(tarea, *args, **kwargs)
+                tarea.verificar()
+            except (TareaCancelada, CancelledError):
+                tarea.estado = "cancelada"
+                return
+            except Exception as e:
+                tarea.estado = "error"
+                if on_error:
+                    on_error(e)
+                else:
+                    print(f"Error en la tarea {tarea.nombre}: {e}")
+                return
+            tarea.estado = "terminada"
+            if on_resultado:
+                on_resultado(resultado)
+
+        tarea.future = self._hilos.submit(ejecutar)
+        return tarea
+
+    def en_proceso(self, funcion, *args, tarea=None):
+        """Ejecuta funcion(*args) en el pool de procesos y espera el resultado.
+
+        Pensado para llamarse desde una tarea de E/S; si se pasa la tarea, la
+        espera se corta cuando se cancela.
+        """
+        future = self._pool_procesos().submit(funcion, *args)
+        while True:
+            try:
+                return future.result(timeout=0.2)
+            except EsperaAgotada:
+                if tarea is not None and tarea.cancelada:
+                    future.cancel()
+                    raise TareaCancelada(tarea.nombre)
+
+    def enviar_proceso(self, funcion, *args):
+        """Envía funcion(*args) al pool de procesos y devuelve el Future, sin esperar"""
+        return self._pool_procesos().submit(funcion, *args)
+
+    def cerrar(self):
+        """Detiene los pools (las tareas en curso terminan)"""
+        self._hilos.shutdown(wait=False)
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=False)